@@ -1,64 +1,262 @@
+import time
+_import_started = time.perf_counter()
+
 from http import HTTPStatus
+import json
 import os
-from flask import Flask, render_template, request, jsonify
-from llm_api import get_groq_response
-from validators import validate_input, validate_session_id, validate_update_data
-from config import DEBUG
+from datetime import date
+from flask import Blueprint, Flask, Response, g, render_template, request, jsonify, stream_with_context
+from llm_api import get_groq_response, stream_groq_response
+from validators import validate_chat_request, validate_session_id, validate_update_data, validate_history_params, validate_leads_query, validate_export_query, validate_idempotency_key, validate_bulk_update, validate_stats_query
+from config import (
+    DEBUG, METRICS_ENABLED, LEADS_STREAM_HEARTBEAT, LEADS_STREAM_MAX_LIFETIME, LEADS_STREAM_WSGI_ENABLED,
+    export_format, get_db_name,
+)
+from db import close_pool, reset_pool_after_fork
 from flask_cors import CORS 
 from flask_swagger_ui import get_swaggerui_blueprint
 from history import get_history
-from leads import get_all_leads
-from leads_update import update_lead
-app = Flask(__name__)
-CORS(app)
+from leads import get_all_leads, get_lead_stats, iter_leads_export
+from leads_update import update_lead, update_leads
+from lead_feed import LeadFeedFullError, lead_feed
+from conversation_processor.extraction_queue import extraction_queue
+from conversation_processor.info_prefilter import prefilter_stats
+from llm_registry import llm_registry
+from response_cache import response_cache
+from history_buffer import history_buffer
+from history_cache import history_cache
+from llm_scheduler import LLMBusyError, check_admission, llm_scheduler
+from session_guard import SessionBusyError, IdempotencyKeyReusedError, advisory_locks
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE, metrics_registry, http_requests_in_flight, record_request, current_route,
+    extraction_queue_depth, extraction_jobs_in_flight,
+)
 
 # Swagger UI setup
 SWAGGER_URL = '/docs'  # URL for exposing Swagger UI
 API_URL = '/static/swagger.yaml'  # Path to your swagger file
 
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={
-        'app_name': "Chat API"
-    }
-)
+api = Blueprint("api", __name__)
+
+def create_app(start_workers=True):
+    """
+    Build the Flask app. Nothing here touches the network or the schema:
+    the DB name is resolved once from env or its cached value, the pool
+    connects on first use, and migrations run separately (`python migrate.py`).
+
+    Pass start_workers=False when the app is preloaded by a forking server;
+    each worker process then calls init_worker() after the fork.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    CORS(app)
+
+    swaggerui_blueprint = get_swaggerui_blueprint(
+        SWAGGER_URL,
+        API_URL,
+        config={
+            'app_name': "Chat API"
+        }
+    )
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+    app.register_blueprint(api)
+    if METRICS_ENABLED:
+        _instrument(app)
+
+    get_db_name()
+    # Build the LLM clients and chains once, before the first request
+    llm_registry.warm_up()
+    # Long-lived background workers for contact-info extraction (drained on shutdown)
+    if start_workers:
+        extraction_queue.start()
+
+    now = time.perf_counter()
+    print(f"[STARTUP] App ready in {(now - started) * 1000:.0f} ms "
+          f"({(now - _import_started) * 1000:.0f} ms including imports)")
+    return app
+
+def _instrument(app):
+    """Per-route latency, in-flight and error metrics for every Flask request."""
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule else "unmatched"
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_in_flight = True
+        # Left set after the request: a streamed body still runs under it, and the next
+        # request on this thread overwrites it (background threads keep "background")
+        current_route.set(route_label())
+        http_requests_in_flight.inc(route=route_label())
+
+    @app.after_request
+    def record_latency(response):
+        # Streaming responses are timed up to the first byte
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            record_request(route_label(), request.method, response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        # Teardown can run twice for stream_with_context responses
+        if g.pop("metrics_in_flight", False):
+            http_requests_in_flight.dec(route=route_label())
+
+    metrics_registry.add_collector(_collect_queue_stats)
 
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+def _collect_queue_stats():
+    stats = extraction_queue.stats()
+    extraction_queue_depth.set(stats["depth"])
+    extraction_jobs_in_flight.set(stats["in_flight"])
+
+def init_worker():
+    """
+    Set up per-process state in a server worker after fork: a fresh DB pool,
+    fresh LLM HTTP clients, its own advisory lock connection and this
+    worker's extraction threads.
+    """
+    reset_pool_after_fork()
+    llm_registry.reset_after_fork()
+    advisory_locks.reset_after_fork()
+    extraction_queue.start()
+
+def shutdown_worker():
+    """Drain pending extraction jobs and release connections before a worker exits."""
+    extraction_queue.shutdown()
+    history_buffer.close()
+    lead_feed.close()
+    advisory_locks.close()
+    llm_registry.close()
+    close_pool()
 
 #render HTML frontend
-@app.route('/')
+@api.route('/')
 def chat():
     return render_template('chat.html')
 
-@app.route("/health", methods=["GET"])
+@api.route("/health", methods=["GET"])
 def hello():
-    return jsonify({"message": "Hello World"})
+    return jsonify({
+        "message": "Hello World",
+        "extraction": extraction_queue.stats(),
+        "prefilter": prefilter_stats.snapshot(),
+        "response_cache": response_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "history_write": history_buffer.stats(),
+        "history_cache": history_cache.stats(),
+        "lead_feed": lead_feed.stats()
+    })
 
-# History API to load previous messages while loading the page
-@app.route("/history", methods=["GET"])
+# Prometheus scrape endpoint (per process)
+@api.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), HTTPStatus.NOT_FOUND
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# History API to load previous messages while loading the page.
+# Optional cursor pagination: limit, before=<id> (older page), after=<id> (newer page), since=<id> (sync new messages)
+@api.route("/history", methods=["GET"])
 def history_endpoint():
     session_id = request.args.get("session_id")
     # Validate
     result = validate_session_id(session_id)
     if not result["is_valid"]:
         return jsonify({"error": result["message"]}), result["status"]
+    params = validate_history_params(request.args)
+    if not params["is_valid"]:
+        return jsonify({"error": params["message"]}), params["status"]
     # Continue if valid
-    history_data, status = get_history(session_id)
+    history_data, status = get_history(session_id, **params["message"])
     return jsonify(history_data), status
 
-@app.route('/leads', methods=['GET'])
+# Keyset-paginated leads, newest first. Filters: status, request_type, country,
+# created_from/created_to (ISO dates) and has_contact; pass next_cursor back as cursor for the next page.
+@api.route('/leads', methods=['GET'])
 def get_leads():
+    result = validate_leads_query(request.args)
+    if not result["is_valid"]:
+        return jsonify({"error": result["message"]}), result["status"]
+    params = result["message"]
     try:
-        leads_data, status = get_all_leads()
-        return jsonify({"leads":leads_data}), status
+        leads_data, status = get_all_leads(params["filters"], limit=params["limit"], cursor=params["cursor"])
+        return jsonify(leads_data), status
+    except ValueError as e:
+        return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
     except Exception as e:
         print(f"Error in get_leads endpoint: {e}")
         return jsonify({
             "error": "Unable to fetch chat info. Please try again later."
         }), HTTPStatus.INTERNAL_SERVER_ERROR
 
-@app.route('/chat-info', methods=['PATCH'])
+# Lead counts and conversion rates per day, week or month (?bucket=), optionally broken
+# down by status, request_type or country (?group_by=). Takes the /leads filters.
+@api.route('/leads/stats', methods=['GET'])
+def lead_stats():
+    result = validate_stats_query(request.args)
+    if not result["is_valid"]:
+        return jsonify({"error": result["message"]}), result["status"]
+    params = result["message"]
+    try:
+        stats, status = get_lead_stats(params["filters"], bucket=params["bucket"], group_by=params["group_by"])
+        return jsonify(stats), status
+    except Exception as e:
+        print(f"Error in lead_stats endpoint: {e}")
+        return jsonify({
+            "error": "Unable to fetch lead stats. Please try again later."
+        }), HTTPStatus.INTERNAL_SERVER_ERROR
+
+# Streams every lead matching the /leads filters as a CSV or NDJSON download (?format=csv|ndjson)
+@api.route('/leads/export', methods=['GET'])
+def export_leads():
+    result = validate_export_query(request.args)
+    if not result["is_valid"]:
+        return jsonify({"error": result["message"]}), result["status"]
+    params = result["message"]
+
+    is_csv = params["format"] == export_format.CSV
+    filename = f"leads-{date.today().isoformat()}.{params['format']}"
+    return Response(
+        stream_with_context(iter_leads_export(params["filters"], params["format"])),
+        mimetype="text/csv" if is_csv else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# Live lead changes as Server-Sent Events, one shared LISTEN connection per worker.
+# Events: "lead" (a changed row, same fields as /leads) and "reset" (changes may have
+# been missed; reload /leads). Comment lines keep idle connections open. The stream
+# ends after LEADS_STREAM_MAX_LIFETIME seconds and EventSource reconnects by itself.
+# asgi.py serves this route natively; here every client would hold a worker thread.
+@api.route('/leads/stream', methods=['GET'])
+def stream_leads():
+    if not LEADS_STREAM_WSGI_ENABLED:
+        return jsonify({
+            'success': False,
+            'error': "The live lead feed is only served by the async app."}), HTTPStatus.SERVICE_UNAVAILABLE
+    try:
+        subscription = lead_feed.subscribe()
+    except LeadFeedFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), HTTPStatus.SERVICE_UNAVAILABLE
+
+    def generate():
+        deadline = time.monotonic() + LEADS_STREAM_MAX_LIFETIME
+        try:
+            yield ": connected\n\n"
+            while time.monotonic() < deadline:
+                item = subscription.get(timeout=min(LEADS_STREAM_HEARTBEAT, max(deadline - time.monotonic(), 0)))
+                yield ": keepalive\n\n" if item is None else _sse_event(*item)
+        finally:
+            lead_feed.unsubscribe(subscription)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api.route('/chat-info', methods=['PATCH'])
 def patch_updates():
     try:
         update_data = request.get_json()
@@ -78,35 +276,133 @@ def patch_updates():
             "error": f"Unable to update lead. Please try again later. ({str(e)})"
         }), HTTPStatus.INTERNAL_SERVER_ERROR
 
+# Updates many leads in one transaction: {"updates": [{session_id, status, remarks}, ...]}.
+# Every item gets a result; invalid items are skipped and reported (207 when some failed).
+@api.route('/chat-info/bulk', methods=['PATCH'])
+def patch_updates_bulk():
+    result = validate_bulk_update(request.get_json(silent=True))
+    if not result["is_valid"]:
+        return jsonify({"success": False, "error": result["message"]}), result["status"]
+    valid, errors = result["message"]["updates"], result["message"]["errors"]
+    try:
+        applied = update_leads([item for _, item in valid]) if valid else {}
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Unable to update leads. Please try again later. ({str(e)})"
+        }), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    results = [
+        {"index": index, "session_id": item["session_id"], "success": True, "result": applied[item["session_id"]]}
+        for index, item in valid
+    ]
+    results += [{"index": index, "success": False, "error": error} for index, error in errors.items()]
+    results.sort(key=lambda item: item["index"])
+
+    if not errors:
+        status = HTTPStatus.OK
+    else:
+        status = HTTPStatus.MULTI_STATUS if valid else HTTPStatus.BAD_REQUEST
+    return jsonify({
+        "success": not errors,
+        "updated": len(valid),
+        "failed": len(errors),
+        "results": results
+    }), status
+
 #Rendering response
 # chat_api is a Flask route function defined that acts as the backend API endpoint for chat exchanges. It is the API endpoint your frontend calls to send user messages and receive chatbot responses.
 # It receives a JSON request containing the user's chat input from the frontend, validates the input, sends the validated input to the LLM, and returns a JSON response.
 
-@app.route('/chat', methods=['POST'])
+@api.route('/chat', methods=['POST'])
 def chat_api():
     data = request.get_json()
     input = data.get('input', '')
     session_id = data.get('session_id')
-    request_type = data.get('request_type')
     # Input Validation
-
-    result = validate_input(input, request_type)
-
+    result = validate_chat_request(data)
     if not result["is_valid"]:
-        return jsonify({'success': False, 'error': result["message"]}), HTTPStatus.BAD_REQUEST
-    request_type = result["message"] 
+        return jsonify({'success': False, 'error': result["message"]}), result["status"]
+    request_type = result["message"]
+    key_result = validate_idempotency_key(_idempotency_key(data))
+    if not key_result["is_valid"]:
+        return jsonify({'success': False, 'error': key_result["message"]}), key_result["status"]
 
     # Get response from LLM
     try:
-        bot_response = get_groq_response(input.strip(), session_id, request_type)
+        check_admission()
+        bot_response = get_groq_response(input.strip(), session_id, request_type, key_result["message"])
         return jsonify({'success': True, 'response': bot_response})
+    except LLMBusyError as e:
+        return _busy_response(e)
+    except SessionBusyError as e:
+        return jsonify({'success': False, 'error': str(e)}), HTTPStatus.CONFLICT
+    except IdempotencyKeyReusedError as e:
+        return jsonify({'success': False, 'error': str(e)}), HTTPStatus.UNPROCESSABLE_ENTITY
     except Exception as e:
         print(f"Error during LLM call: {e}")
         return jsonify({
             'success': False,
             'error': "Sorry, something went wrong while processing your message. Please try again later."}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+def _idempotency_key(data):
+    """Idempotency-Key header, or the idempotency_key field of the JSON body."""
+    return request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+
+def _busy_response(error):
+    """503 for a chat turn the LLM scheduler could not admit."""
+    response = jsonify({'success': False, 'busy': True, 'error': str(error)})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, HTTPStatus.SERVICE_UNAVAILABLE
+
+def _sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /chat: sends the reply token by token as Server-Sent Events.
+# Events: "token" ({"token": "..."}), then "done" ({"success": true}) or "error".
+@api.route('/chat/stream', methods=['POST'])
+def chat_stream_api():
+    data = request.get_json(silent=True) or {}
+    input = data.get('input', '')
+    session_id = data.get('session_id')
+
+    # Validate before the stream starts; once it has started the status is already 200
+    result = validate_chat_request(data)
+    if not result["is_valid"]:
+        return jsonify({'success': False, 'error': result["message"]}), result["status"]
+    request_type = result["message"]
+    key_result = validate_idempotency_key(_idempotency_key(data))
+    if not key_result["is_valid"]:
+        return jsonify({'success': False, 'error': key_result["message"]}), key_result["status"]
+    # Answer "busy" with a real status code while we still can
+    try:
+        check_admission()
+    except LLMBusyError as e:
+        return _busy_response(e)
+
+    def generate():
+        try:
+            for token in stream_groq_response(input.strip(), session_id, request_type, key_result["message"]):
+                yield _sse_event("token", {"token": token})
+            yield _sse_event("done", {"success": True})
+        except (LLMBusyError, SessionBusyError) as e:
+            yield _sse_event("error", {"success": False, "busy": True, "error": str(e)})
+        except IdempotencyKeyReusedError as e:
+            yield _sse_event("error", {"success": False, "error": str(e)})
+        except Exception as e:
+            print(f"Error during LLM stream: {e}")
+            yield _sse_event("error", {
+                "success": False,
+                "error": "Sorry, something went wrong while processing your message. Please try again later."})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == '__main__':
-    app.run(debug=DEBUG,port=5000)
+    create_app().run(debug=DEBUG,port=5000)
 
 
@@ -0,0 +1,189 @@
+# Async entry point: `uvicorn asgi:app` (or gunicorn with GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker).
+# /chat, /chat/stream and /leads/stream are served natively on the event loop, so a
+# worker holds no thread while waiting on the LLM or an open lead feed; every other
+# route is the Flask app.
+import asyncio
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+import time
+from functools import wraps
+from app import create_app, _sse_event
+from config import METRICS_ENABLED, LEADS_STREAM_HEARTBEAT, LEADS_STREAM_MAX_LIFETIME
+from metrics import current_route, http_requests_in_flight, record_request
+from db import close_async_pool, close_pool
+from llm_api import aget_groq_response, astream_groq_response
+from llm_registry import llm_registry
+from history_buffer import history_buffer
+from conversation_processor.extraction_queue import extraction_queue
+from lead_feed import LeadFeedFullError, lead_feed
+from llm_scheduler import LLMBusyError, check_admission
+from validators import validate_chat_request, validate_idempotency_key
+from session_guard import SessionBusyError, IdempotencyKeyReusedError, advisory_locks
+
+
+def _timed(route):
+    """Route latency, in-flight and error metrics for an async route (Flask routes have their own)."""
+    def decorator(handler):
+        if not METRICS_ENABLED:
+            return handler
+
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            current_route.set(route)
+            http_requests_in_flight.inc(route=route)
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                http_requests_in_flight.dec(route=route)
+                record_request(route, request.method, int(status), time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def _busy_response(error):
+    return JSONResponse({'success': False, 'busy': True, 'error': str(error)},
+                        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                        headers={"Retry-After": str(error.retry_after)})
+
+def _idempotency_key(request, data):
+    return request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+
+async def _read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+@_timed('/chat')
+async def chat_api(request):
+    data = await _read_json(request)
+    input = data.get('input', '')
+    session_id = data.get('session_id')
+
+    result = validate_chat_request(data)
+    if not result["is_valid"]:
+        return JSONResponse({'success': False, 'error': result["message"]}, status_code=result["status"])
+    request_type = result["message"]
+    key_result = validate_idempotency_key(_idempotency_key(request, data))
+    if not key_result["is_valid"]:
+        return JSONResponse({'success': False, 'error': key_result["message"]}, status_code=key_result["status"])
+
+    try:
+        check_admission()
+        bot_response = await aget_groq_response(input.strip(), session_id, request_type, key_result["message"])
+        return JSONResponse({'success': True, 'response': bot_response})
+    except LLMBusyError as e:
+        return _busy_response(e)
+    except SessionBusyError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=HTTPStatus.CONFLICT)
+    except IdempotencyKeyReusedError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+    except Exception as e:
+        print(f"Error during LLM call: {e}")
+        return JSONResponse({
+            'success': False,
+            'error': "Sorry, something went wrong while processing your message. Please try again later."},
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+@_timed('/chat/stream')
+async def chat_stream_api(request):
+    data = await _read_json(request)
+    input = data.get('input', '')
+    session_id = data.get('session_id')
+
+    result = validate_chat_request(data)
+    if not result["is_valid"]:
+        return JSONResponse({'success': False, 'error': result["message"]}, status_code=result["status"])
+    request_type = result["message"]
+    key_result = validate_idempotency_key(_idempotency_key(request, data))
+    if not key_result["is_valid"]:
+        return JSONResponse({'success': False, 'error': key_result["message"]}, status_code=key_result["status"])
+    try:
+        check_admission()
+    except LLMBusyError as e:
+        return _busy_response(e)
+
+    async def generate():
+        try:
+            async for token in astream_groq_response(input.strip(), session_id, request_type, key_result["message"]):
+                yield _sse_event("token", {"token": token})
+            yield _sse_event("done", {"success": True})
+        except (LLMBusyError, SessionBusyError) as e:
+            yield _sse_event("error", {"success": False, "busy": True, "error": str(e)})
+        except IdempotencyKeyReusedError as e:
+            yield _sse_event("error", {"success": False, "error": str(e)})
+        except Exception as e:
+            print(f"Error during LLM stream: {e}")
+            yield _sse_event("error", {
+                "success": False,
+                "error": "Sorry, something went wrong while processing your message. Please try again later."})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@_timed('/leads/stream')
+async def leads_stream_api(request):
+    try:
+        subscription = lead_feed.asubscribe()
+    except LeadFeedFullError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=HTTPStatus.SERVICE_UNAVAILABLE)
+
+    async def generate():
+        deadline = time.monotonic() + LEADS_STREAM_MAX_LIFETIME
+        try:
+            yield ": connected\n\n"
+            while time.monotonic() < deadline:
+                item = await subscription.get(min(LEADS_STREAM_HEARTBEAT, deadline - time.monotonic()))
+                yield ": keepalive\n\n" if item is None else _sse_event(*item)
+        finally:
+            lead_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Same order as shutdown_worker: drain extraction jobs before their connections go away
+    await asyncio.to_thread(extraction_queue.shutdown)
+    await asyncio.to_thread(history_buffer.close)
+    await asyncio.to_thread(lead_feed.close)
+    await asyncio.to_thread(advisory_locks.close)
+    await llm_registry.aclose()
+    await asyncio.to_thread(close_pool)
+    await close_async_pool()
+
+def create_asgi_app(start_workers=True):
+    """The Flask app wrapped in an ASGI app with async chat routes."""
+    flask_app = create_app(start_workers=start_workers)
+    return Starlette(
+        routes=[
+            Route('/chat', chat_api, methods=['POST']),
+            Route('/chat/stream', chat_stream_api, methods=['POST']),
+            Route('/leads/stream', leads_stream_api, methods=['GET']),
+            Mount('/', app=WSGIMiddleware(flask_app)),
+        ],
+        # Same open CORS policy as flask_cors on the Flask routes
+        middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+        lifespan=lifespan,
+    )
+
+
+# Extraction workers start on first use, so this also works preloaded under gunicorn
+app = create_asgi_app(start_workers=False)
@@ -0,0 +1,59 @@
+"""
+Compare two bench result files (see run_bench.py) endpoint by endpoint.
+
+    python bench/compare.py baseline.json candidate.json --max-regression 0.10
+
+Exits with status 1 when any endpoint's p95 latency grew by more than
+--max-regression (a fraction), so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(old, new):
+    if not old:
+        return None
+    return (new - old) / old
+
+def _format_change(change):
+    return "n/a" if change is None else f"{change:+.1%}"
+
+def compare(baseline, candidate, max_regression):
+    regressions = []
+    print(f"{'endpoint':<20}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>16}{'db q/req':>14}")
+    for endpoint, new in candidate["endpoints"].items():
+        old = baseline["endpoints"].get(endpoint)
+        if old is None:
+            print(f"{endpoint:<20} (new endpoint)")
+            continue
+        cells = []
+        for pct in ("p50", "p95", "p99"):
+            change = _change(old["latency_ms"][pct], new["latency_ms"][pct])
+            cells.append(f"{new['latency_ms'][pct]:>9} {_format_change(change):>8}")
+            if pct == "p95" and change is not None and change > max_regression:
+                regressions.append((endpoint, change))
+        rps = _change(old["requests_per_second"], new["requests_per_second"])
+        cells.append(f"{new['requests_per_second']:>8} {_format_change(rps):>7}")
+        cells.append(f"{old['db_queries_per_request']:>6}->{new['db_queries_per_request']:<6}")
+        print(f"{endpoint:<20}" + "".join(cells))
+
+    for endpoint, change in regressions:
+        print(f"[COMPARE] p95 regression on {endpoint}: {change:+.1%} (limit {max_regression:.0%})")
+    return not regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    with open(options.candidate) as f:
+        candidate = json.load(f)
+    sys.exit(0 if compare(baseline, candidate, options.max_regression) else 1)
@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Groq (OpenAI-compatible) chat completions API.
+
+    python bench/fake_groq.py --port 8765 --latency 0.3 --tokens-per-second 200 --failure-rate 0.01
+
+Point the app at it with GROQ_API_BASE=http://127.0.0.1:8765. Replies are
+canned text; extraction prompts (which ask for JSON) get an empty JSON object
+so the processor takes its normal path.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Thanks for reaching out! We build AI agents and chatbots for businesses. "
+    "Could you tell me a little more about what you are looking for, and share "
+    "your name and email so our team can follow up?"
+)
+EXTRACTION_REPLY = json.dumps({
+    "contact_name": "", "email": "", "mobile": "", "country": "", "name_detected": False
+})
+
+
+class FakeGroqStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "streamed": 0, "failed": 0}
+
+    def record(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def _approx_tokens(text):
+    return max(1, len(text) // 4)
+
+def _reply_for(messages):
+    last = messages[-1].get("content", "") if messages else ""
+    if isinstance(last, str) and "JSON" in last:
+        return EXTRACTION_REPLY
+    return REPLY
+
+def _split_tokens(text):
+    # Roughly one token per word, keeping the separating spaces
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+
+def make_handler(options, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(200, stats.snapshot())
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            stats.record("requests")
+
+            if random.random() < options.failure_rate:
+                stats.record("failed")
+                headers = {"retry-after": "1"} if options.failure_status == 429 else {}
+                self._send_json(options.failure_status, {"error": {"message": "injected failure"}}, headers)
+                return
+
+            # Time to first token
+            time.sleep(max(0.0, random.gauss(options.latency, options.latency * options.jitter)))
+            messages = body.get("messages", [])
+            content = _reply_for(messages)
+            usage = {
+                "prompt_tokens": sum(_approx_tokens(str(m.get("content", ""))) for m in messages),
+                "completion_tokens": _approx_tokens(content),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            model = body.get("model", "fake-model")
+
+            if body.get("stream"):
+                stats.record("streamed")
+                self._stream(model, content, usage)
+            else:
+                self._sleep_for_tokens(usage["completion_tokens"])
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+        def _sleep_for_tokens(self, tokens):
+            if options.tokens_per_second > 0:
+                time.sleep(tokens / options.tokens_per_second)
+
+        def _stream(self, model, content, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+            def send(payload):
+                self.wfile.write(f"data: {payload}\n\n".encode())
+                self.wfile.flush()
+
+            def chunk(delta, finish_reason=None, extra=None):
+                data = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                data.update(extra or {})
+                return json.dumps(data)
+
+            send(chunk({"role": "assistant", "content": ""}))
+            for token in _split_tokens(content):
+                self._sleep_for_tokens(1)
+                send(chunk({"content": token}))
+            send(chunk({}, "stop", {"x_groq": {"usage": usage}}))
+            send("[DONE]")
+            self.close_connection = True
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency std-dev as a fraction of --latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="0 = no generation delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--failure-status", type=int, default=500, help="status code of injected failures")
+    return parser.parse_args(argv)
+
+def serve(options):
+    stats = FakeGroqStats()
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(options, stats))
+    server.daemon_threads = True
+    return server, stats
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    server, _ = serve(options)
+    print(f"[FAKE_GROQ] Listening on http://{options.host}:{options.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
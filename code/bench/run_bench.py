@@ -0,0 +1,359 @@
+"""
+Offline load test: runs the app (gunicorn, threaded or async workers) against
+the fake Groq server and a local Postgres, drives concurrent multi-turn
+sessions across /history, /chat, /chat/stream, /leads and /chat-info, and
+writes per-endpoint latency percentiles, requests/s and DB queries per request
+as JSON.
+
+    cd code
+    python bench/run_bench.py --sessions 100 --concurrency 20 --output bench-results.json
+    python bench/compare.py baseline.json bench-results.json
+
+Without --database-url a throwaway Postgres cluster is started with initdb/pg_ctl
+(both must be on PATH). DB query counts come from the app's /metrics, which is
+per process, so they are exact with the default single worker.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent))
+import fake_groq  # noqa: E402
+
+CODE_DIR = Path(__file__).resolve().parent.parent
+BENCH_DB_NAME = "bench_chat_db"
+
+# What a visitor types over a session; some turns carry contact info so extraction does real work
+TURNS = [
+    ("sales", "Hi, I'm looking for a chatbot for my online store."),
+    ("sales", "What does a typical project cost and how long does it take?"),
+    ("sales", "My name is Priya Sharma, I'm based in India."),
+    ("sales", "You can reach me at priya.{n}@example.com"),
+    ("sales", "Do you also integrate with WhatsApp?"),
+    ("generic", "Can you explain what an AI agent is?"),
+    ("generic", "How is that different from a normal chatbot?"),
+    ("generic", "Thanks, that helps!"),
+]
+METRIC_ROUTES = {
+    "GET /history": "/history",
+    "POST /chat": "/chat",
+    "POST /chat/stream": "/chat/stream",
+    "GET /leads": "/leads",
+    "PATCH /chat-info": "/chat-info",
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=CODE_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+class LocalPostgres:
+    """Throwaway Postgres cluster in a temp directory."""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix="bench-pg-")
+        self.port = _free_port()
+        self.url = f"postgresql://postgres@127.0.0.1:{self.port}/"
+
+    def start(self):
+        data_dir = os.path.join(self.dir, "data")
+        subprocess.run(["initdb", "-D", data_dir, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--locale=C"],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(
+            ["pg_ctl", "-D", data_dir, "-l", os.path.join(self.dir, "postgres.log"), "-w",
+             "-o", f"-p {self.port} -k {self.dir} -c max_connections=200", "start"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        print(f"[BENCH] Started Postgres on port {self.port}")
+
+    def stop(self):
+        subprocess.run(["pg_ctl", "-D", os.path.join(self.dir, "data"), "-m", "fast", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def reset_database(database_url):
+    """Drop the bench database so every run starts from the same empty schema."""
+    with psycopg.connect(database_url + "postgres", autocommit=True) as conn:
+        conn.execute(f'DROP DATABASE IF EXISTS "{BENCH_DB_NAME}" WITH (FORCE)')
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, shared by all client threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, endpoint, duration, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(duration)
+            codes = self.statuses.setdefault(endpoint, {})
+            codes[str(status)] = codes.get(str(status), 0) + 1
+            if status == "error" or (isinstance(status, int) and status >= 500):
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class SessionDriver:
+    """One visitor: loads history, chats for a few turns, then the dashboard looks at the lead."""
+
+    def __init__(self, base_url, recorder, options):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.options = options
+
+    def _call(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.options.request_timeout, **kwargs)
+            if kwargs.get("stream"):
+                for _ in response.iter_content(chunk_size=None):
+                    pass
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, "error"
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        return response
+
+    def run(self, n):
+        self.http = requests.Session()
+        session_id = str(uuid.uuid4())
+        response = self._call("GET /history", "GET", "/history", params={"session_id": session_id, "limit": 50})
+        last_id = (response.json().get("last_id") if response is not None and response.ok else None)
+
+        start = random.randrange(len(TURNS))
+        for i in range(self.options.turns):
+            request_type, text = TURNS[(start + i) % len(TURNS)]
+            payload = {"input": text.format(n=n), "session_id": session_id, "request_type": request_type}
+            if random.random() < self.options.stream_ratio:
+                self._call("POST /chat/stream", "POST", "/chat/stream", json=payload, stream=True)
+            else:
+                self._call("POST /chat", "POST", "/chat", json=payload)
+            params = {"session_id": session_id}
+            if last_id is not None:
+                params["since"] = last_id
+            response = self._call("GET /history", "GET", "/history", params=params)
+            if response is not None and response.ok:
+                last_id = response.json().get("last_id") or last_id
+            time.sleep(self.options.think_time)
+
+        self._call("GET /leads", "GET", "/leads", params={"limit": 50})
+        self._call("PATCH /chat-info", "PATCH", "/chat-info",
+                   json={"session_id": session_id, "status": "QUALIFYING", "remarks": "bench"})
+        self.http.close()
+
+
+def scrape_db_queries(base_url):
+    """db_queries_total per route from /metrics."""
+    text = requests.get(base_url + "/metrics", timeout=10).text
+    counts = {}
+    for match in re.finditer(r'^db_queries_total\{route="([^"]*)"\} (\S+)$', text, re.MULTILINE):
+        counts[match.group(1)] = float(match.group(2))
+    return counts
+
+def wait_for_app(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App exited during startup, see the log above")
+        try:
+            if requests.get(base_url + "/health", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("App did not become healthy in time")
+
+def start_app(options, database_url, llm_url, port):
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DB_NAME=BENCH_DB_NAME,
+        GROQ_API_KEY="bench-key",
+        GROQ_API_BASE=llm_url,
+        METRICS_ENABLED="True",
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_WORKERS=str(options.workers),
+        GUNICORN_THREADS=str(options.threads),
+        GUNICORN_PIDFILE=os.path.join(tempfile.gettempdir(), f"bench-gunicorn-{port}.pid"),
+        GUNICORN_ACCESS_LOG="none",
+    )
+    subprocess.run([sys.executable, "migrate.py"], cwd=CODE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    target = "wsgi:app"
+    if options.server == "asgi":
+        env["GUNICORN_WORKER_CLASS"] = "uvicorn.workers.UvicornWorker"
+        target = "asgi:app"
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", target],
+        cwd=CODE_DIR, env=env, stdout=subprocess.DEVNULL if not options.verbose else None,
+        stderr=subprocess.DEVNULL if not options.verbose else None,
+    )
+
+def summarize(recorder, elapsed, db_before, db_after):
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        values = sorted(latencies)
+        route = METRIC_ROUTES.get(endpoint)
+        queries = db_after.get(route, 0) - db_before.get(route, 0)
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "status_codes": recorder.statuses.get(endpoint, {}),
+            "requests_per_second": round(len(values) / elapsed, 2),
+            "latency_ms": {
+                "p50": round(_percentile(values, 50) * 1000, 2),
+                "p95": round(_percentile(values, 95) * 1000, 2),
+                "p99": round(_percentile(values, 99) * 1000, 2),
+                "mean": round(sum(values) / len(values) * 1000, 2),
+                "max": round(values[-1] * 1000, 2),
+            },
+            "db_queries_per_request": round(queries / len(values), 2),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    background = db_after.get("background", 0) - db_before.get("background", 0)
+    return endpoints, {
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "requests_per_second": round(total / elapsed, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "background_db_queries": background,
+    }
+
+def run(options):
+    postgres = None
+    app = None
+    llm_server = None
+    try:
+        if options.database_url:
+            database_url = options.database_url
+        else:
+            postgres = LocalPostgres()
+            postgres.start()
+            database_url = postgres.url
+        reset_database(database_url)
+
+        llm_port = _free_port()
+        llm_options = fake_groq.parse_args([
+            "--port", str(llm_port),
+            "--latency", str(options.llm_latency),
+            "--tokens-per-second", str(options.tokens_per_second),
+            "--failure-rate", str(options.failure_rate),
+        ])
+        llm_server, llm_stats = fake_groq.serve(llm_options)
+        threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        app = start_app(options, database_url, f"http://127.0.0.1:{llm_port}", port)
+        wait_for_app(base_url, app)
+        print(f"[BENCH] App ready at {base_url} ({options.server}, {options.workers} workers)")
+
+        recorder = Recorder()
+        db_before = scrape_db_queries(base_url)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+            for future in [pool.submit(SessionDriver(base_url, recorder, options).run, n)
+                           for n in range(options.sessions)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        # Let the background extraction finish so its queries are counted
+        time.sleep(options.drain_seconds)
+        db_after = scrape_db_queries(base_url)
+
+        endpoints, totals = summarize(recorder, elapsed, db_before, db_after)
+        return {
+            "meta": {
+                "label": options.label,
+                "commit": _git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "options": {k: v for k, v in vars(options).items() if k not in ("database_url", "output")},
+            },
+            "totals": totals,
+            "endpoints": endpoints,
+            "fake_llm": llm_stats.snapshot(),
+        }
+    finally:
+        if app is not None:
+            app.terminate()
+            try:
+                app.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        if llm_server is not None:
+            llm_server.shutdown()
+        if postgres is not None:
+            postgres.stop()
+
+def print_report(results):
+    print(f"\n{'endpoint':<20}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db q/req':>10}")
+    for endpoint, stats in results["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(f"{endpoint:<20}{stats['requests']:>7}{stats['errors']:>5}{stats['requests_per_second']:>9}"
+              f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}{stats['db_queries_per_request']:>10}")
+    totals = results["totals"]
+    print(f"\n{totals['requests']} requests in {totals['elapsed_seconds']}s "
+          f"({totals['requests_per_second']} req/s), {totals['errors']} errors, "
+          f"{totals['background_db_queries']:.0f} background DB queries")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="existing Postgres base URL ending in '/', like DATABASE_URL")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=4, help="chat turns per session")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="fraction of turns sent to /chat/stream")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between turns")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--drain-seconds", type=float, default=2.0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    results = run(options)
+    print_report(results)
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Results written to {options.output}")
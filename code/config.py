@@ -2,7 +2,6 @@
 import os
 from dotenv import load_dotenv
 from enum import Enum
-import requests
 load_dotenv()
 # Flask settings
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
@@ -11,21 +10,80 @@ DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 GROQ_MODEL_NAME = os.environ.get("GROQ_MODEL_NAME", "meta-llama/llama-4-scout-17b-16e-instruct")  # default if not set
 
+# Shared keep-alive HTTP connection pool to the LLM provider
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))  # seconds
+# How often cached chains check prompt files / model name for changes (0 = only on explicit reload)
+LLM_RELOAD_CHECK_INTERVAL = float(os.getenv("LLM_RELOAD_CHECK_INTERVAL", "5"))  # seconds
+
+# Shared scheduler for all LLM calls: provider quota (0 = no limit), concurrency cap and bounded queue.
+# Chat turns have strict priority over background extraction/summaries.
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "True").lower() == "true"
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))  # requests per minute
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "0"))  # tokens per minute
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_QUEUE_MAX_WAITING = int(os.getenv("LLM_QUEUE_MAX_WAITING", "64"))
+LLM_INTERACTIVE_MAX_WAIT = float(os.getenv("LLM_INTERACTIVE_MAX_WAIT", "5"))  # seconds before /chat answers "busy"
+LLM_BACKGROUND_MAX_WAIT = float(os.getenv("LLM_BACKGROUND_MAX_WAIT", "60"))  # seconds
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "300"))  # reply size assumed when admitting
+LLM_RATE_LIMIT_BACKOFF = float(os.getenv("LLM_RATE_LIMIT_BACKOFF", "10"))  # pause after a 429 without Retry-After (chat turns: at most LLM_INTERACTIVE_MAX_WAIT)
+
+# Timeouts, retries and fallbacks for LLM calls.
+# Models in LLM_FALLBACK_MODELS are tried in order once GROQ_MODEL_NAME has failed.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per attempt
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "60"))  # seconds, no new attempt starts after this
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # per model, for timeouts/5xx/429
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per retry with full jitter
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # seconds
+LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))  # seconds before a second chat attempt is sent (0 = off)
+
+# One chat turn per session at a time. "local" serializes within a process; "postgres" also
+# takes an advisory lock so separate worker processes/hosts serialize too (the locks are held
+# on one extra connection per process, not on a pooled connection)
+SESSION_LOCK = os.getenv("SESSION_LOCK", "local")  # local | postgres | off
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "30"))  # seconds before answering 409
+# How long a reply is kept for replays of the same Idempotency-Key
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))  # seconds
+idempotency_key_max_length = 255
+
 # Chat input limits
 max_input_length = 10000
 
+# Page size limits for /history and /leads
+history_page_max_limit = 200
+leads_page_default_limit = 50
+leads_page_max_limit = 500
+# Rows fetched per round trip by the /leads/export server-side cursor
+leads_export_batch_size = 1000
+# Most leads a single PATCH /chat-info/bulk may update
+leads_bulk_max_items = 500
+
 # Database and table name
 db_name = 'chatdb'
 table_name  = 'chat_table'
+summary_table_name = 'chat_summary'
+response_cache_table_name = 'llm_response_cache'
+job_table_name = 'extraction_jobs'
+idempotency_table_name = 'chat_idempotency'
+lead_notify_channel = 'lead_changes'  # NOTIFY channel of the chat_info trigger
+lead_stats_table_name = 'lead_stats_daily'  # per-day lead counts kept current by a chat_info trigger
 DATABASE_URL = os.getenv('DATABASE_URL')
+# Set DB_NAME to skip the GCP metadata lookup entirely (local dev, tests, CI)
+DB_NAME = os.getenv('DB_NAME')
+# Where a database name resolved from GCP metadata is remembered between process starts
+DB_NAME_CACHE_FILE = os.getenv('DB_NAME_CACHE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.db_name'))
+GCP_METADATA_TIMEOUT = float(os.getenv('GCP_METADATA_TIMEOUT', '2'))  # seconds
 # For cloud deployment, lets create different db for production and staging
 
-def get_db_name():
+def _get_db_name_from_metadata():
     #db based on Production and staging based on GitHub branch name
+    import requests  # only needed on the metadata path, keeps `import config` cheap
     METADATA_URL = f"http://metadata.google.internal/computeMetadata/v1/instance/attributes/BRANCH_NAME"
     headers = {"Metadata-Flavor": "Google"}
     try:
-        response = requests.get(METADATA_URL, headers=headers, timeout=2)
+        response = requests.get(METADATA_URL, headers=headers, timeout=GCP_METADATA_TIMEOUT)
         if response.status_code == 200:
             branch_name  = response.text.strip()
             print(f"Detected branch: {branch_name}")
@@ -35,15 +93,115 @@ def get_db_name():
                 return 'staging_chat_db'
     except Exception as e:
         print(f"Could not fetch metadata (defaulting to local DB): {e}")
+    return None
+
+def _read_cached_db_name():
+    try:
+        with open(DB_NAME_CACHE_FILE) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _write_cached_db_name(name):
+    try:
+        with open(DB_NAME_CACHE_FILE, 'w') as f:
+            f.write(name)
+    except OSError as e:
+        print(f"Could not cache database name: {e}")
+
+_resolved_db_name = None
+
+def get_db_name():
+    """
+    Resolve the database name once per process: DB_NAME, then the value cached
+    by an earlier run, then the GCP metadata server, then the local default.
+    Nothing here runs at import time.
+    """
+    global _resolved_db_name
+    if _resolved_db_name is None:
+        name = DB_NAME or _read_cached_db_name()
+        if not name:
+            name = _get_db_name_from_metadata()
+            # Only a real metadata answer is cached, so a transient failure is retried next start
+            if name:
+                _write_cached_db_name(name)
+        _resolved_db_name = name or db_name
+    return _resolved_db_name
 
-    # Fallback if metadata not found or error occurs
-    return db_name
+def get_database_url():
+    """Full connection URL for the chat database (DATABASE_URL + resolved name)."""
+    return DATABASE_URL + get_db_name()
 
-db_name = get_db_name()
-DATABASE_URL = DATABASE_URL + db_name
+# Connection pool settings (one pooled connection is borrowed per unit of work)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", "0"))  # 0 = unbounded wait queue
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+DB_POOL_RECONNECT_TIMEOUT = float(os.getenv("DB_POOL_RECONNECT_TIMEOUT", "300"))
 
-print("Connecting to:", DATABASE_URL)
 
+# Background contact-info extraction
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+EXTRACTION_QUEUE_SIZE = int(os.getenv("EXTRACTION_QUEUE_SIZE", "200"))
+EXTRACTION_QUEUE_POLICY = os.getenv("EXTRACTION_QUEUE_POLICY", "coalesce")
+EXTRACTION_DRAIN_TIMEOUT = float(os.getenv("EXTRACTION_DRAIN_TIMEOUT", "10"))  # seconds
+# Small, fast model for contact-info extraction (GROQ_MODEL_NAME is its fallback)
+EXTRACTION_MODEL_NAME = os.getenv("EXTRACTION_MODEL_NAME", "llama-3.1-8b-instant")
+EXTRACTION_JSON_MODE = os.getenv("EXTRACTION_JSON_MODE", "True").lower() == "true"
+EXTRACTION_MAX_REPAIRS = int(os.getenv("EXTRACTION_MAX_REPAIRS", "1"))  # follow-up calls for an invalid reply
+# Where extraction jobs wait: "memory" (threads in each web process) or "postgres"
+# (durable job table, processed by `python worker.py`)
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "memory")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))  # then the job is dead-lettered
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))  # seconds, doubled per attempt with jitter
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))  # seconds
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))  # seconds before a job held by a dead worker is retried
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # seconds between polls of an empty queue
+
+# History sent to the LLM each turn: "full" sends every stored message, "window" sends the
+# newest messages within the message/token budget plus a rolling summary of older turns
+HISTORY_STRATEGY = os.getenv("HISTORY_STRATEGY", "window")
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "3000"))  # 0 = no token budget
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "True").lower() == "true"
+HISTORY_SUMMARY_MIN_MESSAGES = int(os.getenv("HISTORY_SUMMARY_MIN_MESSAGES", "6"))  # fold older turns in batches; until then they stay in the prompt
+
+# How chat messages are written to chat_table:
+#   sync          one commit per write (default)
+#   group_commit  writes from concurrent turns are batched into one insert; each turn waits for its commit
+#   write_behind  writes are buffered and flushed in the background every HISTORY_WRITE_INTERVAL;
+#                 buffered messages are lost if the process crashes
+HISTORY_WRITE_MODE = os.getenv("HISTORY_WRITE_MODE", "sync")
+HISTORY_WRITE_BATCH_SIZE = int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "500"))  # rows per insert
+HISTORY_WRITE_INTERVAL = float(os.getenv("HISTORY_WRITE_INTERVAL", "0.05"))  # seconds, write_behind only
+HISTORY_WRITE_MAX_PENDING = int(os.getenv("HISTORY_WRITE_MAX_PENDING", "10000"))  # writers wait when full
+
+# Per-process cache of session histories, checked against the latest message id on every read
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "True").lower() == "true"
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # message JSON per process
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "900"))  # seconds a session may sit idle
+
+# Live lead feed (/leads/stream)
+LEADS_STREAM_HEARTBEAT = float(os.getenv("LEADS_STREAM_HEARTBEAT", "15"))  # seconds between keep-alive comments
+LEADS_STREAM_QUEUE_SIZE = int(os.getenv("LEADS_STREAM_QUEUE_SIZE", "100"))  # events buffered per client before a reset
+LEADS_STREAM_BATCH_WINDOW = float(os.getenv("LEADS_STREAM_BATCH_WINDOW", "0.1"))  # seconds of changes read per query
+LEADS_STREAM_MAX_CLIENTS = int(os.getenv("LEADS_STREAM_MAX_CLIENTS", "50"))  # per worker process, then 503
+LEADS_STREAM_MAX_LIFETIME = float(os.getenv("LEADS_STREAM_MAX_LIFETIME", "300"))  # seconds before the client is asked to reconnect
+# Each client holds a worker thread in the threaded (WSGI) app, so there the feed is
+# off unless enabled; the async app (asgi:app) always serves it
+LEADS_STREAM_WSGI_ENABLED = os.getenv("LEADS_STREAM_WSGI_ENABLED", "False").lower() == "true"
+
+# Cache of first-turn replies (no history beyond the welcome message)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "False").lower() == "true"
+RESPONSE_CACHE_AGENTS = [a.strip() for a in os.getenv("RESPONSE_CACHE_AGENTS", "sales,generic").split(",") if a.strip()]
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_SHARED = os.getenv("RESPONSE_CACHE_SHARED", "False").lower() == "true"  # Postgres tier shared by workers
+
+# Prometheus metrics at /metrics (per-stage timings, request latency, token counts)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
 
 first_chat_message = "Hi, Welcome to smallTech 👋. I'm here to help with any IT-related questions or concerns you might bring. What brings you to our website today?"
 class agent_type(str, Enum):
@@ -54,4 +212,40 @@ class agent_type(str, Enum):
 class status_type(str, Enum):
     OPEN = "OPEN"
     CLOSED = "CLOSED"
-    QUALIFYING = "QUALIFYING"
\ No newline at end of file
+    QUALIFYING = "QUALIFYING"
+
+# What the extraction queue does when a job cannot simply be appended
+class extraction_policy(str, Enum):
+    COALESCE = "coalesce"
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+
+class extraction_backend(str, Enum):
+    MEMORY = "memory"
+    POSTGRES = "postgres"
+
+class session_lock_mode(str, Enum):
+    LOCAL = "local"
+    POSTGRES = "postgres"
+    OFF = "off"
+
+# How much conversation history is sent to the LLM
+class history_strategy(str, Enum):
+    FULL = "full"
+    WINDOW = "window"
+
+class history_write_mode(str, Enum):
+    SYNC = "sync"
+    GROUP_COMMIT = "group_commit"
+    WRITE_BEHIND = "write_behind"
+
+# Time buckets of /leads/stats
+class lead_stats_bucket(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+# File formats for /leads/export
+class export_format(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
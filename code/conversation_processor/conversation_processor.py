@@ -1,10 +1,20 @@
 import json
 from datetime import datetime
-from db import sync_connection
-from langchain_groq import ChatGroq
-from config import GROQ_API_KEY, GROQ_MODEL_NAME, agent_type
+from db import get_connection
+from config import (
+    agent_type, history_strategy, HISTORY_STRATEGY, HISTORY_SUMMARY_ENABLED,
+    EXTRACTION_JSON_MODE, EXTRACTION_MAX_REPAIRS,
+)
+from llm_registry import llm_registry
+from conversation_processor.history_summary import update_session_summary
+from conversation_processor.info_prefilter import prefilter_message, prefilter_stats
+from conversation_processor.extraction_schema import ExtractionParseError, parse_extraction
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from system_prompt import get_name_prompt, get_info_prompt
+from metrics import llm_callbacks, metrics_registry, span
+
+extraction_results_total = metrics_registry.counter(
+    "extraction_results_total", "Extraction replies that were valid, valid after repair, or given up on.", ("outcome",))
 
 def process_conversation(user_input, session_id, request_type):
     """
@@ -14,24 +24,41 @@ def process_conversation(user_input, session_id, request_type):
 
     try:
         print(f"[PROCESSOR] Processing session {session_id} for contact info detection...")  
-        # Update request_type for the new messages in this session
-        _update_session_request_type(session_id, request_type)
-        # Choose llm function based on request type
-        info_data = _detect_info_with_llm(user_input, request_type)
-        
-        if info_data and _has_valid_info(info_data, request_type):
-            print(f"[PROCESSOR] info detected in session {session_id}")
-                
-            # Save information to database
-            _save_info_to_database(session_id, info_data, user_input, request_type)
-            print(f"[PROCESSOR] information saved for session {session_id}.")
-        else:
-            print(f"[PROCESSOR] No Info detected in current message for session {session_id}")
+        with span("extraction"):
+            # Update request_type for the new messages in this session
+            _update_session_request_type(session_id, request_type)
+            info_data = _detect_info(user_input, session_id, request_type)
+
+            if info_data and _has_valid_info(info_data, request_type):
+                print(f"[PROCESSOR] info detected in session {session_id}")
+
+                # Save information to database
+                with span("extraction_db_upsert"):
+                    _save_info_to_database(session_id, info_data, user_input, request_type)
+                print(f"[PROCESSOR] information saved for session {session_id}.")
+            else:
+                print(f"[PROCESSOR] No Info detected in current message for session {session_id}")
 
         
     except Exception as e:
         print(f"[PROCESSOR] Error in conversation processor: {e}")
-        # Don't let processing errors break the chat flow
+        # Runs on the extraction workers, so re-raise to count the failure without affecting the chat reply
+        raise
+    finally:
+        _update_history_summary(session_id)
+
+def _update_history_summary(session_id):
+    """
+    Keep the rolling summary of older turns current when the windowed
+    history strategy is in use. Failures only cost summary freshness.
+    """
+    if HISTORY_STRATEGY != history_strategy.WINDOW or not HISTORY_SUMMARY_ENABLED:
+        return
+    try:
+        with span("summary_update"):
+            update_session_summary(session_id)
+    except Exception as e:
+        print(f"[SUMMARY] Error updating summary for session {session_id}: {e}")
 
 def _update_session_request_type(session_id, request_type):
     """
@@ -39,30 +66,48 @@ def _update_session_request_type(session_id, request_type):
     only if session_id does not already exist.
     If the session_id exists, do nothing.
     """
-    try:
-        with sync_connection.cursor() as cur:
-            insert_query = """
-            INSERT INTO chat_info (
-                session_id,
-                request_type
-            ) VALUES (%s, %s)
-            ON CONFLICT (session_id) DO NOTHING
-            """
-
-            cur.execute(insert_query, (session_id, request_type))
-            sync_connection.commit()
-
-            if cur.rowcount and cur.rowcount > 0:
-                print(f"[CREATE] Inserted new chat_info for session_id={session_id} with request_type='{request_type}'")
-            else:
-                print(f"[CREATE] session_id={session_id} already exists — no action taken")
+    with get_connection() as conn, conn.cursor() as cur:
+        insert_query = """
+        INSERT INTO chat_info (
+            session_id,
+            request_type
+        ) VALUES (%s, %s)
+        ON CONFLICT (session_id) DO NOTHING
+        """
 
-    except Exception as e:
-        print(f"Error inserting request_type row: {e}")
-        try:
-            sync_connection.rollback()
-        except Exception:
-            pass
+        cur.execute(insert_query, (session_id, request_type))
+        conn.commit()
+
+        if cur.rowcount and cur.rowcount > 0:
+            print(f"[CREATE] Inserted new chat_info for session_id={session_id} with request_type='{request_type}'")
+        else:
+            print(f"[CREATE] session_id={session_id} already exists — no action taken")
+
+def _detect_info(user_input, session_id, request_type):
+    """
+    Run the cheap local pre-filter first and only call the LLM when the
+    message may hold personal info the regexes can't settle on their own.
+    """
+    prefiltered = prefilter_message(user_input, request_type)
+
+    if prefiltered["resolved"]:
+        print(f"[PROCESSOR] Contact info resolved locally for session {session_id}, skipping LLM")
+        return {"contact_name": "", "email": prefiltered["email"], "mobile": prefiltered["mobile"], "country": ""}
+
+    if not prefiltered["needs_llm"]:
+        print(f"[PROCESSOR] No personal info in message for session {session_id}, skipping LLM")
+        return None
+
+    # Choose llm function based on request type
+    prefilter_stats.record("llm_calls")
+    info_data = _detect_info_with_llm(user_input, request_type)
+
+    # Where the LLM found an email/mobile, prefer the exact text the regex matched
+    if request_type == agent_type.SALES and info_data:
+        for field in ("email", "mobile"):
+            if prefiltered[field] and str(info_data.get(field) or "").strip():
+                info_data[field] = prefiltered[field]
+    return info_data
 
 def _has_valid_info(info_data, request_type):
     """
@@ -87,16 +132,18 @@ def _has_valid_info(info_data, request_type):
 def _detect_info_with_llm(message, request_type):
     """
     Use LLM to detect if the user provided their contact info in the message.
+    The reply is validated against the prompt's schema; an invalid reply is
+    sent back to the model with the problem, at most EXTRACTION_MAX_REPAIRS times.
     
     Args:
         message (str): User's message to analyze
         
     Returns:
-        dict: Contains Contact Us/name info 
+        dict: Contains Contact Us/name info, or None if no valid reply was obtained
     """
     try:
-        # Create LLM instance for contact info detection
-        llm = ChatGroq(groq_api_key=GROQ_API_KEY, model=GROQ_MODEL_NAME)
+        # Shared extraction client (reuses the provider connection pool)
+        llm = llm_registry.get_extraction_llm()
 
         # prompt based on request type
         if request_type == agent_type.SALES:
@@ -105,26 +152,33 @@ def _detect_info_with_llm(message, request_type):
             prompt_content = get_name_prompt().format(message=message)
 
         # Create the prompt
-        full_prompt = [SystemMessage(content=prompt_content)]
-
-        # Get LLM response
-        response = llm.invoke(full_prompt)
-        response_text = response.content.strip()
-        # Clean markdown fences if present
-        response_text = response_text.strip("`").replace("json\n", "")        
-        print(f"[INFO_DETECTION] LLM Response: {response_text}")
-        
-        # Parse JSON response
-        try:
-            contact_info = json.loads(response_text)
+        messages = [SystemMessage(content=prompt_content)]
+        # JSON mode makes the provider return a single JSON object
+        call_kwargs = {"response_format": {"type": "json_object"}} if EXTRACTION_JSON_MODE else {}
+
+        for attempt in range(EXTRACTION_MAX_REPAIRS + 1):
+            response = llm.invoke(messages, config={"callbacks": llm_callbacks("extraction_llm")}, **call_kwargs)
+            response_text = response.content.strip()
+            print(f"[INFO_DETECTION] LLM Response: {response_text}")
+            try:
+                contact_info = parse_extraction(response_text, request_type)
+            except ExtractionParseError as e:
+                print(f"[INFO_DETECTION] Invalid LLM response ({e})")
+                messages = messages + [
+                    AIMessage(content=response_text),
+                    HumanMessage(content=f"{e} Respond again with only the JSON object in the requested format."),
+                ]
+                continue
+            extraction_results_total.inc(outcome="repaired" if attempt else "valid")
             return contact_info
-        except json.JSONDecodeError:
-            print(f"[INFO_DETECTION] Failed to parse LLM response as JSON: {response_text}")
-            return {"contact_name": "", "email": "", "mobile": "", "country": ""}
+
+        extraction_results_total.inc(outcome="invalid")
+        print(f"[INFO_DETECTION] Giving up after {EXTRACTION_MAX_REPAIRS} repair attempt(s)")
+        return None
             
     except Exception as e:
         print(f"[INFO_DETECTION] Error in LLM contact info detection: {e}")
-        return {"contact_name": "", "email": "", "mobile": "", "country": ""}
+        raise
     
 def _save_info_to_database(session_id, info_data, original_message, request_type):
     """
@@ -136,89 +190,78 @@ def _save_info_to_database(session_id, info_data, original_message, request_type
         original_message (str): The original message where contact info was detected
         request_type: type of request
     """
-    try:
-        # Ensure clean transaction state
-        sync_connection.rollback()
-        
-        with sync_connection.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
 
-            metadata = {
-                "info_detected_from_message": original_message,
-                "detection_method": request_type,
-                "detection_timestamp": datetime.now().isoformat()
-            }
+        metadata = {
+            "info_detected_from_message": original_message,
+            "detection_method": request_type,
+            "detection_timestamp": datetime.now().isoformat()
+        }
+    
+        # For sales requests, extract name, email, and country
+        contact_name = info_data.get('contact_name', '').strip() or None
+        email = info_data.get('email', '').strip() or None
+        country = info_data.get('country', '').strip() or None
+        mobile = info_data.get('mobile', '').strip() or None
         
-            # For sales requests, extract name, email, and country
-            contact_name = info_data.get('contact_name', '').strip() or None
-            email = info_data.get('email', '').strip() or None
-            country = info_data.get('country', '').strip() or None
-            mobile = info_data.get('mobile', '').strip() or None
-            
-            # Always update with new information (allow corrections)
-            # Only keep existing data if new data is explicitly empty/None
-            insert_query = """
-            INSERT INTO chat_info (
-                session_id, 
-                contact_name, 
-                email,
-                country,
-                mobile,
-                request_type,
-                metadata,
-                created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (session_id) 
-            DO UPDATE SET 
-                contact_name = CASE 
-                    WHEN EXCLUDED.contact_name IS NOT NULL THEN EXCLUDED.contact_name 
-                    ELSE chat_info.contact_name 
-                END,
-                email = CASE 
-                    WHEN EXCLUDED.email IS NOT NULL THEN EXCLUDED.email 
-                    ELSE chat_info.email 
-                END,
-                country = CASE 
-                    WHEN EXCLUDED.country IS NOT NULL THEN EXCLUDED.country 
-                    ELSE chat_info.country 
-                END,
-                mobile = CASE 
-                    WHEN EXCLUDED.mobile IS NOT NULL THEN EXCLUDED.mobile 
-                    ELSE chat_info.mobile 
-                END,
-                request_type = EXCLUDED.request_type,
-                metadata = EXCLUDED.metadata,
-                created_at = CASE 
-                    WHEN chat_info.created_at IS NULL THEN EXCLUDED.created_at 
-                    ELSE chat_info.created_at 
-                END
-            """
-            
-            cur.execute(insert_query, (
-                session_id,
-                contact_name,
-                email,
-                country,
-                mobile,
-                request_type,
-                json.dumps(metadata),
-                datetime.now()
-            ))
-
-            sync_connection.commit()            
-            
-            # Log what was updated
-            updates = []
-            if contact_name: updates.append(f"contact_name='{contact_name}'")
-            if email: updates.append(f"email='{email}'")
-            if country: updates.append(f"country='{country}'")
-            if mobile: updates.append(f"mobile='{mobile}'")
-            
-            print(f"[DATABASE] Info updated for session {session_id}: {', '.join(updates) if updates else 'no new info'}")
+        # Always update with new information (allow corrections)
+        # Only keep existing data if new data is explicitly empty/None
+        insert_query = """
+        INSERT INTO chat_info (
+            session_id, 
+            contact_name, 
+            email,
+            country,
+            mobile,
+            request_type,
+            metadata,
+            created_at
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (session_id) 
+        DO UPDATE SET 
+            contact_name = CASE 
+                WHEN EXCLUDED.contact_name IS NOT NULL THEN EXCLUDED.contact_name 
+                ELSE chat_info.contact_name 
+            END,
+            email = CASE 
+                WHEN EXCLUDED.email IS NOT NULL THEN EXCLUDED.email 
+                ELSE chat_info.email 
+            END,
+            country = CASE 
+                WHEN EXCLUDED.country IS NOT NULL THEN EXCLUDED.country 
+                ELSE chat_info.country 
+            END,
+            mobile = CASE 
+                WHEN EXCLUDED.mobile IS NOT NULL THEN EXCLUDED.mobile 
+                ELSE chat_info.mobile 
+            END,
+            request_type = EXCLUDED.request_type,
+            metadata = EXCLUDED.metadata,
+            created_at = CASE 
+                WHEN chat_info.created_at IS NULL THEN EXCLUDED.created_at 
+                ELSE chat_info.created_at 
+            END
+        """
+        
+        cur.execute(insert_query, (
+            session_id,
+            contact_name,
+            email,
+            country,
+            mobile,
+            request_type,
+            json.dumps(metadata),
+            datetime.now()
+        ))
 
-    except Exception as e:
-        print(f"[DATABASE] Error saving info to database: {e}")
-        # Rollback on error to clean transaction state
-        try:
-            sync_connection.rollback()
-        except:
-            pass
\ No newline at end of file
+        conn.commit()            
+        
+        # Log what was updated
+        updates = []
+        if contact_name: updates.append(f"contact_name='{contact_name}'")
+        if email: updates.append(f"email='{email}'")
+        if country: updates.append(f"country='{country}'")
+        if mobile: updates.append(f"mobile='{mobile}'")
+        
+        print(f"[DATABASE] Info updated for session {session_id}: {', '.join(updates) if updates else 'no new info'}")
+        raise
\ No newline at end of file
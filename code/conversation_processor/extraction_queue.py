@@ -0,0 +1,192 @@
+import atexit
+import threading
+import time
+from collections import deque
+from config import (
+    EXTRACTION_WORKERS, EXTRACTION_QUEUE_SIZE, EXTRACTION_QUEUE_POLICY,
+    EXTRACTION_DRAIN_TIMEOUT, EXTRACTION_BACKEND, extraction_policy, extraction_backend,
+)
+from conversation_processor.conversation_processor import process_conversation
+from conversation_processor.job_queue import PostgresJobQueue
+
+
+class _Job:
+    def __init__(self, session_id, request_type, user_input):
+        self.session_id = session_id
+        self.request_type = request_type
+        self.inputs = [user_input]
+
+
+class ExtractionQueue:
+    """
+    Long-lived, bounded pool of background workers for contact-info extraction.
+
+    Jobs for the same session never run concurrently and run in arrival order,
+    so a later correction is never overwritten by an earlier message.
+    When the queue is full (or, with the coalesce policy, when a session
+    already has a job waiting) the configured policy decides what happens:
+      - coalesce:    merge the message into the session's waiting job, drop if full
+      - drop_newest: reject the new job if full
+      - drop_oldest: evict the oldest waiting job if full
+    """
+
+    def __init__(self, handler, workers, max_size, policy):
+        self._handler = handler
+        self._workers = workers
+        self._max_size = max_size
+        self._policy = extraction_policy(policy)
+        self._pending = deque()
+        self._waiting_by_session = {}
+        self._running_sessions = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._accepting = False
+        self._stopping = False
+        self._stats = {
+            "queued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "in_flight": 0,
+            "succeeded": 0,
+            "failed": 0,
+        }
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._cond:
+            if self._threads:
+                return
+            self._accepting = True
+            self._stopping = False
+            for i in range(self._workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"extraction-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.shutdown)
+        print(f"[EXTRACTION] Started {self._workers} workers (queue size {self._max_size}, policy '{self._policy.value}')")
+
+    def submit(self, user_input, session_id, request_type):
+        """
+        Queue a message for extraction without waiting for it.
+        Returns True if the message was queued or coalesced, False if dropped.
+        """
+        if not self._threads:
+            self.start()
+
+        with self._cond:
+            if not self._accepting:
+                self._stats["dropped"] += 1
+                return False
+
+            waiting = self._waiting_by_session.get(session_id)
+            if waiting is not None and self._policy == extraction_policy.COALESCE:
+                waiting.inputs.append(user_input)
+                waiting.request_type = request_type
+                self._stats["coalesced"] += 1
+                return True
+
+            if len(self._pending) >= self._max_size:
+                if self._policy != extraction_policy.DROP_OLDEST:
+                    self._stats["dropped"] += 1
+                    print(f"[EXTRACTION] Queue full, dropped message for session {session_id}")
+                    return False
+                evicted = self._pending.popleft()
+                self._forget_waiting(evicted)
+                self._stats["dropped"] += 1
+                print(f"[EXTRACTION] Queue full, evicted oldest job for session {evicted.session_id}")
+
+            job = _Job(session_id, request_type, user_input)
+            self._pending.append(job)
+            self._waiting_by_session.setdefault(session_id, job)
+            self._stats["queued"] += 1
+            self._cond.notify()
+            return True
+
+    def stats(self):
+        """Snapshot of the queue counters."""
+        with self._cond:
+            return dict(self._stats, depth=len(self._pending))
+
+    def shutdown(self, timeout=None):
+        """
+        Stop accepting jobs and wait up to `timeout` seconds for queued and
+        in-flight jobs to finish before stopping the workers.
+        """
+        timeout = EXTRACTION_DRAIN_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if not self._threads:
+                return
+            self._accepting = False
+            while self._pending or self._stats["in_flight"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[EXTRACTION] Drain timed out, {len(self._pending)} jobs not processed")
+                    break
+                self._cond.wait(remaining)
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+
+        for thread in threads:
+            thread.join(timeout=max(deadline - time.monotonic(), 0))
+        print(f"[EXTRACTION] Shut down: {self.stats()}")
+
+    def _forget_waiting(self, job):
+        if self._waiting_by_session.get(job.session_id) is job:
+            del self._waiting_by_session[job.session_id]
+            # Another job for the same session may still be queued behind it
+            for other in self._pending:
+                if other.session_id == job.session_id:
+                    self._waiting_by_session[job.session_id] = other
+                    break
+
+    def _next_job(self):
+        """Pop the oldest job whose session is not already being processed."""
+        for job in self._pending:
+            if job.session_id not in self._running_sessions:
+                self._pending.remove(job)
+                self._forget_waiting(job)
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running_sessions.add(job.session_id)
+                self._stats["in_flight"] += 1
+
+            succeeded = False
+            try:
+                self._handler("\n".join(job.inputs), job.session_id, job.request_type)
+                succeeded = True
+            except Exception as e:
+                print(f"[EXTRACTION] Job for session {job.session_id} failed: {e}")
+            finally:
+                with self._cond:
+                    self._running_sessions.discard(job.session_id)
+                    self._stats["in_flight"] -= 1
+                    self._stats["succeeded" if succeeded else "failed"] += 1
+                    self._cond.notify_all()
+
+
+if extraction_backend(EXTRACTION_BACKEND) == extraction_backend.POSTGRES:
+    # Web processes only store jobs; worker.py processes them
+    extraction_queue = PostgresJobQueue(process_conversation, workers=0)
+else:
+    extraction_queue = ExtractionQueue(
+        process_conversation,
+        workers=EXTRACTION_WORKERS,
+        max_size=EXTRACTION_QUEUE_SIZE,
+        policy=EXTRACTION_QUEUE_POLICY,
+    )
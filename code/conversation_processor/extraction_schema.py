@@ -0,0 +1,66 @@
+import json
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, ValidationError, field_validator
+from config import agent_type
+
+
+class _Extraction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _null_to_empty(cls, value, info):
+        # Models often answer null for "not found"; the processor expects empty strings
+        if value is None:
+            return False if info.field_name == "name_detected" else ""
+        return value
+
+
+class ContactInfo(_Extraction):
+    """Fields asked for by info_prompt (sales agent)."""
+    contact_name: str = ""
+    email: str = ""
+    mobile: str = ""
+    country: str = ""
+
+
+class NameInfo(_Extraction):
+    """Fields asked for by name_prompt (other agents)."""
+    name_detected: bool = False
+    # The prompt's examples have used "name" as well
+    contact_name: str = Field("", validation_alias=AliasChoices("contact_name", "name"))
+    confidence: str = ""
+
+
+class ExtractionParseError(ValueError):
+    """The model's reply is not a JSON object matching the extraction schema."""
+
+
+def schema_for(request_type):
+    return ContactInfo if request_type == agent_type.SALES else NameInfo
+
+def parse_extraction(response_text, request_type):
+    """
+    Validate an extraction reply against the schema for `request_type`.
+    Text around the JSON object (markdown fences, a leading sentence) is ignored.
+
+    Returns:
+        dict: The validated fields
+    Raises:
+        ExtractionParseError: with a message that can be sent back to the model
+    """
+    start, end = response_text.find("{"), response_text.rfind("}")
+    if start == -1:
+        raise ExtractionParseError("The reply does not contain a JSON object.")
+    # Without a closing brace, parse the rest so the error says what is wrong
+    candidate = response_text[start:end + 1] if end > start else response_text[start:]
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError as e:
+        raise ExtractionParseError(f"The reply is not valid JSON: {e.msg}.") from e
+    if not isinstance(data, dict):
+        raise ExtractionParseError("The reply must be a JSON object.")
+    try:
+        return schema_for(request_type).model_validate(data).model_dump()
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise ExtractionParseError(f"The JSON does not match the expected format ({problems}).") from e
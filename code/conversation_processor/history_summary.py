@@ -0,0 +1,56 @@
+from langchain_core.messages import SystemMessage
+from db import get_connection
+from history_buffer import history_buffer
+from llm_registry import llm_registry
+from system_prompt import get_summary_prompt
+from history_window import (
+    load_summary, save_summary, load_recent_messages, load_messages_between, select_window,
+)
+from config import HISTORY_MAX_MESSAGES, HISTORY_SUMMARY_MIN_MESSAGES
+from metrics import llm_callbacks
+
+
+def _format_transcript(rows):
+    lines = []
+    for _, message in rows:
+        speaker = "Visitor" if message.type == "human" else "Assistant"
+        lines.append(f"{speaker}: {message.content}")
+    return "\n".join(lines)
+
+def update_session_summary(session_id):
+    """
+    Fold messages that have dropped out of the history window into the
+    session's rolling summary. Runs only once enough of them have piled up,
+    so the summary is updated incrementally in batches.
+
+    Returns:
+        bool: True if the summary was updated
+    """
+    history_buffer.flush_session(session_id)
+    with get_connection() as conn, conn.cursor() as cur:
+        summary, summarized_until = load_summary(cur, session_id)
+        window = select_window(load_recent_messages(cur, session_id, HISTORY_MAX_MESSAGES))
+        if not window:
+            return False
+        to_fold = load_messages_between(cur, session_id, summarized_until, window[0][0])
+
+    if len(to_fold) < HISTORY_SUMMARY_MIN_MESSAGES:
+        return False
+
+    # No connection is held during the LLM call
+    prompt_content = get_summary_prompt().format(
+        summary=summary or "(no summary yet)",
+        messages=_format_transcript(to_fold)
+    )
+    response = llm_registry.get_summary_llm().invoke(
+        [SystemMessage(content=prompt_content)],
+        config={"callbacks": llm_callbacks("summary_llm")}
+    )
+    new_summary = response.content.strip()
+    if not new_summary:
+        return False
+
+    with get_connection() as conn, conn.cursor() as cur:
+        save_summary(cur, session_id, new_summary, to_fold[-1][0])
+    print(f"[SUMMARY] Folded {len(to_fold)} messages into the summary for session {session_id}")
+    return True
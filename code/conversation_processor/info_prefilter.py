@@ -0,0 +1,144 @@
+import re
+import threading
+from config import agent_type
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+# 7-15 digits, optionally with a leading + and common separators
+PHONE_RE = re.compile(r"(?<![\w+])\+?\d(?:[\s().-]?\d){6,14}(?!\w)")
+NAME_RE = re.compile(
+    r"\b(my name is|my name's|name is|i am|i'm|this is|call me|i go by)\b",
+    re.IGNORECASE
+)
+LOCATION_RE = re.compile(r"\b(from|based in|located in|living in|live in|country)\b", re.IGNORECASE)
+
+COUNTRIES = [
+    "afghanistan", "albania", "algeria", "andorra", "angola", "argentina", "armenia", "australia",
+    "austria", "azerbaijan", "bahamas", "bahrain", "bangladesh", "barbados", "belarus", "belgium",
+    "belize", "benin", "bhutan", "bolivia", "bosnia", "botswana", "brazil", "brunei", "bulgaria",
+    "burkina faso", "burundi", "cambodia", "cameroon", "canada", "chad", "chile", "china", "colombia",
+    "comoros", "congo", "costa rica", "croatia", "cuba", "cyprus", "czech republic", "czechia",
+    "denmark", "djibouti", "dominica", "dominican republic", "ecuador", "egypt", "el salvador",
+    "eritrea", "estonia", "eswatini", "ethiopia", "fiji", "finland", "france", "gabon", "gambia",
+    "georgia", "germany", "ghana", "greece", "grenada", "guatemala", "guinea", "guyana", "haiti",
+    "honduras", "hong kong", "hungary", "iceland", "india", "indonesia", "iran", "iraq", "ireland",
+    "israel", "italy", "ivory coast", "jamaica", "japan", "jordan", "kazakhstan", "kenya", "kuwait",
+    "kyrgyzstan", "laos", "latvia", "lebanon", "lesotho", "liberia", "libya", "liechtenstein",
+    "lithuania", "luxembourg", "madagascar", "malawi", "malaysia", "maldives", "mali", "malta",
+    "mauritania", "mauritius", "mexico", "moldova", "monaco", "mongolia", "montenegro", "morocco",
+    "mozambique", "myanmar", "namibia", "nepal", "netherlands", "new zealand", "nicaragua", "niger",
+    "nigeria", "north korea", "north macedonia", "norway", "oman", "pakistan", "palestine", "panama",
+    "papua new guinea", "paraguay", "peru", "philippines", "poland", "portugal", "qatar", "romania",
+    "russia", "rwanda", "saudi arabia", "senegal", "serbia", "seychelles", "sierra leone",
+    "singapore", "slovakia", "slovenia", "somalia", "south africa", "south korea", "korea", "spain",
+    "sri lanka", "sudan", "suriname", "sweden", "switzerland", "syria", "taiwan", "tajikistan",
+    "tanzania", "thailand", "togo", "trinidad and tobago", "tunisia", "turkey", "turkmenistan",
+    "uganda", "ukraine", "united arab emirates", "uae", "united kingdom", "uk", "england", "scotland",
+    "wales", "united states", "usa", "america", "uruguay", "uzbekistan", "venezuela", "vietnam",
+    "yemen", "zambia", "zimbabwe",
+]
+# Longest names first so "south korea" wins over "korea"
+COUNTRY_RE = re.compile(
+    r"\b(" + "|".join(re.escape(c) for c in sorted(COUNTRIES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+# Words that can surround a bare email/number without carrying any other info
+FILLER_WORDS = {
+    "my", "email", "e-mail", "mail", "id", "is", "phone", "mobile", "number", "no", "contact",
+    "and", "here", "it", "it's", "its", "you", "can", "reach", "me", "at", "on", "or", "sure",
+    "ok", "okay", "yes", "the", "whatsapp", "cell",
+}
+# A short reply that isn't a question may be a bare name or country ("John Smith", "India")
+SHORT_REPLY_MAX_WORDS = 4
+
+
+class PrefilterStats:
+    """Thread-safe counters showing how many extraction LLM calls the pre-filter saves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "resolved_locally": 0, "llm_skipped": 0, "llm_calls": 0}
+
+    def record(self, *names):
+        with self._lock:
+            for name in names:
+                self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+prefilter_stats = PrefilterStats()
+
+
+def _unique(matches):
+    seen = []
+    for match in matches:
+        if match not in seen:
+            seen.append(match)
+    return seen
+
+def _normalize_phone(number):
+    return re.sub(r"[\s().-]", "", number)
+
+def _residual_words(message, matches):
+    """Words left in the message once the matched values and filler words are removed."""
+    for match in matches:
+        message = message.replace(match, " ")
+    words = re.findall(r"[A-Za-z][A-Za-z'-]*", message.lower())
+    return [word for word in words if word not in FILLER_WORDS]
+
+def prefilter_message(message, request_type):
+    """
+    Fast local scan of a user message for personal info.
+
+    Returns:
+        dict: {
+            "email", "mobile": the value when exactly one was found, else "",
+            "needs_llm": the LLM should look at this message,
+            "resolved": the regex result is unambiguous and complete, so
+                        "email"/"mobile" can be saved without the LLM,
+        }
+    """
+    emails = _unique(EMAIL_RE.findall(message))
+    # Drop digit runs that are part of an email address
+    without_emails = EMAIL_RE.sub(" ", message)
+    phones = _unique(PHONE_RE.findall(without_emails))
+
+    words = message.split()
+    short_reply = 0 < len(words) <= SHORT_REPLY_MAX_WORDS and "?" not in message
+    name_hint = bool(NAME_RE.search(message)) or short_reply
+
+    if request_type != agent_type.SALES:
+        # The generic agent only looks for the visitor's name
+        needs_llm = name_hint
+        prefilter_stats.record("hits" if needs_llm else "misses")
+        if not needs_llm:
+            prefilter_stats.record("llm_skipped")
+        return {"email": "", "mobile": "", "needs_llm": needs_llm, "resolved": False}
+
+    country_hint = bool(COUNTRY_RE.search(message)) or bool(LOCATION_RE.search(message))
+    found_anything = bool(emails or phones or name_hint or country_hint)
+
+    email = emails[0] if len(emails) == 1 else ""
+    mobile = _normalize_phone(phones[0]) if len(phones) == 1 else ""
+    # Only an email and/or number plus filler words: nothing left for the LLM to find
+    resolved = (
+        bool(email or mobile)
+        and len(emails) <= 1 and len(phones) <= 1
+        and not _residual_words(message, emails + phones)
+    )
+
+    if not found_anything:
+        prefilter_stats.record("misses", "llm_skipped")
+    elif resolved:
+        prefilter_stats.record("hits", "resolved_locally", "llm_skipped")
+    else:
+        prefilter_stats.record("hits")
+
+    return {
+        "email": email,
+        "mobile": mobile,
+        "needs_llm": found_anything and not resolved,
+        "resolved": resolved,
+    }
@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+from psycopg import sql
+from config import (
+    JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_DELAY, JOB_RETRY_MAX_DELAY, JOB_LEASE, JOB_POLL_INTERVAL,
+    EXTRACTION_DRAIN_TIMEOUT, job_table_name,
+)
+from db import get_connection
+
+_JOBS = sql.Identifier(job_table_name)
+
+# Oldest ready job whose session has no earlier unfinished job, so a session's
+# messages are processed in order even across workers and hosts. The claimed
+# set (that job plus the session's later ready jobs) is locked before the
+# update, so a concurrent claim can never take the same row
+_CLAIM_QUERY = sql.SQL("""
+    WITH next AS (
+        SELECT id, session_id FROM {jobs} j
+        WHERE status = 'pending' AND run_after <= NOW()
+          AND NOT EXISTS (
+              SELECT 1 FROM {jobs} earlier
+              WHERE earlier.session_id = j.session_id
+                AND earlier.id < j.id
+                AND earlier.status IN ('pending', 'running')
+          )
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+        SELECT j.id FROM {jobs} j, next
+        WHERE j.id = next.id
+           OR (j.session_id = next.session_id AND j.status = 'pending'
+               AND j.run_after <= NOW() AND j.id > next.id)
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    UPDATE {jobs} SET status = 'running', attempts = attempts + 1,
+                      locked_until = NOW() + make_interval(secs => %s)
+    WHERE id IN (SELECT id FROM claimed)
+    RETURNING id, session_id, request_type, user_input, attempts
+""").format(jobs=_JOBS)
+
+
+def _retry_delay(attempts):
+    """Exponential backoff with jitter after the given number of attempts."""
+    delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class PostgresJobQueue:
+    """
+    Durable extraction queue in the job table, claimed with FOR UPDATE SKIP LOCKED
+    so any number of worker processes or hosts can share it.
+
+    Same interface as ExtractionQueue. Web processes only submit (workers=0);
+    `python worker.py` runs the handler threads. A claim takes a session's
+    oldest ready job plus the session's later ready jobs, which run together
+    as one coalesced message. Failed jobs are retried with backoff and marked
+    'dead' after JOB_MAX_ATTEMPTS; jobs held by a worker that died are picked
+    up again once their lease expires.
+    """
+
+    def __init__(self, handler, workers):
+        self._handler = handler
+        self._workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "dropped": 0, "succeeded": 0, "failed": 0, "dead": 0}
+
+    def start(self):
+        """Start the worker threads (idempotent; a no-op for submit-only processes)."""
+        with self._lock:
+            if self._threads or self._workers <= 0:
+                return
+            self._stop.clear()
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"[JOBS] Started {self._workers} workers on table '{job_table_name}'")
+
+    def submit(self, user_input, session_id, request_type):
+        """Store a message for extraction. Returns False if the job could not be stored."""
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL("INSERT INTO {jobs} (session_id, request_type, user_input) VALUES (%s, %s, %s)").format(
+                        jobs=_JOBS),
+                    (session_id, request_type, user_input)
+                )
+            self._count("queued")
+            return True
+        except Exception as e:
+            print(f"[JOBS] Could not queue job for session {session_id}: {e}")
+            self._count("dropped")
+            return False
+
+    def process_next(self):
+        """Claim and run one batch of jobs. Returns False when nothing was ready."""
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(_CLAIM_QUERY, (JOB_LEASE,))
+            jobs = sorted(cur.fetchall())
+        if not jobs:
+            return False
+
+        ids = [job[0] for job in jobs]
+        session_id, request_type = jobs[-1][1], jobs[-1][2]
+        try:
+            self._handler("\n".join(job[3] for job in jobs), session_id, request_type)
+        except Exception as e:
+            self._fail(jobs, e)
+        else:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(sql.SQL("DELETE FROM {jobs} WHERE id = ANY(%s)").format(jobs=_JOBS), (ids,))
+            self._count("succeeded")
+        return True
+
+    def requeue_expired(self):
+        """Put jobs whose worker died (lease expired) back in the queue."""
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("""
+                UPDATE {jobs} SET status = 'pending', locked_until = NULL
+                WHERE status = 'running' AND locked_until < NOW()
+            """).format(jobs=_JOBS))
+            if cur.rowcount:
+                print(f"[JOBS] Requeued {cur.rowcount} jobs with an expired lease")
+
+    def stats(self):
+        """Local counters plus the table's pending/running/dead counts."""
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(sql.SQL("""
+                    SELECT COUNT(*) FILTER (WHERE status = 'pending'),
+                           COUNT(*) FILTER (WHERE status = 'running'),
+                           COUNT(*) FILTER (WHERE status = 'dead')
+                    FROM {jobs}
+                """).format(jobs=_JOBS))
+                stats["depth"], stats["in_flight"], stats["dead_letters"] = cur.fetchone()
+        except Exception as e:
+            print(f"[JOBS] Could not read queue stats: {e}")
+            stats.update(depth=0, in_flight=0, dead_letters=0)
+        return stats
+
+    def shutdown(self, timeout=None):
+        """Stop claiming new jobs and wait up to `timeout` seconds for running ones."""
+        timeout = EXTRACTION_DRAIN_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout=max(deadline - time.monotonic(), 0))
+        if threads:
+            print(f"[JOBS] Shut down: {self.stats()}")
+
+    def _fail(self, jobs, error):
+        attempts = max(job[4] for job in jobs)
+        ids = [job[0] for job in jobs]
+        dead = attempts >= JOB_MAX_ATTEMPTS
+        with get_connection() as conn, conn.cursor() as cur:
+            if dead:
+                cur.execute(sql.SQL("""
+                    UPDATE {jobs} SET status = 'dead', locked_until = NULL, last_error = %s
+                    WHERE id = ANY(%s)
+                """).format(jobs=_JOBS), (str(error), ids))
+            else:
+                cur.execute(sql.SQL("""
+                    UPDATE {jobs} SET status = 'pending', locked_until = NULL, last_error = %s,
+                                      run_after = NOW() + make_interval(secs => %s)
+                    WHERE id = ANY(%s)
+                """).format(jobs=_JOBS), (str(error), _retry_delay(attempts), ids))
+        self._count("dead" if dead else "failed")
+        print(f"[JOBS] Jobs {ids} for session {jobs[0][1]} failed (attempt {attempts}"
+              f"{', dead-lettered' if dead else ''}): {error}")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _worker_loop(self):
+        last_requeue = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_requeue >= JOB_LEASE / 2:
+                    self.requeue_expired()
+                    last_requeue = time.monotonic()
+                if self.process_next():
+                    continue
+            except Exception as e:
+                print(f"[JOBS] Worker error: {e}")
+            self._stop.wait(JOB_POLL_INTERVAL)
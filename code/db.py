@@ -1,112 +1,157 @@
-import os
-import uuid
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 import psycopg
-from langchain_postgres import PostgresChatMessageHistory
-from config import DATABASE_URL, db_name, table_name
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from metrics import current_route, db_queries_total
+from config import (
+    METRICS_ENABLED, get_database_url, table_name,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_WAITING,
+    DB_POOL_MAX_IDLE, DB_POOL_MAX_LIFETIME, DB_POOL_RECONNECT_TIMEOUT,
+)
 
-def ensure_database_exists(DATABASE_URL, db_name):
+class CountingCursor(psycopg.Cursor):
+    """Cursor that counts statements per route for the db_queries_total metric."""
+
+    def execute(self, query, params=None, **kwargs):
+        db_queries_total.inc(route=current_route.get())
+        return super().execute(query, params, **kwargs)
+
+    def executemany(self, query, params_seq, **kwargs):
+        db_queries_total.inc(route=current_route.get())
+        return super().executemany(query, params_seq, **kwargs)
+
+
+class AsyncCountingCursor(psycopg.AsyncCursor):
+    """Async counterpart of CountingCursor."""
+
+    async def execute(self, query, params=None, **kwargs):
+        db_queries_total.inc(route=current_route.get())
+        return await super().execute(query, params, **kwargs)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        db_queries_total.inc(route=current_route.get())
+        return await super().executemany(query, params_seq, **kwargs)
+
+
+def _connection_kwargs(cursor_factory):
+    kwargs = {"autocommit": False}
+    if METRICS_ENABLED:
+        kwargs["cursor_factory"] = cursor_factory
+    return kwargs
+
+_pool = None
+_pool_lock = threading.Lock()
+# Used by the async (ASGI) request path; lives on that process's event loop
+_async_pool = None
+_async_pool_lock = None
+
+def create_connection_pool(DATABASE_URL):
     """
-    Connect to the 'postgres' system database. Create db_name if not exists.
+    Create a connection pool for the specified database.
+    Connections are health-checked before being handed out, so a database
+    restart only costs a reconnect instead of a broken shared connection.
     """
-    # Parse from URL for creation
-    base_url = DATABASE_URL.rsplit('/', 1)[0]
-    postgres_url = f"{base_url}/postgres"
-        
-    # First, ensure the database exists
-
-    with psycopg.connect(postgres_url) as temp_conn:
-        temp_conn.autocommit = True
-        with temp_conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
-            if not cur.fetchone():
-                cur.execute(f'CREATE DATABASE "{db_name}"')
-                print(f"Database '{db_name}' created successfully.")
-            else:
-                print(f"Database '{db_name}' already exists.")
-
-
-def create_sync_connection(DATABASE_URL):
+    print("Connecting to:", DATABASE_URL)
+    return ConnectionPool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_waiting=DB_POOL_MAX_WAITING,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        reconnect_timeout=DB_POOL_RECONNECT_TIMEOUT,
+        check=ConnectionPool.check_connection,
+        kwargs=_connection_kwargs(CountingCursor),
+        name="chat_db",
+        open=True,
+    )
+
+def get_pool():
     """
-    Establish a connection to the specified database.
+    Return the process-wide connection pool, creating it on first use.
     """
-    conn = psycopg.connect(DATABASE_URL)
-    conn.autocommit = False
-    return conn
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = create_connection_pool(get_database_url())
+    return _pool
 
-def ensure_chat_table_exists(sync_connection, table_name):
+def get_connection():
     """
-    Use LangChain's helper to make sure the chat history table exists.
+    Borrow a connection for one unit of work.
+    Use as `with get_connection() as conn:` - the transaction is committed on
+    success, rolled back on error, and the connection goes back to the pool.
     """
-    PostgresChatMessageHistory.create_tables(sync_connection, table_name)
-    print(f"Table '{table_name}' created or verified.")
+    return get_pool().connection()
 
+async def get_async_pool():
+    """
+    Return the process-wide async connection pool, opening it on first use.
+    Must be called from the event loop that will use it.
+    """
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    get_database_url(),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_waiting=DB_POOL_MAX_WAITING,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    reconnect_timeout=DB_POOL_RECONNECT_TIMEOUT,
+                    check=AsyncConnectionPool.check_connection,
+                    kwargs=_connection_kwargs(AsyncCountingCursor),
+                    name="chat_db_async",
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
 
-def ensure_summaries_table_exists(sync_connection):
+@asynccontextmanager
+async def get_async_connection():
     """
-    Create the chat_info table for storing lead information and summaries.
+    Async counterpart of get_connection():
+    `async with get_async_connection() as conn:` commits on success,
+    rolls back on error and returns the connection to the pool.
     """
-    try:
-        with sync_connection.cursor() as cur:
-            # Create the chat_info table
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS chat_info (
-                id SERIAL PRIMARY KEY,
-                session_id TEXT NOT NULL,
-                contact_name TEXT,
-                email TEXT,
-                mobile TEXT,
-                country TEXT,
-                request_type TEXT,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                metadata JSONB DEFAULT '{}',
-                
-                -- Add constraint to prevent duplicate summaries for same session
-                UNIQUE(session_id)
-            );
-            
-            -- Create indexes for efficient querying
-            CREATE INDEX IF NOT EXISTS idx_chat_info_session_id 
-            ON chat_info(session_id);
-            
-            
-            CREATE INDEX IF NOT EXISTS idx_chat_info_created_at 
-            ON chat_info(created_at);
-            """
-            
-            cur.execute(create_table_query)
-
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS contact_name TEXT;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS email TEXT;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS country TEXT;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS mobile TEXT;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS request_type TEXT;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP;")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS metadata JSONB DEFAULT '{}'::jsonb;")
-
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'OPEN';")
-            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS remarks TEXT;")
-
-            sync_connection.commit()
-            print("Table 'chat_info' created/verified successfully.")
-            
-    except Exception as e:
-        print(f"Error creating chat_info table: {e}")
-
-def setup_database_and_table(database_url, table_name):
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+async def close_async_pool():
+    """Close the async pool (used on ASGI shutdown)."""
+    global _async_pool
+    if _async_pool is not None:
+        pool, _async_pool = _async_pool, None
+        await pool.close()
+
+def reset_pool_after_fork():
+    """
+    Forget pools inherited from the parent process after a fork.
+    It is not closed: its connections belong to the parent. The next
+    get_connection() in the child opens a fresh pool.
+    """
+    global _pool, _pool_lock, _async_pool, _async_pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+    _async_pool = None
+    _async_pool_lock = None
+
+def close_pool():
     """
-    Orchestrates DB and table setup, returns the live connection and table name.
+    Close the pool and all its connections (used on shutdown).
     """
-    try:
-        ensure_database_exists(DATABASE_URL, db_name)
-        sync_connection = create_sync_connection(DATABASE_URL)
-
-        ensure_chat_table_exists(sync_connection, table_name)
-        ensure_summaries_table_exists(sync_connection)
-        return sync_connection, table_name
-    except Exception as e:
-        print(f"Error setting up database: {e}")
-        raise
-        
-
-# Usage — get the ready connection and table name
-sync_connection, table_name = setup_database_and_table(DATABASE_URL, table_name)
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,45 @@
+# Gunicorn settings for production (`gunicorn -c gunicorn.conf.py wsgi:app`).
+# Every value can be overridden from the environment.
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Threaded workers: a chat turn is mostly waiting on the LLM, so each process
+# serves several requests at once while the processes use every core.
+# For the async app (asgi:app) use GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# LLM turns and SSE streams can take a while; graceful_timeout leaves time
+# to drain the extraction queue (EXTRACTION_DRAIN_TIMEOUT) on restart.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+# Import the app once in the master and fork it, so workers start fast and share memory
+preload_app = True
+
+pidfile = os.getenv("GUNICORN_PIDFILE", "gunicorn.pid")
+# "none" turns the access log off
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+if accesslog == "none":
+    accesslog = None
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "-")
+
+
+def post_fork(server, worker):
+    # Connections, HTTP clients and threads must not be shared across processes
+    from app import init_worker
+    init_worker()
+    server.log.info(f"Worker {worker.pid} initialized")
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+    shutdown_worker()
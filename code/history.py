@@ -1,41 +1,198 @@
 from http import HTTPStatus
+import json
 import uuid
-from db import sync_connection, table_name
-from langchain_postgres import PostgresChatMessageHistory
+from psycopg import sql
+from db import get_async_connection, get_connection, table_name
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, message_chunk_to_message, message_to_dict, messages_from_dict
 from config import first_chat_message
+from history_buffer import ainsert_messages, history_buffer, insert_messages
+from history_cache import history_cache
+from metrics import span
 
 
-# Database setup 
+class PooledChatMessageHistory(BaseChatMessageHistory):
+    """
+    PostgresChatMessageHistory that borrows a pooled connection for each
+    read or write instead of holding one shared connection.
+    """
+
+    def __init__(self, table_name, session_id):
+        self.table_name = table_name
+        self.session_id = session_id
+
+    def _history(self, conn=None, async_conn=None):
+        # Deferred: langchain_postgres pulls in SQLAlchemy, which dominated import time
+        from langchain_postgres import PostgresChatMessageHistory
+        return PostgresChatMessageHistory(
+            self.table_name,
+            self.session_id,
+            sync_connection=conn,
+            async_connection=async_conn
+        )
+
+    @property
+    def messages(self):
+        history_buffer.flush_session(self.session_id)
+        with span("history_load"), get_connection() as conn, conn.cursor() as cur:
+            rows = history_cache.load(cur, self.session_id)
+            if rows is None:
+                return self._history(conn).messages
+        return [message for _, message in rows]
+
+    def add_messages(self, messages):
+        # Streamed replies arrive as chunks; store them as plain messages
+        messages = [message_chunk_to_message(msg) for msg in messages]
+        if not messages:
+            return
+        if history_buffer.enabled:
+            with span("history_write"):
+                history_buffer.add(self.session_id, messages)
+            return
+        with span("history_write"), get_connection() as conn, conn.cursor() as cur:
+            ids = insert_messages(cur, self._rows(messages))
+        history_cache.append(self.session_id, list(zip(ids, messages)))
+
+    def clear(self):
+        history_buffer.flush_session(self.session_id)
+        with get_connection() as conn:
+            self._history(conn).clear()
+        history_cache.invalidate(self.session_id)
+
+    def _rows(self, messages):
+        return [(self.session_id, json.dumps(message_to_dict(message))) for message in messages]
+
+    # Used by the async request path (ainvoke/astream) instead of a thread per call
+    async def aget_messages(self):
+        await history_buffer.aflush_session(self.session_id)
+        with span("history_load"):
+            async with get_async_connection() as conn, conn.cursor() as cur:
+                rows = await history_cache.aload(cur, self.session_id)
+                if rows is None:
+                    return await self._history(async_conn=conn).aget_messages()
+        return [message for _, message in rows]
+
+    async def aadd_messages(self, messages):
+        messages = [message_chunk_to_message(msg) for msg in messages]
+        if not messages:
+            return
+        with span("history_write"):
+            if history_buffer.enabled:
+                await history_buffer.aadd(self.session_id, messages)
+                return
+            async with get_async_connection() as conn, conn.cursor() as cur:
+                ids = await ainsert_messages(cur, self._rows(messages))
+        history_cache.append(self.session_id, list(zip(ids, messages)))
+
+    async def aclear(self):
+        await history_buffer.aflush_session(self.session_id)
+        async with get_async_connection() as conn:
+            await self._history(async_conn=conn).aclear()
+        history_cache.invalidate(self.session_id)
+
+
+# Database setup
 def get_session_history(session_id):
-    return PostgresChatMessageHistory(
-        table_name,
-        session_id,
-        sync_connection=sync_connection
-    )
+    return PooledChatMessageHistory(table_name, session_id)
 
-def _message_mapping(history):
-    messages = []
-    for msg in history.messages:
-        messages.append({
+def _message_mapping(rows):
+    return [
+        {
+            "id": row_id,
             "type": msg.type,   # "human" or "ai"
             "content": msg.content
-        })
-    return messages
+        }
+        for row_id, msg in rows
+    ]
+
+def _load_page(cur, session_id, limit=None, before=None, after=None):
+    """
+    Read one page of a session's messages straight from the chat table,
+    using the (session_id, id) index. Returns ((id, message) rows oldest
+    first, has_more) where has_more means further messages exist past the page
+    in the direction being read.
+    """
+    conditions = [sql.SQL("session_id = %s")]
+    params = [session_id]
+    if before is not None:
+        conditions.append(sql.SQL("id < %s"))
+        params.append(before)
+    if after is not None:
+        conditions.append(sql.SQL("id > %s"))
+        params.append(after)
+
+    # Reading forward (after/since) walks up from the cursor; otherwise take the newest page
+    descending = after is None and limit is not None
+    query = sql.SQL("SELECT id, message FROM {table} WHERE {conditions} ORDER BY id {order}").format(
+        table=sql.Identifier(table_name),
+        conditions=sql.SQL(" AND ").join(conditions),
+        order=sql.SQL("DESC" if descending else "ASC"),
+    )
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        query = query + sql.SQL(" LIMIT %s")
+        params.append(limit + 1)
+
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if limit is not None else rows
+    if descending:
+        rows.reverse()
+    return [(row_id, messages_from_dict([message])[0]) for row_id, message in rows], has_more
 
-def get_history(session_id: str):
-    """Retrieve chat history for a session_id as a list of dicts."""
+def _page_from_rows(rows, limit=None, before=None, after=None):
+    """_load_page over a session's cached (id, message) rows."""
+    rows = [row for row in rows
+            if (before is None or row[0] < before) and (after is None or row[0] > after)]
+    if limit is None:
+        return rows, False
+    if after is None:
+        return rows[-limit:] if limit else [], len(rows) > limit
+    return rows[:limit], len(rows) > limit
+
+def _insert_welcome_message(cur, session_id):
+    welcome = AIMessage(content=first_chat_message)
+    cur.execute(
+        sql.SQL("INSERT INTO {table} (session_id, message) VALUES (%s, %s) RETURNING id").format(
+            table=sql.Identifier(table_name)),
+        (session_id, json.dumps(message_to_dict(welcome)))
+    )
+    return [(cur.fetchone()[0], welcome)]
+
+def get_history(session_id: str, limit=None, before=None, after=None, since=None):
+    """
+    Retrieve chat history for a session_id as a list of dicts.
+
+    Without a cursor the newest `limit` messages (or all of them) are returned,
+    and a new session gets the welcome message. `before` pages backwards,
+    `after` pages forwards, and `since` returns only messages newer than the
+    given id so a client can sync cheaply.
+    """
     try:
-        history = get_session_history(session_id)
         status = HTTPStatus.OK
-        if not history.messages:
-            # session exists
-            history.add_ai_message(first_chat_message)
-            status = HTTPStatus.CREATED
-        messages = _message_mapping(history)
+        after = since if since is not None else after
+        history_buffer.flush_session(session_id)
+        with get_connection() as conn, conn.cursor() as cur:
+            # A single page of an uncached session is cheaper to read directly
+            cached = history_cache.load(cur, session_id) if limit is None or history_cache.is_complete(session_id) else None
+            if cached is None:
+                rows, has_more = _load_page(cur, session_id, limit=limit, before=before, after=after)
+            else:
+                rows, has_more = _page_from_rows(cached, limit=limit, before=before, after=after)
+            if not rows and before is None and after is None:
+                # session exists
+                rows = _insert_welcome_message(cur, session_id)
+                status = HTTPStatus.CREATED
+        if status == HTTPStatus.CREATED:
+            history_cache.append(session_id, rows)
 
         return {
             "session_id": session_id,
-            "history": messages
+            "history": _message_mapping(rows),
+            "has_more": has_more,
+            "next_before": rows[0][0] if rows else before,
+            "last_id": rows[-1][0] if rows else after
         }, status
     except Exception as e:
         print(f"[get_history Error] {e}")
@@ -43,4 +200,3 @@ def get_history(session_id: str):
             "error": "Network issue loading history.",
             "session_id": session_id
         }, HTTPStatus.INTERNAL_SERVER_ERROR
-
@@ -0,0 +1,225 @@
+import asyncio
+import atexit
+import json
+import threading
+import time
+from collections import Counter, deque
+from psycopg import sql
+from langchain_core.messages import message_to_dict
+from config import (
+    HISTORY_WRITE_MODE, HISTORY_WRITE_BATCH_SIZE, HISTORY_WRITE_INTERVAL, HISTORY_WRITE_MAX_PENDING,
+    history_write_mode,
+)
+from db import get_connection, table_name
+from history_cache import history_cache
+from metrics import metrics_registry
+
+history_write_batch_rows = metrics_registry.histogram(
+    "history_write_batch_rows", "Chat messages written per insert by the history write buffer.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+
+
+def _insert_query(count):
+    return sql.SQL("INSERT INTO {table} (session_id, message) VALUES {values} RETURNING id").format(
+        table=sql.Identifier(table_name),
+        values=sql.SQL(", ").join([sql.SQL("(%s, %s)")] * count))
+
+def insert_messages(cur, rows):
+    """Insert (session_id, message JSON) rows in one statement. Returns their ids in order."""
+    cur.execute(_insert_query(len(rows)), [value for row in rows for value in row])
+    return [row[0] for row in cur.fetchall()]
+
+async def ainsert_messages(cur, rows):
+    """Async variant of insert_messages for an async cursor."""
+    await cur.execute(_insert_query(len(rows)), [value for row in rows for value in row])
+    return [row[0] for row in await cur.fetchall()]
+
+
+class _Write:
+    __slots__ = ("session_id", "messages", "rows", "done", "error")
+
+    def __init__(self, session_id, messages, rows, wait):
+        self.session_id = session_id
+        self.messages = messages
+        self.rows = rows
+        self.done = threading.Event() if wait else None
+        self.error = None
+
+
+class HistoryWriteBuffer:
+    """
+    Batches chat_table inserts from concurrent turns into multi-row inserts.
+
+    group_commit: add() returns once its rows are committed; whatever arrives
+    while a batch is being written goes into the next one.
+    write_behind: add() returns at once and a background thread flushes every
+    `interval` seconds. flush_session() gives the owning session
+    read-your-writes in this process; close() flushes on shutdown.
+    The buffer is bounded: add() waits while `max_pending` rows are queued.
+    """
+
+    def __init__(self, mode, batch_size, interval, max_pending):
+        self.mode = history_write_mode(mode)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        # One flush at a time keeps each session's messages in insert order
+        self._flush_lock = threading.Lock()
+        self._pending = deque()
+        self._pending_rows = 0
+        self._pending_sessions = Counter()
+        self._thread = None
+        self._closed = False
+        self._stats = {"rows": 0, "batches": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return self.mode != history_write_mode.SYNC
+
+    def add(self, session_id, messages):
+        """Queue messages for one session; in group_commit mode wait for the commit."""
+        rows = [(session_id, json.dumps(message_to_dict(message))) for message in messages]
+        if not rows:
+            return
+        write = _Write(session_id, messages, rows, wait=self.mode == history_write_mode.GROUP_COMMIT)
+        with self._cond:
+            self._ensure_started()
+            while self._pending_rows >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self._pending.append(write)
+            self._pending_rows += len(rows)
+            self._pending_sessions[session_id] += 1
+            self._cond.notify_all()
+        if write.done is not None:
+            write.done.wait()
+            if write.error is not None:
+                raise write.error
+
+    def has_pending(self, session_id):
+        with self._cond:
+            return self._pending_sessions[session_id] > 0
+
+    def flush_session(self, session_id):
+        """Write out any queued messages of a session before it is read."""
+        while self.has_pending(session_id):
+            if not self._flush_once():
+                break
+
+    async def aadd(self, session_id, messages):
+        await asyncio.to_thread(self.add, session_id, messages)
+
+    async def aflush_session(self, session_id):
+        if self.has_pending(session_id):
+            await asyncio.to_thread(self.flush_session, session_id)
+
+    def flush(self):
+        """Write out everything queued."""
+        while self._pending_rows:
+            if not self._flush_once():
+                break
+
+    def close(self):
+        """Stop the flusher and write out whatever is still queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+        if thread is not None:
+            print(f"[HISTORY_WRITE] Closed: {self.stats()}")
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, pending=self._pending_rows, mode=self.mode.value)
+
+    def _ensure_started(self):
+        # Also restarts the thread in a forked worker, where it no longer runs
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._flush_loop, name="history-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _take_batch(self):
+        batch, rows = [], 0
+        while self._pending and (not batch or rows + len(self._pending[0].rows) <= self.batch_size):
+            write = self._pending.popleft()
+            batch.append(write)
+            rows += len(write.rows)
+        return batch
+
+    def _flush_once(self):
+        """Write one batch. Returns False if there was nothing to write or the write failed."""
+        with self._flush_lock:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return False
+            rows = [row for write in batch for row in write.rows]
+            error = None
+            try:
+                with get_connection() as conn, conn.cursor() as cur:
+                    ids = iter(insert_messages(cur, rows))
+                history_write_batch_rows.observe(len(rows))
+            except Exception as e:
+                error = e
+                print(f"[HISTORY_WRITE] Failed to write {len(rows)} messages: {e}")
+            else:
+                for write in batch:
+                    history_cache.append(write.session_id, [(next(ids), message) for message in write.messages])
+
+            with self._cond:
+                if error is not None and self.mode == history_write_mode.WRITE_BEHIND:
+                    # Nobody is waiting on these: keep them, in order, for the next flush
+                    self._pending.extendleft(reversed(batch))
+                    self._stats["errors"] += 1
+                else:
+                    for write in batch:
+                        self._pending_rows -= len(write.rows)
+                        self._pending_sessions[write.session_id] -= 1
+                        if not self._pending_sessions[write.session_id]:
+                            del self._pending_sessions[write.session_id]
+                    if error is None:
+                        self._stats["rows"] += len(rows)
+                        self._stats["batches"] += 1
+                    else:
+                        self._stats["errors"] += 1
+                self._cond.notify_all()
+        for write in batch:
+            if write.done is not None:
+                write.error = error
+                write.done.set()
+        return error is None
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self.mode == history_write_mode.WRITE_BEHIND:
+                    # Collect more writes for up to one interval, or until a batch is full
+                    deadline = time.monotonic() + self.interval
+                    while self._pending_rows < self.batch_size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+            if not self._flush_once() and self.mode == history_write_mode.WRITE_BEHIND:
+                # Database unavailable: back off instead of spinning. A reader may
+                # already have flushed the batch, so only wait if writes remain.
+                with self._cond:
+                    if self._pending and not self._closed:
+                        self._cond.wait(self.interval * 10)
+
+
+history_buffer = HistoryWriteBuffer(
+    mode=HISTORY_WRITE_MODE,
+    batch_size=HISTORY_WRITE_BATCH_SIZE,
+    interval=HISTORY_WRITE_INTERVAL,
+    max_pending=HISTORY_WRITE_MAX_PENDING,
+)
@@ -0,0 +1,246 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from psycopg import sql
+from langchain_core.messages import message_to_dict, messages_from_dict
+from config import HISTORY_CACHE_ENABLED, HISTORY_CACHE_MAX_BYTES, HISTORY_CACHE_TTL
+from db import table_name
+from metrics import metrics_registry
+
+history_cache_lookups = metrics_registry.counter(
+    "history_cache_lookups_total", "Session history cache lookups by result (hit, delta, miss).", ("result",))
+
+# Version of a session's history: its newest message id and message count.
+# Both come from the (session_id, id) index; the count catches rows another
+# process inserted below our newest id, and deletes.
+_VERSION_QUERY = sql.SQL(
+    "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM {table} WHERE session_id = %s"
+).format(table=sql.Identifier(table_name))
+
+_ROWS_AFTER_QUERY = sql.SQL(
+    "SELECT id, message FROM {table} WHERE session_id = %s AND id > %s ORDER BY id"
+).format(table=sql.Identifier(table_name))
+
+_NEWEST_ROWS_QUERY = sql.SQL(
+    "SELECT id, message FROM {table} WHERE session_id = %s ORDER BY id DESC LIMIT %s"
+).format(table=sql.Identifier(table_name))
+
+
+def _decode(rows):
+    """(id, stored message dict) rows as ((id, message) rows, approximate bytes per row)."""
+    return ([(row_id, messages_from_dict([message])[0]) for row_id, message in rows],
+            [len(json.dumps(message)) for _, message in rows])
+
+
+def _newest(rows, tail):
+    return list(rows[-tail:]) if tail else list(rows)
+
+
+class _Entry:
+    """
+    The newest rows of a session. `count` is the session's message count when
+    the entry was last brought up to date; with `tail` set only the newest
+    `tail` rows are kept, otherwise the entry holds the whole session.
+    """
+    __slots__ = ("rows", "sizes", "size", "last_id", "count", "tail", "expires")
+
+    def __init__(self, rows, sizes, last_id, count, tail):
+        if tail is not None and len(rows) > tail:
+            rows, sizes = rows[-tail:], sizes[-tail:]
+        self.rows = rows
+        self.sizes = sizes
+        self.size = sum(sizes)
+        self.last_id = last_id
+        self.count = count
+        self.tail = tail
+        # Set when the entry is stored
+        self.expires = 0.0
+
+    @property
+    def complete(self):
+        return len(self.rows) == self.count
+
+    def covers(self, tail):
+        """Whether this entry can answer a load of the newest `tail` rows (None = all)."""
+        if tail is None:
+            return self.complete
+        return len(self.rows) >= min(tail, self.count)
+
+
+class SessionHistoryCache:
+    """
+    In-process LRU of recent session histories as (id, message) rows.
+
+    Every load checks the session's version in Postgres first, so messages
+    written by other workers are picked up: an unchanged version is served
+    from memory, new messages are fetched as a delta, and anything else
+    (deletes, rows inserted out of order) reloads the session. A load can ask
+    for only the newest `tail` rows; then only those are read and kept, so a
+    long session costs no more than its window. Messages this process inserts
+    are appended directly. The cache is capped at `max_bytes` of message JSON
+    and drops sessions idle for `ttl` seconds.
+    """
+
+    def __init__(self, enabled, max_bytes, ttl):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "deltas": 0, "misses": 0, "evictions": 0}
+
+    def load(self, cur, session_id, tail=None):
+        """
+        Messages of a session as (id, message) rows, oldest first: all of
+        them, or only the newest `tail`. None when the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+        cur.execute(_VERSION_QUERY, (session_id,))
+        last_id, count = cur.fetchone()
+        entry = self._get(session_id)
+        if entry is not None and entry.covers(tail):
+            if (entry.last_id, entry.count) == (last_id, count):
+                return self._hit(session_id, entry, tail)
+            if self._delta_fits(entry, last_id, count, tail):
+                cur.execute(_ROWS_AFTER_QUERY, (session_id, entry.last_id))
+                delta = cur.fetchall()
+                if entry.count + len(delta) == count:
+                    return self._extend(session_id, entry, delta, count, tail)
+        cur.execute(*self._fill_query(session_id, tail))
+        return self._fill(session_id, cur.fetchall(), count, tail)
+
+    async def aload(self, cur, session_id, tail=None):
+        """Async variant of load for an async cursor."""
+        if not self.enabled:
+            return None
+        await cur.execute(_VERSION_QUERY, (session_id,))
+        last_id, count = await cur.fetchone()
+        entry = self._get(session_id)
+        if entry is not None and entry.covers(tail):
+            if (entry.last_id, entry.count) == (last_id, count):
+                return self._hit(session_id, entry, tail)
+            if self._delta_fits(entry, last_id, count, tail):
+                await cur.execute(_ROWS_AFTER_QUERY, (session_id, entry.last_id))
+                delta = await cur.fetchall()
+                if entry.count + len(delta) == count:
+                    return self._extend(session_id, entry, delta, count, tail)
+        await cur.execute(*self._fill_query(session_id, tail))
+        return self._fill(session_id, await cur.fetchall(), count, tail)
+
+    def append(self, session_id, rows):
+        """
+        Add (id, message) rows this process has just committed.
+        Sessions that are not cached stay uncached until they are read.
+        """
+        if not self.enabled or not rows:
+            return
+        sizes = [len(json.dumps(message_to_dict(message))) for _, message in rows]
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or rows[0][0] <= entry.last_id:
+                return
+            self._store(session_id, _Entry(
+                entry.rows + list(rows), entry.sizes + sizes, rows[-1][0], entry.count + len(rows), entry.tail))
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._entries
+
+    def is_complete(self, session_id):
+        """Whether the whole session, not just its newest rows, is cached."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry is not None and entry.complete
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._entries), bytes=self._bytes)
+
+    def _get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._drop(session_id)
+                return None
+            return entry
+
+    @staticmethod
+    def _delta_fits(entry, last_id, count, tail):
+        # Only new rows, and (when a tail is wanted) not so many that re-reading the tail is cheaper
+        return last_id > entry.last_id and count > entry.count and (tail is None or count - entry.count <= tail)
+
+    @staticmethod
+    def _fill_query(session_id, tail):
+        if tail is None:
+            return _ROWS_AFTER_QUERY, (session_id, 0)
+        return _NEWEST_ROWS_QUERY, (session_id, tail)
+
+    def _hit(self, session_id, entry, tail):
+        self._count("hits", "hit")
+        with self._lock:
+            if self._entries.get(session_id) is entry:
+                entry.expires = time.monotonic() + self.ttl
+                self._entries.move_to_end(session_id)
+        return _newest(entry.rows, tail)
+
+    def _extend(self, session_id, entry, delta, count, tail):
+        self._count("deltas", "delta")
+        rows, sizes = _decode(delta)
+        # A whole-session entry stays whole; a tail entry keeps the larger of the two tails
+        keep = None if entry.tail is None or tail is None else max(entry.tail, tail)
+        extended = _Entry(entry.rows + rows, entry.sizes + sizes, rows[-1][0], count, keep)
+        with self._lock:
+            # Skip the store if another thread replaced the entry meanwhile
+            if self._entries.get(session_id) is entry:
+                self._store(session_id, extended)
+        return _newest(extended.rows, tail)
+
+    def _fill(self, session_id, raw_rows, count, tail):
+        self._count("misses", "miss")
+        if tail is not None:
+            # Read newest first
+            raw_rows = raw_rows[::-1]
+        rows, sizes = _decode(raw_rows)
+        with self._lock:
+            self._store(session_id, _Entry(rows, sizes, rows[-1][0] if rows else 0, count, tail))
+        return list(rows)
+
+    def _store(self, session_id, entry):
+        # Called with the lock held
+        self._drop(session_id)
+        if entry.size > self.max_bytes:
+            return
+        entry.expires = time.monotonic() + self.ttl
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        now = time.monotonic()
+        while self._bytes > self.max_bytes or (self._entries and next(iter(self._entries.values())).expires <= now):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop(self, session_id):
+        # Called with the lock held
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+    def _count(self, name, result):
+        with self._lock:
+            self._stats[name] += 1
+        history_cache_lookups.inc(result=result)
+
+
+history_cache = SessionHistoryCache(
+    enabled=HISTORY_CACHE_ENABLED,
+    max_bytes=HISTORY_CACHE_MAX_BYTES,
+    ttl=HISTORY_CACHE_TTL,
+)
@@ -0,0 +1,162 @@
+import json
+from psycopg import sql
+from langchain_core.messages import SystemMessage, messages_from_dict
+from db import get_async_connection, get_connection, table_name
+from history import PooledChatMessageHistory, get_session_history
+from history_buffer import history_buffer
+from history_cache import history_cache
+from config import (
+    summary_table_name, history_strategy,
+    HISTORY_STRATEGY, HISTORY_MAX_MESSAGES, HISTORY_MAX_TOKENS,
+    HISTORY_SUMMARY_ENABLED, HISTORY_SUMMARY_MIN_MESSAGES,
+)
+from metrics import span
+
+# Older messages are folded into the summary in batches of HISTORY_SUMMARY_MIN_MESSAGES,
+# so up to one batch less one may have left the window without being summarized yet
+_PENDING_MAX = HISTORY_SUMMARY_MIN_MESSAGES - 1 if HISTORY_SUMMARY_ENABLED else 0
+# Rows read for the prompt: the window plus those pending rows
+_CONTEXT_TAIL = HISTORY_MAX_MESSAGES + _PENDING_MAX
+
+
+def approx_tokens(message):
+    """Cheap token estimate (~4 characters per token) for the history budget."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return len(content) // 4 + 4
+
+def select_window(rows, max_messages=HISTORY_MAX_MESSAGES, max_tokens=HISTORY_MAX_TOKENS):
+    """
+    Keep the newest (id, message) rows that fit the message and token budget.
+    The latest message is always kept. Rows are in chronological order.
+    """
+    kept = []
+    used = 0
+    for row in reversed(rows[-max_messages:]):
+        cost = approx_tokens(row[1])
+        if max_tokens and kept and used + cost > max_tokens:
+            break
+        kept.append(row)
+        used += cost
+    kept.reverse()
+    return kept
+
+def context_window(rows, summarized_until):
+    """
+    select_window, extended back over rows that have left it but are not in
+    the summary yet, so nothing drops out of the prompt before it is summarized.
+    """
+    window = select_window(rows)
+    older = rows[:len(rows) - len(window)]
+    pending = [row for row in older if row[0] > summarized_until]
+    return (pending[-_PENDING_MAX:] if _PENDING_MAX else []) + window
+
+def _rows_to_messages(rows):
+    return [(row_id, messages_from_dict([message])[0]) for row_id, message in rows]
+
+def _recent_messages_query(session_id, limit):
+    query = sql.SQL(
+        "SELECT id, message FROM {table} WHERE session_id = %s ORDER BY id DESC LIMIT %s"
+    ).format(table=sql.Identifier(table_name))
+    return query, (session_id, limit)
+
+def load_recent_messages(cur, session_id, limit):
+    """Newest `limit` messages of a session as (id, message), oldest first."""
+    cur.execute(*_recent_messages_query(session_id, limit))
+    rows = cur.fetchall()
+    rows.reverse()
+    return _rows_to_messages(rows)
+
+async def aload_recent_messages(cur, session_id, limit):
+    """Async variant of load_recent_messages for an async cursor."""
+    await cur.execute(*_recent_messages_query(session_id, limit))
+    rows = await cur.fetchall()
+    rows.reverse()
+    return _rows_to_messages(rows)
+
+def load_messages_between(cur, session_id, after_id, before_id):
+    """Messages with after_id < id < before_id as (id, message), oldest first."""
+    cur.execute(
+        sql.SQL(
+            "SELECT id, message FROM {table} WHERE session_id = %s AND id > %s AND id < %s ORDER BY id"
+        ).format(table=sql.Identifier(table_name)),
+        (session_id, after_id, before_id)
+    )
+    return _rows_to_messages(cur.fetchall())
+
+def _summary_query(session_id):
+    query = sql.SQL(
+        "SELECT summary, summarized_until FROM {table} WHERE session_id = %s"
+    ).format(table=sql.Identifier(summary_table_name))
+    return query, (session_id,)
+
+def load_summary(cur, session_id):
+    """Return (summary, summarized_until) for a session, or (None, 0)."""
+    cur.execute(*_summary_query(session_id))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+async def aload_summary(cur, session_id):
+    """Async variant of load_summary for an async cursor."""
+    await cur.execute(*_summary_query(session_id))
+    row = await cur.fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+def save_summary(cur, session_id, summary, summarized_until):
+    """Upsert a session's summary; never moves summarized_until backwards."""
+    cur.execute(
+        sql.SQL("""
+            INSERT INTO {table} (session_id, summary, summarized_until, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (session_id)
+            DO UPDATE SET
+                summary = EXCLUDED.summary,
+                summarized_until = EXCLUDED.summarized_until,
+                updated_at = NOW()
+            WHERE {table}.summarized_until < EXCLUDED.summarized_until
+        """).format(table=sql.Identifier(summary_table_name)),
+        (session_id, summary, summarized_until)
+    )
+
+def _with_summary(summary, window):
+    messages = [message for _, message in window]
+    if summary:
+        messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+    return messages
+
+
+class WindowedChatMessageHistory(PooledChatMessageHistory):
+    """
+    Chat history for the LLM prompt: the newest messages that fit the
+    message/token budget, preceded by the session's rolling summary of
+    older turns and any messages not summarized yet. Writes go to the full
+    history as usual.
+    """
+
+    @property
+    def messages(self):
+        history_buffer.flush_session(self.session_id)
+        with span("history_load"), get_connection() as conn, conn.cursor() as cur:
+            summary, summarized_until = load_summary(cur, self.session_id)
+            rows = history_cache.load(cur, self.session_id, tail=_CONTEXT_TAIL)
+            if rows is None:
+                rows = load_recent_messages(cur, self.session_id, _CONTEXT_TAIL)
+            window = context_window(rows, summarized_until)
+        return _with_summary(summary, window)
+
+    async def aget_messages(self):
+        await history_buffer.aflush_session(self.session_id)
+        with span("history_load"):
+            async with get_async_connection() as conn, conn.cursor() as cur:
+                summary, summarized_until = await aload_summary(cur, self.session_id)
+                rows = await history_cache.aload(cur, self.session_id, tail=_CONTEXT_TAIL)
+                if rows is None:
+                    rows = await aload_recent_messages(cur, self.session_id, _CONTEXT_TAIL)
+                window = context_window(rows, summarized_until)
+        return _with_summary(summary, window)
+
+
+def get_context_history(session_id):
+    """History handed to RunnableWithMessageHistory, according to HISTORY_STRATEGY."""
+    if HISTORY_STRATEGY == history_strategy.WINDOW:
+        return WindowedChatMessageHistory(table_name, session_id)
+    return get_session_history(session_id)
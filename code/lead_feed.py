@@ -0,0 +1,197 @@
+import asyncio
+import queue
+import threading
+from datetime import datetime
+import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+from config import (
+    LEADS_STREAM_BATCH_WINDOW, LEADS_STREAM_MAX_CLIENTS, LEADS_STREAM_QUEUE_SIZE, get_database_url,
+    lead_notify_channel,
+)
+from db import get_connection
+from leads import LEAD_COLUMNS
+
+# Tells a client its feed may have gaps (listener reconnected, or the client fell behind),
+# so it should reload /leads
+RESET = ("reset", {"reason": "reload"})
+
+_CHANGED_LEADS_QUERY = sql.SQL("SELECT {columns} FROM chat_info WHERE id = ANY(%s) ORDER BY id").format(
+    columns=LEAD_COLUMNS)
+
+
+class LeadFeedFullError(Exception):
+    """This worker already serves the maximum number of /leads/stream clients."""
+
+    def __init__(self, message="Too many live lead feeds are open. Please try again later."):
+        super().__init__(message)
+
+
+def _json_ready(lead):
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in lead.items()}
+
+
+class _Subscription:
+    """A client's bounded queue of (event, data) pairs. A client that falls behind gets one RESET."""
+
+    def __init__(self, size):
+        self._queue = queue.Queue(maxsize=size)
+
+    def offer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(RESET)
+
+    def get(self, timeout):
+        """Next (event, data), or None after `timeout` seconds without one."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _AsyncSubscription:
+    """_Subscription for a client served on an event loop; offer() is called from the listener thread."""
+
+    def __init__(self, size, loop):
+        self._queue = asyncio.Queue(maxsize=size)
+        self._loop = loop
+
+    def offer(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # The loop has shut down; the client is gone
+            pass
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(RESET)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LeadFeed:
+    """
+    Fans chat_info changes out to /leads/stream clients.
+
+    A trigger on chat_info NOTIFYs the changed row id (see migrate.py). Each
+    process keeps one LISTEN connection, started with the first subscriber.
+    Ids that arrive within `batch_window` seconds are read back in one query
+    and every subscriber gets the changed rows. At most `max_subscribers`
+    clients are served at once; subscribe() raises LeadFeedFullError beyond that.
+    """
+
+    def __init__(self, channel, queue_size, batch_window, max_subscribers):
+        self.channel = channel
+        self.queue_size = queue_size
+        self.batch_window = batch_window
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {"notifications": 0, "published": 0, "reconnects": 0}
+
+    def subscribe(self):
+        return self._add(_Subscription(self.queue_size))
+
+    def asubscribe(self):
+        return self._add(_AsyncSubscription(self.queue_size, asyncio.get_running_loop()))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, lead_ids):
+        """Read the given leads and send them to every subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers or not lead_ids:
+            return
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(_CHANGED_LEADS_QUERY, (sorted(lead_ids),))
+            leads = [_json_ready(lead) for lead in cur.fetchall()]
+        for lead in leads:
+            for subscription in subscribers:
+                subscription.offer(("lead", lead))
+        with self._lock:
+            self._stats["published"] += len(leads)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscribers))
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def _add(self, subscription):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise LeadFeedFullError()
+            self._subscribers.add(subscription)
+            # Also restarts the listener in a forked worker, where the thread no longer runs
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._listen_loop, name="lead-feed", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def _reset_all(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(RESET)
+
+    def _listen_loop(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(get_database_url(), autocommit=True) as conn:
+                    conn.execute(sql.SQL("LISTEN {channel}").format(channel=sql.Identifier(self.channel)))
+                    print(f"[LEAD_FEED] Listening on '{self.channel}'")
+                    delay = 1.0
+                    self._listen(conn)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                print(f"[LEAD_FEED] Listener error, reconnecting in {delay:.0f}s: {e}")
+                with self._lock:
+                    self._stats["reconnects"] += 1
+                # Changes made while disconnected were missed
+                self._reset_all()
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            lead_ids = {int(notify.payload) for notify in conn.notifies(timeout=1.0, stop_after=1)}
+            if lead_ids:
+                # Gather whatever else arrives in the batch window into the same read
+                lead_ids.update(int(notify.payload) for notify in conn.notifies(timeout=self.batch_window))
+                with self._lock:
+                    self._stats["notifications"] += len(lead_ids)
+                self.publish(lead_ids)
+
+
+lead_feed = LeadFeed(
+    channel=lead_notify_channel,
+    queue_size=LEADS_STREAM_QUEUE_SIZE,
+    batch_window=LEADS_STREAM_BATCH_WINDOW,
+    max_subscribers=LEADS_STREAM_MAX_CLIENTS,
+)
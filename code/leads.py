@@ -1,31 +1,277 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Tuple
+from psycopg import ClientCursor, sql
 from psycopg.rows import dict_row
-from db import sync_connection  
+from db import get_connection
 from http import HTTPStatus
+from config import leads_page_default_limit, leads_export_batch_size, export_format, lead_stats_table_name, status_type
 
-def get_all_leads() -> Tuple[List[Dict[str, Any]], HTTPStatus]:
+# Columns returned for each lead (shared by the listing and the export)
+LEAD_COLUMNS = sql.SQL("""
+    id,
+    session_id,
+    COALESCE(contact_name, '') as name,
+    COALESCE(email, '') as email,
+    COALESCE(mobile, '') as mobile_number,
+    COALESCE(country, '') as country,
+    COALESCE(status, 'OPEN') as status,
+    COALESCE(remarks, '') as remarks,
+    COALESCE(request_type, '') as request_type,
+    created_at
+""")
+
+# "Has contact info" means we can reach the lead; must match the partial index in migrate.py
+HAS_CONTACT_CONDITION = sql.SQL("(email IS NOT NULL OR mobile IS NOT NULL)")
+
+
+def encode_cursor(created_at: datetime, lead_id: int) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of a lead."""
+    raw = json.dumps([created_at.isoformat(), lead_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        created_at, lead_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(lead_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def build_lead_filters(filters: Dict[str, Any]) -> Tuple[List[sql.Composable], List[Any]]:
+    """
+    Turn validated filters into SQL conditions and params.
+    Each condition lines up with one of the chat_info indexes so a filtered
+    page is an index range scan, not a table scan.
+    """
+    conditions, params = [], []
+    if filters.get("status"):
+        conditions.append(sql.SQL("COALESCE(status, 'OPEN') = %s"))
+        params.append(filters["status"])
+    if filters.get("request_type"):
+        conditions.append(sql.SQL("request_type = %s"))
+        params.append(filters["request_type"])
+    if filters.get("country"):
+        conditions.append(sql.SQL("lower(country) = lower(%s)"))
+        params.append(filters["country"])
+    if filters.get("created_from"):
+        conditions.append(sql.SQL("created_at >= %s"))
+        params.append(filters["created_from"])
+    if filters.get("created_to"):
+        conditions.append(sql.SQL("created_at < %s"))
+        params.append(filters["created_to"])
+    if filters.get("has_contact") is True:
+        conditions.append(HAS_CONTACT_CONDITION)
+    elif filters.get("has_contact") is False:
+        conditions.append(sql.SQL("NOT ") + HAS_CONTACT_CONDITION)
+    return conditions, params
+
+def _where(conditions: List[sql.Composable]) -> sql.Composable:
+    if not conditions:
+        return sql.SQL("")
+    return sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions)
+
+def estimate_lead_count(conn, filters: Dict[str, Any]) -> int:
     """
-    Retrieve all stored chat info records.
+    Planner's row estimate for the filtered leads, read from EXPLAIN, so the
+    dashboard gets a total without a COUNT(*) over the whole table.
     """
+    conditions, params = build_lead_filters(filters)
+    query = sql.SQL("EXPLAIN (FORMAT JSON) SELECT 1 FROM chat_info {where}").format(where=_where(conditions))
+    # EXPLAIN cannot take server-side parameters, so bind them client-side
+    with ClientCursor(conn) as cur:
+        cur.execute(query, params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def get_all_leads(filters: Dict[str, Any] = None, limit: int = leads_page_default_limit,
+                  cursor: str = None) -> Tuple[Dict[str, Any], HTTPStatus]:
+    """
+    Retrieve one page of stored chat info records, newest first.
+    Pages are keyset-paginated on (created_at, id): pass the returned
+    next_cursor back as `cursor` to get the following page.
+    """
+    filters = filters or {}
     try:
-        with sync_connection.cursor(row_factory=dict_row) as cur:
-            cur.execute("""
-                SELECT 
-                    session_id,
-                    COALESCE(contact_name, '') as name,
-                    COALESCE(email, '') as email,
-                    COALESCE(mobile, '') as mobile_number,
-                    COALESCE(country, '') as country,
-                    COALESCE(status, 'OPEN') as status,
-                    COALESCE(remarks, '') as remarks
-                FROM chat_info
-                ORDER BY created_at DESC;
-            """)
-            records = cur.fetchall()
-
-        return records, HTTPStatus.OK
+        conditions, params = build_lead_filters(filters)
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            conditions.append(sql.SQL("(created_at, id) < (%s, %s)"))
+            params.extend([cursor_created_at, cursor_id])
+
+        query = sql.SQL("""
+            SELECT {columns}
+            FROM chat_info
+            {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """).format(columns=LEAD_COLUMNS, where=_where(conditions))
+
+        with get_connection() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                # One extra row tells us whether there is another page
+                cur.execute(query, params + [limit + 1])
+                records = cur.fetchall()
+            total_estimate = estimate_lead_count(conn, filters)
+
+        has_more = len(records) > limit
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1]["created_at"], records[-1]["id"]) if has_more else None
+
+        return {
+            "leads": records,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "total_estimate": total_estimate
+        }, HTTPStatus.OK
 
     except Exception as e:
         print("Error fetching leads:", e)
         raise
 
+def _utc_day(value: datetime):
+    return value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+
+def build_stats_filters(filters: Dict[str, Any]) -> Tuple[List[sql.Composable], List[Any]]:
+    """
+    The /leads filters as conditions on the per-day stats table.
+    Dates apply by whole UTC day: created_from's day onwards, up to but not including created_to's day.
+    """
+    conditions, params = [], []
+    for column in ("status", "request_type"):
+        if filters.get(column):
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+            params.append(filters[column])
+    if filters.get("country"):
+        conditions.append(sql.SQL("country = lower(%s)"))
+        params.append(filters["country"])
+    if filters.get("created_from"):
+        conditions.append(sql.SQL("day >= %s"))
+        params.append(_utc_day(filters["created_from"]))
+    if filters.get("created_to"):
+        conditions.append(sql.SQL("day < %s"))
+        params.append(_utc_day(filters["created_to"]))
+    if filters.get("has_contact") is not None:
+        conditions.append(sql.SQL("has_contact = %s"))
+        params.append(filters["has_contact"])
+    return conditions, params
+
+def _new_counts():
+    return {"leads": 0, "with_contact": 0, "by_status": {status.value: 0 for status in status_type}}
+
+def _add_counts(counts, status, has_contact, leads):
+    counts["leads"] += leads
+    counts["by_status"][status] = counts["by_status"].get(status, 0) + leads
+    if has_contact:
+        counts["with_contact"] += leads
+
+def _with_rates(counts):
+    """Share of leads with contact info and in each status."""
+    total = counts["leads"]
+    rates = {"contact": counts["with_contact"] / total if total else 0.0}
+    rates.update({status.lower(): (leads / total if total else 0.0) for status, leads in counts["by_status"].items()})
+    counts["rates"] = {name: round(rate, 4) for name, rate in rates.items()}
+    return counts
+
+def get_lead_stats(filters: Dict[str, Any] = None, bucket: str = "day", group_by: str = None) -> Tuple[Dict[str, Any], HTTPStatus]:
+    """
+    Lead counts and conversion rates per time bucket, read from the per-day
+    stats table (kept current by a trigger on chat_info), so the cost depends
+    on the number of days and categories, never on the number of leads.
+    Countries are reported lowercased.
+    """
+    conditions, params = build_stats_filters(filters or {})
+    query = sql.SQL("""
+        SELECT date_trunc(%s, day)::date AS period, {group_value}, status, has_contact, SUM(leads)::bigint
+        FROM {table}
+        {where}
+        GROUP BY 1, 2, 3, 4
+        HAVING SUM(leads) > 0
+        ORDER BY 1
+    """).format(
+        group_value=sql.Identifier(group_by) if group_by else sql.SQL("NULL"),
+        table=sql.Identifier(lead_stats_table_name),
+        where=_where(conditions),
+    )
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, [bucket] + params)
+        rows = cur.fetchall()
+
+    totals, series, groups = _new_counts(), {}, {}
+    for period, group_value, status, has_contact, leads in rows:
+        _add_counts(totals, status, has_contact, leads)
+        _add_counts(series.setdefault(period, _new_counts()), status, has_contact, leads)
+        if group_by:
+            _add_counts(groups.setdefault(group_value, _new_counts()), status, has_contact, leads)
+
+    result = {
+        "bucket": bucket,
+        "totals": _with_rates(totals),
+        "series": [dict(_with_rates(counts), period=period.isoformat()) for period, counts in series.items()],
+    }
+    if group_by:
+        result["group_by"] = group_by
+        result["groups"] = sorted(
+            (dict(_with_rates(counts), value=value) for value, counts in groups.items()),
+            key=lambda group: -group["leads"]
+        )
+    return result, HTTPStatus.OK
+
+# Column order of the export files
+EXPORT_FIELDS = ["id", "session_id", "name", "email", "mobile_number", "country",
+                 "status", "remarks", "request_type", "created_at"]
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _format_export_batch(rows, file_format):
+    if file_format == export_format.NDJSON:
+        return "".join(
+            json.dumps({field: _export_value(row[field]) for field in EXPORT_FIELDS}, default=str) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_export_value(row[field]) for field in EXPORT_FIELDS])
+    return buffer.getvalue()
+
+def iter_leads_export(filters: Dict[str, Any], file_format: str, batch_size: int = leads_export_batch_size):
+    """
+    Yield every lead matching the filters as CSV or NDJSON text, one chunk per batch.
+    Rows come from a named (server-side) cursor, so memory use stays flat
+    however large chat_info grows.
+    """
+    conditions, params = build_lead_filters(filters)
+    query = sql.SQL("""
+        SELECT {columns}
+        FROM chat_info
+        {where}
+        ORDER BY created_at DESC, id DESC
+    """).format(columns=LEAD_COLUMNS, where=_where(conditions))
+
+    exported = 0
+    try:
+        with get_connection() as conn:
+            with conn.cursor(name="leads_export", row_factory=dict_row) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                if file_format == export_format.CSV:
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerow(EXPORT_FIELDS)
+                    yield buffer.getvalue()
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    exported += len(rows)
+                    yield _format_export_batch(rows, file_format)
+        print(f"[EXPORT] Exported {exported} leads as {file_format}")
+    except Exception as e:
+        print(f"[EXPORT] Error exporting leads after {exported} rows: {e}")
+        raise
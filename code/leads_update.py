@@ -1,4 +1,4 @@
-from db import sync_connection
+from db import get_connection
 
 def update_lead(session_id: str, status: str = None, remarks: str = None):
 
@@ -7,9 +7,7 @@ def update_lead(session_id: str, status: str = None, remarks: str = None):
     Returns: (updated_lead_dict, error_message, http_code)
     """
     try:
-        sync_connection.rollback()
-        
-        with sync_connection.cursor() as cur:
+        with get_connection() as conn, conn.cursor() as cur:
             insert_query = """
             INSERT INTO chat_info (
                 session_id,
@@ -34,7 +32,7 @@ def update_lead(session_id: str, status: str = None, remarks: str = None):
                 remarks
             ))
 
-            sync_connection.commit()            
+            conn.commit()            
             
             # Log what was updated
             updates = []
@@ -44,6 +42,52 @@ def update_lead(session_id: str, status: str = None, remarks: str = None):
             print(f"[DATABASE] Info updated for session {session_id}: {', '.join(updates) if updates else 'no new info'}")
     
     except Exception as e:
-        sync_connection.rollback()
         print(f"[DATABASE ERROR] Failed to update lead for {session_id}: {str(e)}")
         raise
+
+def update_leads(updates):
+    """
+    Apply many {session_id, status, remarks} updates with multi-row upserts,
+    in a single transaction. Later updates of the same session win, field by field.
+    Returns: {session_id: "created" | "updated"}
+    """
+    merged = {}
+    for update in updates:
+        current = merged.setdefault(update["session_id"], {"status": None, "remarks": None})
+        for field in ("status", "remarks"):
+            if update.get(field) is not None:
+                current[field] = update[field]
+
+    # New leads start as OPEN. Sessions sent without a status keep theirs, which
+    # EXCLUDED can't tell apart from an explicit OPEN, so they go in a second upsert
+    with_status = [session_id for session_id in merged if merged[session_id]["status"] is not None]
+    without_status = [session_id for session_id in merged if merged[session_id]["status"] is None]
+    results = {}
+    try:
+        with get_connection() as conn, conn.cursor() as cur:
+            for session_ids, status in ((with_status, "EXCLUDED.status"), (without_status, "chat_info.status")):
+                if not session_ids:
+                    continue
+                # One row per session: ON CONFLICT cannot touch the same row twice in a statement
+                cur.execute(f"""
+                INSERT INTO chat_info (session_id, status, remarks)
+                SELECT session_id, COALESCE(status, 'OPEN'), remarks
+                FROM unnest(%s::text[], %s::text[], %s::text[]) AS v(session_id, status, remarks)
+                ON CONFLICT (session_id)
+                DO UPDATE SET
+                    status = {status},
+                    remarks = COALESCE(EXCLUDED.remarks, chat_info.remarks)
+                RETURNING session_id, (xmax = 0) AS inserted
+                """, (
+                    session_ids,
+                    [merged[session_id]["status"] for session_id in session_ids],
+                    [merged[session_id]["remarks"] for session_id in session_ids],
+                ))
+                results.update((session_id, "created" if inserted else "updated") for session_id, inserted in cur.fetchall())
+
+        print(f"[DATABASE] Bulk update of {len(updates)} items applied to {len(results)} leads")
+        return results
+
+    except Exception as e:
+        print(f"[DATABASE ERROR] Failed to bulk update {len(updates)} leads: {str(e)}")
+        raise
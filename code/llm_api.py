@@ -1,87 +1,209 @@
-import os
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from langchain_groq import ChatGroq
-from config import GROQ_API_KEY, GROQ_MODEL_NAME, table_name, agent_type
-from system_prompt import get_sales_prompt, get_generic_prompt
-from db import sync_connection
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from conversation_processor.conversation_processor import process_conversation
+from langchain_core.messages import AIMessage, HumanMessage
+from llm_registry import llm_registry
+from conversation_processor.extraction_queue import extraction_queue
 from history import get_session_history
+from response_cache import response_cache
+from metrics import llm_callbacks
+from session_guard import session_lock, asession_lock, idempotency_store
 
 
-def get_groq_response(input_text, session_id, request_type):
-    
-    # Choose prompt based on request type
-    if request_type == agent_type.SALES:
-        system_prompt = get_sales_prompt()
-    else:
-        system_prompt = get_generic_prompt()
-    
-    # Rest of your existing code...
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{input}")
-    ])
-
-
+def get_groq_response(input_text, session_id, request_type, idempotency_key=None):
     """
     Generate a Groq LLM response using RunnableWithMessageHistory for chat memory.
-    
+    Turns of the same session run one at a time. With an idempotency key, a
+    repeated request gets the stored reply instead of a new turn.
+
     Args:
         input_text: User input text
         session_id: Session identifier
-        process_async: Whether to process conversation asynchronously (default: True)
+        request_type: Agent type (sales/generic) choosing the system prompt
+        idempotency_key: Optional client-supplied key identifying this request
     """
+    with session_lock(session_id):
+        if idempotency_key:
+            stored = idempotency_store.lookup(session_id, idempotency_key, input_text, request_type)
+            if stored is not None:
+                return stored
+        bot_response = _generate_response(input_text, session_id, request_type)
+        if idempotency_key:
+            idempotency_store.save(session_id, idempotency_key, input_text, request_type, bot_response)
+        return bot_response
+
+
+def _generate_response(input_text, session_id, request_type):
+    """One read-generate-write turn; the caller holds the session lock."""
+    # First-turn questions may already have a cached answer
+    cache_key = response_cache.lookup_key(request_type, input_text, session_id)
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            _save_cached_turn(input_text, cached_response, session_id, request_type)
+            return cached_response
+
+    # Compiled once per agent type and reused across turns
+    chain_with_history = llm_registry.get_chat_chain(request_type)
 
-
-    # Create the LLM
-    llm = ChatGroq(groq_api_key=GROQ_API_KEY, model=GROQ_MODEL_NAME)
-    # Create the chain
-    chain = prompt | llm
-    
-    # Wrap the chain with message history
-    chain_with_history = RunnableWithMessageHistory(
-        chain,
-        get_session_history,
-        input_messages_key="input",
-        history_messages_key="history",
-    )
-    
     # Configure the session
-    config = {"configurable": {"session_id": session_id}}
-    
+    config = {"configurable": {"session_id": session_id}, "callbacks": llm_callbacks("llm_call")}
+
     # Get response with history
     response = chain_with_history.invoke(
         {"input": input_text},
         config=config
     )
 
-
     bot_response = response.content
+    if cache_key:
+        response_cache.put(cache_key, request_type, bot_response)
 
+    # Hand contact-info extraction to the background workers so the reply is not held
+    _process_conversation_async(input_text, session_id, request_type)
+    return bot_response
 
-    # Handle conversation processing
-    # Process conversation asynchronously to avoid blocking the response
+
+def stream_groq_response(input_text, session_id, request_type, idempotency_key=None):
+    """
+    Stream the Groq reply as text chunks.
+    The completed exchange is saved to the session history when the stream
+    finishes, after which contact-info extraction is queued. The session
+    lock is held until the stream ends.
+    """
+    with session_lock(session_id):
+        if idempotency_key:
+            stored = idempotency_store.lookup(session_id, idempotency_key, input_text, request_type)
+            if stored is not None:
+                yield stored
+                return
+        parts = []
+        for chunk in _stream_response(input_text, session_id, request_type):
+            parts.append(chunk)
+            yield chunk
+        if idempotency_key:
+            idempotency_store.save(session_id, idempotency_key, input_text, request_type, "".join(parts))
+
+
+def _stream_response(input_text, session_id, request_type):
+    cache_key = response_cache.lookup_key(request_type, input_text, session_id)
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            _save_cached_turn(input_text, cached_response, session_id, request_type)
+            yield cached_response
+            return
+
+    chain_with_history = llm_registry.get_chat_chain(request_type)
+    config = {"configurable": {"session_id": session_id}, "callbacks": llm_callbacks("llm_call")}
+
+    parts = []
+    for chunk in chain_with_history.stream({"input": input_text}, config=config):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+
+    if cache_key:
+        response_cache.put(cache_key, request_type, "".join(parts))
     _process_conversation_async(input_text, session_id, request_type)
 
 
+async def aget_groq_response(input_text, session_id, request_type, idempotency_key=None):
+    """
+    Async variant of get_groq_response for the ASGI app: the LLM call and the
+    history reads/writes are awaited, so no thread is held during the round trip.
+    """
+    async with asession_lock(session_id):
+        if idempotency_key:
+            stored = await idempotency_store.alookup(session_id, idempotency_key, input_text, request_type)
+            if stored is not None:
+                return stored
+        bot_response = await _agenerate_response(input_text, session_id, request_type)
+        if idempotency_key:
+            await idempotency_store.asave(session_id, idempotency_key, input_text, request_type, bot_response)
+        return bot_response
+
+
+async def _agenerate_response(input_text, session_id, request_type):
+    cache_key, cached_response = await _alookup_cached_response(request_type, input_text, session_id)
+    if cached_response is not None:
+        await _asave_cached_turn(input_text, cached_response, session_id, request_type)
+        return cached_response
+
+    chain_with_history = llm_registry.get_chat_chain(request_type)
+    config = {"configurable": {"session_id": session_id}, "callbacks": llm_callbacks("llm_call")}
+    response = await chain_with_history.ainvoke({"input": input_text}, config=config)
 
+    bot_response = response.content
+    if cache_key:
+        await asyncio.to_thread(response_cache.put, cache_key, request_type, bot_response)
+    _process_conversation_async(input_text, session_id, request_type)
     return bot_response
 
 
+async def astream_groq_response(input_text, session_id, request_type, idempotency_key=None):
+    """Async variant of stream_groq_response, yielding text chunks."""
+    async with asession_lock(session_id):
+        if idempotency_key:
+            stored = await idempotency_store.alookup(session_id, idempotency_key, input_text, request_type)
+            if stored is not None:
+                yield stored
+                return
+        parts = []
+        async for chunk in _astream_response(input_text, session_id, request_type):
+            parts.append(chunk)
+            yield chunk
+        if idempotency_key:
+            await idempotency_store.asave(session_id, idempotency_key, input_text, request_type, "".join(parts))
+
+
+async def _astream_response(input_text, session_id, request_type):
+    cache_key, cached_response = await _alookup_cached_response(request_type, input_text, session_id)
+    if cached_response is not None:
+        await _asave_cached_turn(input_text, cached_response, session_id, request_type)
+        yield cached_response
+        return
+
+    chain_with_history = llm_registry.get_chat_chain(request_type)
+    config = {"configurable": {"session_id": session_id}, "callbacks": llm_callbacks("llm_call")}
+
+    parts = []
+    async for chunk in chain_with_history.astream({"input": input_text}, config=config):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+
+    if cache_key:
+        await asyncio.to_thread(response_cache.put, cache_key, request_type, "".join(parts))
+    _process_conversation_async(input_text, session_id, request_type)
+
+
+async def _alookup_cached_response(request_type, input_text, session_id):
+    """(cache_key, cached reply or None); the cache's blocking lookups run in a thread."""
+    if not response_cache.enabled:
+        return None, None
+    cache_key = await asyncio.to_thread(response_cache.lookup_key, request_type, input_text, session_id)
+    if not cache_key:
+        return None, None
+    return cache_key, await asyncio.to_thread(response_cache.get, cache_key)
+
+
+async def _asave_cached_turn(input_text, bot_response, session_id, request_type):
+    await get_session_history(session_id).aadd_messages([
+        HumanMessage(content=input_text),
+        AIMessage(content=bot_response)
+    ])
+    _process_conversation_async(input_text, session_id, request_type)
+
+
+def _save_cached_turn(input_text, bot_response, session_id, request_type):
+    """Record a turn answered from the response cache just like a generated one."""
+    get_session_history(session_id).add_messages([
+        HumanMessage(content=input_text),
+        AIMessage(content=bot_response)
+    ])
+    _process_conversation_async(input_text, session_id, request_type)
+
 
 def _process_conversation_async(input_text, session_id, request_type):
-    """Process conversation asynchronously using ThreadPoolExecutor."""
-    def process_in_background():
-        try:
-            process_conversation(input_text, session_id, request_type)
-            print("[LLM_API] Async conversation processing completed")
-        except Exception as processing_error:
-            print(f"[LLM_API] Warning: Async conversation processing failed: {processing_error}")
-    
-    # Submit to thread pool for background processing
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        executor.submit(process_in_background)
+    """Queue the conversation for background processing; returns immediately."""
+    if not extraction_queue.submit(input_text, session_id, request_type):
+        print(f"[LLM_API] Warning: extraction skipped for session {session_id} (queue full)")
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import threading
+import time
+import groq
+import httpx
+from langchain_groq import ChatGroq
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from config import (
+    GROQ_API_KEY, GROQ_MODEL_NAME, EXTRACTION_MODEL_NAME, agent_type,
+    LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE, LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_RELOAD_CHECK_INTERVAL, LLM_TIMEOUT, LLM_FALLBACK_MODELS, LLM_HEDGE_AFTER,
+)
+from system_prompt import (
+    PROMPT_PATHS, clear_prompt_cache, get_sales_prompt, get_generic_prompt,
+)
+from history_window import get_context_history
+from llm_scheduler import INTERACTIVE, BACKGROUND, schedule
+from llm_resilience import ResilientChatModel
+
+
+def _current_model_name():
+    return os.environ.get("GROQ_MODEL_NAME", GROQ_MODEL_NAME)
+
+def _chain_key(request_type):
+    # Anything that isn't the sales agent gets the generic agent
+    return agent_type.SALES.value if request_type == agent_type.SALES else agent_type.GENERIC.value
+
+def _model_names(*model_names):
+    """The given models followed by the configured fallbacks, without duplicates."""
+    return list(dict.fromkeys([*model_names, *LLM_FALLBACK_MODELS]))
+
+def _current_signature():
+    """What the cached objects were built from: model name and prompt file mtimes."""
+    return (_current_model_name(), tuple(os.path.getmtime(path) for path in PROMPT_PATHS))
+
+
+class LLMRegistry:
+    """
+    Process-level cache of the compiled chat chains (one per agent_type) and
+    the background clients (extraction, history summaries). All clients share one keep-alive HTTP connection
+    pool to the provider, so turns reuse warm TLS connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self._chains = {}
+        self._prompt_versions = {}
+        self._extraction_llm = None
+        self._summary_llm = None
+        self._signature = None
+        self._last_check = 0.0
+
+    def get_chat_chain(self, request_type):
+        """RunnableWithMessageHistory for the given agent type."""
+        self._refresh_if_changed()
+        key = _chain_key(request_type)
+        chain = self._chains.get(key)
+        if chain is None:
+            self._build()
+            chain = self._chains[key]
+        return chain
+
+    def get_prompt_version(self, request_type):
+        """Short hash of the system prompt and model behind an agent's chain."""
+        self.get_chat_chain(request_type)
+        return self._prompt_versions[_chain_key(request_type)]
+
+    def get_extraction_llm(self):
+        """Small model used for contact-info extraction, falling back to the chat model."""
+        self._refresh_if_changed()
+        if self._extraction_llm is None:
+            self._build()
+        return self._extraction_llm
+
+    def get_summary_llm(self):
+        """Chat model at background priority, used for rolling history summaries."""
+        self._refresh_if_changed()
+        if self._summary_llm is None:
+            self._build()
+        return self._summary_llm
+
+    def warm_up(self):
+        """Build everything up front so the first request doesn't pay for it."""
+        self._build()
+
+    def reload(self):
+        """Re-read the prompt files and model name and rebuild every chain."""
+        clear_prompt_cache()
+        with self._lock:
+            self._chains = {}
+            self._extraction_llm = None
+            self._summary_llm = None
+        self._build()
+        print(f"[LLM_REGISTRY] Rebuilt chains for model '{_current_model_name()}'")
+
+    def close(self):
+        """Close the shared HTTP client (used on shutdown)."""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            # The async client belongs to the event loop; aclose() releases it
+            self._async_http_client = None
+            self._chains = {}
+            self._extraction_llm = None
+            self._summary_llm = None
+
+    def reset_after_fork(self):
+        """
+        Drop clients inherited from a preloading parent process and rebuild
+        them, so each server worker gets its own HTTP connection pool.
+        The inherited client is not closed: its sockets belong to the parent.
+        """
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self._chains = {}
+        self._extraction_llm = None
+        self._summary_llm = None
+        self._build()
+
+    async def aclose(self):
+        """Close the async HTTP client (used on ASGI shutdown)."""
+        client, self._async_http_client = self._async_http_client, None
+        if client is not None:
+            await client.aclose()
+        self.close()
+
+    def _refresh_if_changed(self):
+        if LLM_RELOAD_CHECK_INTERVAL <= 0 or self._signature is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < LLM_RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        if _current_signature() != self._signature:
+            self.reload()
+
+    def _get_http_client(self):
+        if self._http_client is None:
+            self._http_client = groq.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                )
+            )
+        return self._http_client
+
+    def _get_async_http_client(self):
+        # Same keep-alive limits for ainvoke/astream on the async request path
+        if self._async_http_client is None:
+            self._async_http_client = groq.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                )
+            )
+        return self._async_http_client
+
+    def _new_llm(self, model_name):
+        return ChatGroq(
+            groq_api_key=GROQ_API_KEY,
+            model=model_name,
+            http_client=self._get_http_client(),
+            http_async_client=self._get_async_http_client(),
+            timeout=LLM_TIMEOUT,
+            # Retries are done by ResilientChatModel, which also records them
+            max_retries=0,
+        )
+
+    def _new_resilient_llm(self, model_names, priority, hedge_after=0.0):
+        candidates = [(name, schedule(self._new_llm(name), priority)) for name in _model_names(*model_names)]
+        return ResilientChatModel(candidates, hedge_after=hedge_after)
+
+    def _build(self):
+        with self._lock:
+            if self._chains and self._extraction_llm is not None:
+                return
+            signature = _current_signature()
+            model_name = signature[0]
+
+            chains = {}
+            prompt_versions = {}
+            for kind in agent_type:
+                system_prompt = get_sales_prompt() if kind == agent_type.SALES else get_generic_prompt()
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", system_prompt),
+                    MessagesPlaceholder(variable_name="history"),
+                    ("human", "{input}")
+                ])
+                prompt_versions[kind.value] = hashlib.sha256(
+                    f"{model_name}\n{system_prompt}".encode()).hexdigest()[:16]
+                chains[kind.value] = RunnableWithMessageHistory(
+                    prompt | self._new_resilient_llm([model_name], INTERACTIVE, hedge_after=LLM_HEDGE_AFTER),
+                    get_context_history,
+                    input_messages_key="input",
+                    history_messages_key="history",
+                )
+
+            self._chains = chains
+            self._prompt_versions = prompt_versions
+            self._extraction_llm = self._new_resilient_llm([EXTRACTION_MODEL_NAME, model_name], BACKGROUND)
+            self._summary_llm = self._new_resilient_llm([model_name], BACKGROUND)
+            self._signature = signature
+            self._last_check = time.monotonic()
+
+
+llm_registry = LLMRegistry()
@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Iterator, Optional
+import groq
+import httpx
+from langchain_core.runnables import Runnable, RunnableConfig
+from config import (
+    LLM_CALL_DEADLINE, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_MAX_CONCURRENCY,
+)
+from llm_scheduler import LLMBusyError
+from metrics import metrics_registry
+
+# Outcomes worth another attempt; anything else (bad request, auth, ...) moves on to the next model
+_RETRYABLE = ("timeout", "connection_error", "rate_limited", "server_error")
+
+llm_attempts_total = metrics_registry.counter(
+    "llm_attempts_total", "LLM provider attempts by model and outcome.", ("model", "outcome"))
+llm_attempt_duration_seconds = metrics_registry.histogram(
+    "llm_attempt_duration_seconds", "Duration of each LLM provider attempt.", ("model", "outcome"))
+llm_resilience_events_total = metrics_registry.counter(
+    "llm_resilience_events_total", "Retries, model fallbacks and hedged requests.", ("event",))
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def classify_error(error):
+    """Outcome label for a failed attempt."""
+    if isinstance(error, LLMBusyError):
+        return "busy"
+    # APITimeoutError is a subclass of APIConnectionError, so check it first
+    if isinstance(error, (groq.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(error, (groq.APIConnectionError, httpx.TransportError)):
+        return "connection_error"
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None and status >= 500:
+        return "server_error"
+    return "error"
+
+def retry_delay(retry):
+    """Exponential backoff with full jitter for the n-th retry (1-based)."""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (retry - 1)))
+
+def _record(model_name, outcome, started):
+    llm_attempts_total.inc(model=model_name, outcome=outcome)
+    llm_attempt_duration_seconds.observe(time.perf_counter() - started, model=model_name, outcome=outcome)
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-hedge")
+        return _hedge_executor
+
+
+class _AttemptPlan:
+    """
+    Order of attempts for one call: each model in turn, retrying retryable
+    errors up to `max_retries` times, until the call's deadline.
+    Yields (model name, model, seconds to sleep first).
+    """
+
+    def __init__(self, candidates, max_retries, deadline):
+        self._candidates = candidates
+        self._max_retries = max_retries
+        self._deadline = time.monotonic() + deadline
+        self._next_model = False
+        self.last_error = None
+
+    def __iter__(self):
+        for index, (model_name, llm) in enumerate(self._candidates):
+            if index:
+                llm_resilience_events_total.inc(event="fallback")
+                print(f"[LLM] Falling back to '{model_name}' after: {self.last_error}")
+            self._next_model = False
+            for retry in range(self._max_retries + 1):
+                if self._next_model:
+                    break
+                delay = retry_delay(retry) if retry else 0.0
+                # The first attempt always runs; later ones only while the deadline allows
+                if (index or retry) and time.monotonic() + delay >= self._deadline:
+                    return
+                if retry:
+                    llm_resilience_events_total.inc(event="retry")
+                yield model_name, llm, delay
+
+    def failed(self, error):
+        # The scheduler's "busy" is a decision, not a provider failure: don't retry around it
+        if isinstance(error, LLMBusyError):
+            raise error
+        self.last_error = error
+        if classify_error(error) not in _RETRYABLE:
+            self._next_model = True
+
+
+class ResilientChatModel(Runnable):
+    """
+    Calls a chat model with retries, an ordered list of fallback models and,
+    optionally, a hedged second request when the first is slow.
+    `candidates` is a list of (model name, model) tried in order; each model
+    is expected to carry its own per-attempt timeout.
+    Streams are only retried or switched to a fallback before the first chunk.
+    """
+
+    def __init__(self, candidates, hedge_after=0.0, max_retries=LLM_MAX_RETRIES, deadline=LLM_CALL_DEADLINE):
+        self.candidates = candidates
+        self.hedge_after = hedge_after
+        self.max_retries = max_retries
+        self.deadline = deadline
+
+    @property
+    def InputType(self):
+        return self.candidates[0][1].InputType
+
+    @property
+    def OutputType(self):
+        return self.candidates[0][1].OutputType
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        plan = _AttemptPlan(self.candidates, self.max_retries, self.deadline)
+        for model_name, llm, delay in plan:
+            time.sleep(delay)
+            try:
+                if self.hedge_after > 0:
+                    return self._hedged_invoke(model_name, llm, input, config, kwargs)
+                return self._invoke_once(model_name, llm, input, config, kwargs)
+            except Exception as e:
+                plan.failed(e)
+        raise plan.last_error
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        plan = _AttemptPlan(self.candidates, self.max_retries, self.deadline)
+        for model_name, llm, delay in plan:
+            await asyncio.sleep(delay)
+            try:
+                if self.hedge_after > 0:
+                    return await self._ahedged_invoke(model_name, llm, input, config, kwargs)
+                return await self._ainvoke_once(model_name, llm, input, config, kwargs)
+            except Exception as e:
+                plan.failed(e)
+        raise plan.last_error
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        plan = _AttemptPlan(self.candidates, self.max_retries, self.deadline)
+        for model_name, llm, delay in plan:
+            time.sleep(delay)
+            started = time.perf_counter()
+            streamed = False
+            try:
+                for chunk in llm.stream(input, config, **kwargs):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                _record(model_name, classify_error(e), started)
+                if streamed:
+                    raise
+                plan.failed(e)
+                continue
+            _record(model_name, "ok", started)
+            return
+        raise plan.last_error
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        plan = _AttemptPlan(self.candidates, self.max_retries, self.deadline)
+        for model_name, llm, delay in plan:
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            streamed = False
+            try:
+                async for chunk in llm.astream(input, config, **kwargs):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                _record(model_name, classify_error(e), started)
+                if streamed:
+                    raise
+                plan.failed(e)
+                continue
+            _record(model_name, "ok", started)
+            return
+        raise plan.last_error
+
+    def _invoke_once(self, model_name, llm, input, config, kwargs):
+        started = time.perf_counter()
+        try:
+            result = llm.invoke(input, config, **kwargs)
+        except Exception as e:
+            _record(model_name, classify_error(e), started)
+            raise
+        _record(model_name, "ok", started)
+        return result
+
+    async def _ainvoke_once(self, model_name, llm, input, config, kwargs):
+        started = time.perf_counter()
+        try:
+            result = await llm.ainvoke(input, config, **kwargs)
+        except Exception as e:
+            _record(model_name, classify_error(e), started)
+            raise
+        _record(model_name, "ok", started)
+        return result
+
+    def _hedged_invoke(self, model_name, llm, input, config, kwargs):
+        """
+        Send the request; if it hasn't answered after `hedge_after` seconds send
+        a second one and take whichever succeeds first. The slower thread is
+        left to finish on its own and its result is dropped.
+        """
+        executor = _get_hedge_executor()
+
+        def submit():
+            # Copy per attempt so the request's context (route label, ...) follows it
+            context = contextvars.copy_context()
+            return executor.submit(context.run, self._invoke_once, model_name, llm, input, config, kwargs)
+
+        primary = submit()
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        llm_resilience_events_total.inc(event="hedge_sent")
+        hedge = submit()
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is hedge:
+                    llm_resilience_events_total.inc(event="hedge_won")
+                return future.result()
+        raise error
+
+    async def _ahedged_invoke(self, model_name, llm, input, config, kwargs):
+        """Async hedging: same as _hedged_invoke, but the slower request is cancelled."""
+        primary = asyncio.ensure_future(self._ainvoke_once(model_name, llm, input, config, kwargs))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return primary.result()
+            llm_resilience_events_total.inc(event="hedge_sent")
+            hedge = asyncio.ensure_future(self._ainvoke_once(model_name, llm, input, config, kwargs))
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is hedge:
+                        llm_resilience_events_total.inc(event="hedge_won")
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,343 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional
+from langchain_core.runnables import Runnable, RunnableConfig
+from config import (
+    LLM_SCHEDULER_ENABLED, LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM, LLM_MAX_CONCURRENCY,
+    LLM_QUEUE_MAX_WAITING, LLM_EXPECTED_OUTPUT_TOKENS, LLM_RATE_LIMIT_BACKOFF,
+    LLM_INTERACTIVE_MAX_WAIT, LLM_BACKGROUND_MAX_WAIT,
+)
+from metrics import metrics_registry
+
+# Earlier in _PRIORITY_ORDER = served first: chat turns always go ahead of background work
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+_PRIORITY_ORDER = (INTERACTIVE, BACKGROUND)
+# How often async waiters re-check the buckets
+_ASYNC_POLL_INTERVAL = 0.05
+
+llm_wait_seconds = metrics_registry.histogram(
+    "llm_scheduler_wait_seconds", "Time LLM calls waited for an admission slot.", ("priority",))
+llm_rejected_total = metrics_registry.counter(
+    "llm_scheduler_rejected_total", "LLM calls turned away because the budget was exhausted.", ("priority",))
+
+
+class LLMBusyError(Exception):
+    """The LLM budget is exhausted and the call could not be admitted in time."""
+
+    def __init__(self, message="The assistant is busy right now. Please try again in a moment.", retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` per second up to one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (a request larger than the bucket waits for a full one)."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.available >= needed else (needed - self.available) / self.rate
+
+    def take(self, amount):
+        self.available -= amount
+
+
+def estimate_tokens(messages):
+    """Rough prompt size (~4 characters per token) plus the expected reply."""
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    if isinstance(messages, str):
+        text = messages
+    else:
+        text = "".join(str(getattr(message, "content", message)) for message in messages)
+    return len(text) // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+def _usage_tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class LLMScheduler:
+    """
+    Shared admission control for calls to the LLM provider: request and token
+    buckets sized to the provider quota, a concurrency cap and a bounded wait
+    queue. Interactive calls have strict priority: background calls are only
+    admitted while no interactive call is waiting. A provider 429 pauses
+    interactive calls for at most `interactive_max_pause` seconds, so one
+    rate-limit reply can't turn every chat turn away.
+    """
+
+    def __init__(self, rpm, tpm, max_concurrency, max_waiting, interactive_max_pause=LLM_INTERACTIVE_MAX_WAIT):
+        self._cond = threading.Condition()
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.interactive_max_pause = interactive_max_pause
+        self._in_flight = 0
+        self._waiting = {priority: 0 for priority in _PRIORITY_ORDER}
+        self._paused_until = {priority: 0.0 for priority in _PRIORITY_ORDER}
+        self._stats = {"admitted": 0, "rejected": 0, "rate_limited": 0}
+
+    def acquire(self, priority, tokens, timeout):
+        """Block until the call may go ahead; raises LLMBusyError after `timeout` seconds."""
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self._enter_queue(priority)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(priority, tokens, now)
+                    if wait == 0:
+                        self._grant(tokens)
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._reject(priority)
+                    # None: blocked by concurrency or priority, woken up by release()
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+        llm_wait_seconds.observe(time.monotonic() - started, priority=priority)
+
+    async def aacquire(self, priority, tokens, timeout):
+        """Async acquire: waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self._enter_queue(priority)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    wait = self._wait_time(priority, tokens, now)
+                    if wait == 0:
+                        self._grant(tokens)
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._reject(priority)
+                await asyncio.sleep(min(remaining, wait or _ASYNC_POLL_INTERVAL, _ASYNC_POLL_INTERVAL))
+        finally:
+            with self._cond:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+        llm_wait_seconds.observe(time.monotonic() - started, priority=priority)
+
+    def release(self, estimated_tokens, actual_tokens=None):
+        """Free the concurrency slot and correct the token bucket with the real usage."""
+        with self._cond:
+            self._in_flight -= 1
+            if self._tokens is not None and actual_tokens is not None:
+                self._tokens.take(actual_tokens - estimated_tokens)
+            self._cond.notify_all()
+
+    def backoff(self, seconds):
+        """The provider answered 429: admit nothing more for `seconds` (interactive calls: capped)."""
+        with self._cond:
+            now = time.monotonic()
+            for priority in _PRIORITY_ORDER:
+                pause = min(seconds, self.interactive_max_pause) if priority == INTERACTIVE else seconds
+                self._paused_until[priority] = max(self._paused_until[priority], now + pause)
+            self._stats["rate_limited"] += 1
+        print(f"[LLM_SCHEDULER] Provider rate limit hit, pausing for {seconds:.1f}s")
+
+    def would_admit(self, priority, timeout):
+        """Cheap pre-check so a request can answer "busy" before doing any other work."""
+        with self._cond:
+            wait = self._wait_time(priority, LLM_EXPECTED_OUTPUT_TOKENS, time.monotonic())
+            if wait == 0:
+                return True
+            # Only a call that would have to wait needs a place in the queue
+            if sum(self._waiting.values()) >= self.max_waiting:
+                return False
+            return wait is None or wait <= timeout
+
+    def reject(self, priority):
+        """Count a call turned away before it asked for a slot and raise LLMBusyError."""
+        with self._cond:
+            self._reject(priority)
+
+    @contextmanager
+    def slot(self, priority, tokens, timeout):
+        self.acquire(priority, tokens, timeout)
+        usage = {"tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage["tokens"])
+
+    @asynccontextmanager
+    async def aslot(self, priority, tokens, timeout):
+        await self.aacquire(priority, tokens, timeout)
+        usage = {"tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage["tokens"])
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._stats,
+                in_flight=self._in_flight,
+                waiting=dict(self._waiting),
+                available_requests=round(self._requests.available, 1) if self._requests else None,
+                available_tokens=round(self._tokens.available) if self._tokens else None,
+            )
+
+    def _enter_queue(self, priority):
+        # Over the cap, only a call that can go straight through is let in
+        if (sum(self._waiting.values()) >= self.max_waiting
+                and self._wait_time(priority, 0, time.monotonic()) != 0):
+            self._reject(priority)
+        self._waiting[priority] += 1
+
+    def _wait_time(self, priority, tokens, now):
+        """0 = go now, seconds = wait for the buckets, None = wait for a release."""
+        if self._in_flight >= self.max_concurrency:
+            return None
+        for higher in _PRIORITY_ORDER[:_PRIORITY_ORDER.index(priority)]:
+            if self._waiting[higher]:
+                return None
+        wait = max(0.0, self._paused_until[priority] - now)
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _grant(self, tokens):
+        self._in_flight += 1
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(tokens)
+        self._stats["admitted"] += 1
+
+    def _reject(self, priority):
+        self._stats["rejected"] += 1
+        llm_rejected_total.inc(priority=priority)
+        raise LLMBusyError()
+
+
+def _retry_after(error):
+    """Seconds to back off for a provider 429, or None for any other error."""
+    if getattr(error, "status_code", None) != 429:
+        return None
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(header)
+    except (TypeError, ValueError):
+        return LLM_RATE_LIMIT_BACKOFF
+
+
+class ScheduledChatModel(Runnable):
+    """
+    Runs a chat model through the shared scheduler at a fixed priority.
+    Drop-in for the model inside a chain: invoke, ainvoke, stream and astream
+    each take a slot for the duration of the provider call.
+    """
+
+    def __init__(self, llm, scheduler, priority, max_wait):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+        self.max_wait = max_wait
+
+    @property
+    def InputType(self):
+        return self.llm.InputType
+
+    @property
+    def OutputType(self):
+        return self.llm.OutputType
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tokens = estimate_tokens(input)
+        with self.scheduler.slot(self.priority, tokens, self.max_wait) as usage:
+            try:
+                result = self.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                self._on_error(e)
+                raise
+            usage["tokens"] = _usage_tokens(result)
+            return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tokens = estimate_tokens(input)
+        async with self.scheduler.aslot(self.priority, tokens, self.max_wait) as usage:
+            try:
+                result = await self.llm.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                self._on_error(e)
+                raise
+            usage["tokens"] = _usage_tokens(result)
+            return result
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        tokens = estimate_tokens(input)
+        with self.scheduler.slot(self.priority, tokens, self.max_wait) as usage:
+            try:
+                for chunk in self.llm.stream(input, config, **kwargs):
+                    usage["tokens"] = _usage_tokens(chunk) or usage["tokens"]
+                    yield chunk
+            except Exception as e:
+                self._on_error(e)
+                raise
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        tokens = estimate_tokens(input)
+        async with self.scheduler.aslot(self.priority, tokens, self.max_wait) as usage:
+            try:
+                async for chunk in self.llm.astream(input, config, **kwargs):
+                    usage["tokens"] = _usage_tokens(chunk) or usage["tokens"]
+                    yield chunk
+            except Exception as e:
+                self._on_error(e)
+                raise
+
+    def _on_error(self, error):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            self.scheduler.backoff(retry_after)
+
+
+def check_admission(priority=INTERACTIVE):
+    """Raise LLMBusyError right away when a new call would not be admitted in time."""
+    if not LLM_SCHEDULER_ENABLED:
+        return
+    max_wait = LLM_INTERACTIVE_MAX_WAIT if priority == INTERACTIVE else LLM_BACKGROUND_MAX_WAIT
+    if not llm_scheduler.would_admit(priority, max_wait):
+        llm_scheduler.reject(priority)
+
+def schedule(llm, priority):
+    """Wrap a chat model in the shared scheduler (returned unchanged when scheduling is off)."""
+    if not LLM_SCHEDULER_ENABLED:
+        return llm
+    max_wait = LLM_INTERACTIVE_MAX_WAIT if priority == INTERACTIVE else LLM_BACKGROUND_MAX_WAIT
+    return ScheduledChatModel(llm, llm_scheduler, priority, max_wait)
+
+
+llm_scheduler = LLMScheduler(
+    rpm=LLM_RATE_LIMIT_RPM,
+    tpm=LLM_RATE_LIMIT_TPM,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_waiting=LLM_QUEUE_MAX_WAITING,
+)
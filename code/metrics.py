@@ -0,0 +1,270 @@
+import bisect
+import contextvars
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from config import METRICS_ENABLED
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers millisecond DB reads up to multi-second LLM turns
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for thread-safe, labelled metrics rendered in Prometheus text format."""
+    type_name = ""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self._header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, key)))} {_format_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_number(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_number(float(total))}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The process's metrics plus collectors that refresh gauges just before a scrape."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def add_collector(self, collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"[METRICS] Collector failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+metrics_registry = MetricsRegistry()
+
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+http_request_errors_total = metrics_registry.counter(
+    "http_request_errors_total", "HTTP requests that ended in a 5xx response.", ("route",))
+http_request_duration_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("route", "method"))
+http_requests_in_flight = metrics_registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.", ("route",))
+stage_duration_seconds = metrics_registry.histogram(
+    "chat_stage_duration_seconds",
+    "Time spent in each stage of a chat turn and its background processing.", ("stage",))
+stage_errors_total = metrics_registry.counter(
+    "chat_stage_errors_total", "Stages that raised an error.", ("stage",))
+llm_tokens_total = metrics_registry.counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM provider.", ("stage", "kind"))
+db_queries_total = metrics_registry.counter(
+    "db_queries_total", "SQL statements executed, by the route that issued them.", ("route",))
+extraction_queue_depth = metrics_registry.gauge(
+    "extraction_queue_depth", "Conversations waiting for contact-info extraction.")
+extraction_jobs_in_flight = metrics_registry.gauge(
+    "extraction_jobs_in_flight", "Extraction jobs currently running.")
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stage_duration_seconds.observe(time.perf_counter() - self.started, stage=self.stage)
+        if exc_type is not None:
+            stage_errors_total.inc(stage=self.stage)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(stage):
+    """
+    Time a block as one stage of a chat turn:
+    `with span("history_load"): ...`. A shared no-op when metrics are disabled.
+    """
+    return _Span(stage) if METRICS_ENABLED else _NOOP_SPAN
+
+# Route of the request being served; "background" for the extraction workers
+current_route = contextvars.ContextVar("current_route", default="background")
+
+def record_request(route, method, status, duration):
+    """Record one finished HTTP request."""
+    http_requests_total.inc(route=route, method=method, status=status)
+    http_request_duration_seconds.observe(duration, route=route, method=method)
+    if status >= 500:
+        http_request_errors_total.inc(route=route)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain callback that times prompt building and the LLM call of a run
+    and counts the tokens used. `stage` names the LLM call ("llm_call",
+    "extraction_llm", ...).
+    """
+    # Called on the caller's thread, also for ainvoke/astream
+    run_inline = True
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._started = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        if kwargs.get("name") == "ChatPromptTemplate":
+            self._started[run_id] = time.perf_counter()
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            stage_duration_seconds.observe(time.perf_counter() - started, stage="prompt_build")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            stage_duration_seconds.observe(time.perf_counter() - started, stage=self.stage)
+        input_tokens, output_tokens = _token_usage(response)
+        if input_tokens:
+            llm_tokens_total.inc(input_tokens, stage=self.stage, kind="prompt")
+        if output_tokens:
+            llm_tokens_total.inc(output_tokens, stage=self.stage, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        stage_errors_total.inc(stage=self.stage)
+
+
+def _token_usage(response):
+    """(prompt tokens, completion tokens) from an LLMResult, 0 when not reported."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+def llm_callbacks(stage):
+    """Callbacks to pass in a run's config so its LLM stages are measured."""
+    return [LLMMetricsCallback(stage)] if METRICS_ENABLED else []
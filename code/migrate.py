@@ -0,0 +1,337 @@
+import time
+import psycopg
+from langchain_postgres import PostgresChatMessageHistory
+from config import (
+    get_database_url, get_db_name, table_name, summary_table_name, response_cache_table_name, job_table_name,
+    idempotency_table_name, lead_notify_channel, lead_stats_table_name,
+)
+
+# Schema setup, run once per deploy (`python migrate.py`) instead of on every import.
+# Every statement is idempotent, so re-running it is safe.
+
+def ensure_database_exists(DATABASE_URL, db_name):
+    """
+    Connect to the 'postgres' system database. Create db_name if not exists.
+    """
+    # Parse from URL for creation
+    base_url = DATABASE_URL.rsplit('/', 1)[0]
+    postgres_url = f"{base_url}/postgres"
+        
+    # First, ensure the database exists
+
+    with psycopg.connect(postgres_url) as temp_conn:
+        temp_conn.autocommit = True
+        with temp_conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+            if not cur.fetchone():
+                cur.execute(f'CREATE DATABASE "{db_name}"')
+                print(f"Database '{db_name}' created successfully.")
+            else:
+                print(f"Database '{db_name}' already exists.")
+
+
+def ensure_chat_table_exists(conn, table_name):
+    """
+    Use LangChain's helper to make sure the chat history table exists.
+    """
+    PostgresChatMessageHistory.create_tables(conn, table_name)
+    # Backs the keyset-paginated history reads (WHERE session_id = ? AND id < ? ORDER BY id)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_session_id_id ON {table_name} (session_id, id);")
+    conn.commit()
+    print(f"Table '{table_name}' created or verified.")
+
+
+def ensure_history_summary_table_exists(conn, summary_table_name):
+    """
+    Create the table holding each session's rolling summary of older turns.
+    summarized_until is the last chat message id folded into the summary.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {summary_table_name} (
+                session_id UUID PRIMARY KEY,
+                summary TEXT NOT NULL,
+                summarized_until BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+    conn.commit()
+    print(f"Table '{summary_table_name}' created or verified.")
+
+
+def ensure_response_cache_table_exists(conn, response_cache_table_name):
+    """
+    Create the shared tier of the LLM response cache.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {response_cache_table_name} (
+                cache_key TEXT PRIMARY KEY,
+                agent_type TEXT NOT NULL,
+                response TEXT NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_{response_cache_table_name}_expires_at
+            ON {response_cache_table_name} (expires_at);
+        """)
+    conn.commit()
+    print(f"Table '{response_cache_table_name}' created or verified.")
+
+
+def ensure_job_table_exists(conn, job_table_name):
+    """
+    Create the durable queue of contact-info extraction jobs.
+    Finished jobs are deleted; jobs that ran out of attempts stay with status 'dead'.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {job_table_name} (
+                id BIGSERIAL PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                request_type TEXT,
+                user_input TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                locked_until TIMESTAMPTZ,
+                last_error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+
+            -- Claiming: oldest ready job first
+            CREATE INDEX IF NOT EXISTS idx_{job_table_name}_pending
+            ON {job_table_name} (id) WHERE status = 'pending';
+
+            -- Per-session ordering: is an earlier job of this session still unfinished?
+            CREATE INDEX IF NOT EXISTS idx_{job_table_name}_session_unfinished
+            ON {job_table_name} (session_id, id) WHERE status IN ('pending', 'running');
+        """)
+    conn.commit()
+    print(f"Table '{job_table_name}' created or verified.")
+
+
+def ensure_idempotency_table_exists(conn, idempotency_table_name):
+    """
+    Create the table of chat replies stored per (session, Idempotency-Key),
+    so a retried request gets the original reply instead of a new LLM call.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {idempotency_table_name} (
+                session_id TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL,
+                request_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (session_id, idempotency_key)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_{idempotency_table_name}_created_at
+            ON {idempotency_table_name} (created_at);
+        """)
+    conn.commit()
+    print(f"Table '{idempotency_table_name}' created or verified.")
+
+
+def ensure_summaries_table_exists(conn):
+    """
+    Create the chat_info table for storing lead information and summaries.
+    """
+    try:
+        with conn.cursor() as cur:
+            # Create the chat_info table
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS chat_info (
+                id SERIAL PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                contact_name TEXT,
+                email TEXT,
+                mobile TEXT,
+                country TEXT,
+                request_type TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                metadata JSONB DEFAULT '{}',
+                
+                -- Add constraint to prevent duplicate summaries for same session
+                UNIQUE(session_id)
+            );
+            
+            -- Create indexes for efficient querying
+            CREATE INDEX IF NOT EXISTS idx_chat_info_session_id 
+            ON chat_info(session_id);
+            
+            
+            CREATE INDEX IF NOT EXISTS idx_chat_info_created_at 
+            ON chat_info(created_at);
+            """
+            
+            cur.execute(create_table_query)
+
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS contact_name TEXT;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS email TEXT;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS country TEXT;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS mobile TEXT;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS request_type TEXT;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP;")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS metadata JSONB DEFAULT '{}'::jsonb;")
+
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'OPEN';")
+            cur.execute("ALTER TABLE chat_info ADD COLUMN IF NOT EXISTS remarks TEXT;")
+
+            # Keyset pagination needs a non-null created_at on every row
+            cur.execute("UPDATE chat_info SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;")
+            cur.execute("ALTER TABLE chat_info ALTER COLUMN created_at SET NOT NULL;")
+
+            # Indexes for the /leads listing: each filter leads into the (created_at, id) keyset order
+            cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_info_created_at_id
+            ON chat_info (created_at DESC, id DESC);
+
+            CREATE INDEX IF NOT EXISTS idx_chat_info_status_created_at
+            ON chat_info ((COALESCE(status, 'OPEN')), created_at DESC, id DESC);
+
+            CREATE INDEX IF NOT EXISTS idx_chat_info_request_type_created_at
+            ON chat_info (request_type, created_at DESC, id DESC);
+
+            CREATE INDEX IF NOT EXISTS idx_chat_info_country_created_at
+            ON chat_info ((lower(country)), created_at DESC, id DESC);
+
+            CREATE INDEX IF NOT EXISTS idx_chat_info_has_contact_created_at
+            ON chat_info (created_at DESC, id DESC)
+            WHERE email IS NOT NULL OR mobile IS NOT NULL;
+            """)
+
+            conn.commit()
+            print("Table 'chat_info' created/verified successfully.")
+            
+    except Exception as e:
+        conn.rollback()
+        print(f"Error creating chat_info table: {e}")
+
+def ensure_lead_notify_trigger_exists(conn, lead_notify_channel):
+    """
+    NOTIFY lead_notify_channel with the row id whenever a chat_info row is
+    inserted or changed, for the live lead feed (/leads/stream).
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION notify_chat_info_change() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' AND OLD IS NOT DISTINCT FROM NEW THEN
+                    RETURN NULL;
+                END IF;
+                PERFORM pg_notify('{lead_notify_channel}', NEW.id::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS chat_info_notify ON chat_info;
+            CREATE TRIGGER chat_info_notify
+            AFTER INSERT OR UPDATE ON chat_info
+            FOR EACH ROW EXECUTE FUNCTION notify_chat_info_change();
+        """)
+    conn.commit()
+    print(f"Trigger 'chat_info_notify' created or verified (channel '{lead_notify_channel}').")
+
+
+def ensure_lead_stats_table_exists(conn, lead_stats_table_name):
+    """
+    Create the per-day lead counts behind /leads/stats and the chat_info trigger
+    that keeps them current in the same transaction as every insert, update and delete.
+    The table is filled from chat_info once, when it or the trigger is first
+    created; later runs only refresh the trigger function and take no lock on chat_info.
+    """
+    # Bucket of a chat_info row: (day, status, request_type, country, has_contact)
+    def key(row):
+        return (f"({row}.created_at AT TIME ZONE 'UTC')::date, COALESCE({row}.status, 'OPEN'), "
+                f"COALESCE({row}.request_type, ''), lower(COALESCE({row}.country, '')), "
+                f"{row}.email IS NOT NULL OR {row}.mobile IS NOT NULL")
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NULL", (lead_stats_table_name,))
+        created = cur.fetchone()[0]
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {lead_stats_table_name} (
+                day DATE NOT NULL,
+                status TEXT NOT NULL,
+                request_type TEXT NOT NULL,
+                country TEXT NOT NULL,
+                has_contact BOOLEAN NOT NULL,
+                leads BIGINT NOT NULL,
+                PRIMARY KEY (day, status, request_type, country, has_contact)
+            );
+
+            CREATE OR REPLACE FUNCTION {lead_stats_table_name}_track() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' AND ({key('OLD')}) IS NOT DISTINCT FROM ({key('NEW')}) THEN
+                    RETURN NULL;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE {lead_stats_table_name} SET leads = leads - 1
+                    WHERE (day, status, request_type, country, has_contact) = ({key('OLD')});
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {lead_stats_table_name} (day, status, request_type, country, has_contact, leads)
+                    VALUES ({key('NEW')}, 1)
+                    ON CONFLICT (day, status, request_type, country, has_contact)
+                    DO UPDATE SET leads = {lead_stats_table_name}.leads + 1;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        trigger_exists = ("SELECT 1 FROM pg_trigger "
+                          "WHERE tgrelid = 'chat_info'::regclass AND tgname = 'chat_info_lead_stats'")
+        cur.execute(trigger_exists)
+        if created or cur.fetchone() is None:
+            # Trigger and backfill together, with writers paused, so no row is counted twice or missed
+            cur.execute("LOCK TABLE chat_info IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute(trigger_exists)
+            if cur.fetchone() is None:
+                cur.execute(f"""
+                    CREATE TRIGGER chat_info_lead_stats
+                    AFTER INSERT OR UPDATE OR DELETE ON chat_info
+                    FOR EACH ROW EXECUTE FUNCTION {lead_stats_table_name}_track();
+                """)
+            cur.execute(f"""
+                DELETE FROM {lead_stats_table_name};
+                INSERT INTO {lead_stats_table_name} (day, status, request_type, country, has_contact, leads)
+                SELECT {key('chat_info')}, COUNT(*)
+                FROM chat_info
+                GROUP BY 1, 2, 3, 4, 5;
+            """)
+            print(f"Filled '{lead_stats_table_name}' from chat_info.")
+    conn.commit()
+    print(f"Table '{lead_stats_table_name}' created or verified.")
+
+
+def run_migrations():
+    """
+    Create the database if needed and bring every table and index up to date.
+    Uses its own short-lived connections, not the application pool.
+    """
+    started = time.perf_counter()
+    database_url = get_database_url()
+    try:
+        ensure_database_exists(database_url, get_db_name())
+
+        with psycopg.connect(database_url) as conn:
+            ensure_chat_table_exists(conn, table_name)
+            ensure_summaries_table_exists(conn)
+            ensure_history_summary_table_exists(conn, summary_table_name)
+            ensure_response_cache_table_exists(conn, response_cache_table_name)
+            ensure_job_table_exists(conn, job_table_name)
+            ensure_idempotency_table_exists(conn, idempotency_table_name)
+            ensure_lead_notify_trigger_exists(conn, lead_notify_channel)
+            ensure_lead_stats_table_exists(conn, lead_stats_table_name)
+    except Exception as e:
+        print(f"Error setting up database: {e}")
+        raise
+    print(f"[MIGRATE] Schema is up to date ({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    run_migrations()
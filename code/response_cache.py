@@ -0,0 +1,171 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from psycopg import sql
+from db import get_connection, table_name
+from history_buffer import history_buffer
+from config import (
+    first_chat_message, response_cache_table_name,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_AGENTS, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_SHARED,
+)
+from llm_registry import llm_registry
+
+# Expired rows in the shared tier are swept every this many stores
+_SHARED_CLEANUP_EVERY = 100
+
+
+def normalize_input(text):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share an entry."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class ResponseCache:
+    """
+    Cache of first-turn replies keyed on (agent type, prompt version,
+    normalized input). An in-process LRU with TTL sits in front of an
+    optional Postgres table shared by all workers.
+    """
+
+    def __init__(self, enabled, agents, ttl, max_entries, shared):
+        self.enabled = enabled
+        self.agents = set(agents)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+        self._stats = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "ineligible": 0,
+        }
+
+    def lookup_key(self, request_type, input_text, session_id):
+        """
+        Cache key for this turn, or None when the turn can't use the cache:
+        caching is off, the agent opted out, or the session already has
+        history beyond the welcome message.
+        """
+        if not self.enabled or request_type not in self.agents:
+            return None
+        if not self._is_first_turn(session_id):
+            self._count("ineligible")
+            return None
+        version = llm_registry.get_prompt_version(request_type)
+        raw = f"{request_type}\n{version}\n{normalize_input(input_text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached reply for the key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._entries[key]
+
+        if self.shared:
+            response = self._get_shared(key)
+            if response is not None:
+                self._remember(key, response)
+                self._count("shared_hits")
+                return response
+
+        self._count("misses")
+        return None
+
+    def put(self, key, request_type, response):
+        """Store a freshly generated reply in both tiers."""
+        self._remember(key, response)
+        self._count("stores")
+        if self.shared:
+            try:
+                self._put_shared(key, request_type, response)
+            except Exception as e:
+                print(f"[RESPONSE_CACHE] Could not store shared entry: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _is_first_turn(self, session_id):
+        # Two rows are enough to tell "empty or only the welcome message" apart from a real conversation
+        history_buffer.flush_session(session_id)
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT message FROM {table} WHERE session_id = %s ORDER BY id LIMIT 2").format(
+                    table=sql.Identifier(table_name)),
+                (session_id,)
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return True
+        if len(rows) > 1:
+            return False
+        message = rows[0][0]
+        return message.get("type") == "ai" and message.get("data", {}).get("content") == first_chat_message
+
+    def _get_shared(self, key):
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL("SELECT response FROM {table} WHERE cache_key = %s AND expires_at > NOW()").format(
+                        table=sql.Identifier(response_cache_table_name)),
+                    (key,)
+                )
+                row = cur.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"[RESPONSE_CACHE] Shared lookup failed: {e}")
+            return None
+
+    def _put_shared(self, key, request_type, response):
+        table = sql.Identifier(response_cache_table_name)
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    INSERT INTO {table} (cache_key, agent_type, response, expires_at)
+                    VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+                    ON CONFLICT (cache_key)
+                    DO UPDATE SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at
+                """).format(table=table),
+                (key, request_type, response, self.ttl)
+            )
+            with self._lock:
+                self._stores += 1
+                sweep = self._stores % _SHARED_CLEANUP_EVERY == 0
+            if sweep:
+                cur.execute(sql.SQL("DELETE FROM {table} WHERE expires_at <= NOW()").format(table=table))
+
+
+response_cache = ResponseCache(
+    enabled=RESPONSE_CACHE_ENABLED,
+    agents=RESPONSE_CACHE_AGENTS,
+    ttl=RESPONSE_CACHE_TTL,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    shared=RESPONSE_CACHE_SHARED,
+)
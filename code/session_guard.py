@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import psycopg
+from psycopg import sql
+from config import (
+    SESSION_LOCK, SESSION_LOCK_TIMEOUT, IDEMPOTENCY_TTL, idempotency_table_name, session_lock_mode,
+    get_database_url,
+)
+from db import get_connection
+
+# Expired idempotency rows are swept once every this many stored replies
+_IDEMPOTENCY_CLEANUP_EVERY = 100
+
+_TRY_ADVISORY_LOCK_QUERY = "SELECT pg_try_advisory_lock(hashtextextended(%s, 0))"
+_ADVISORY_UNLOCK_QUERY = "SELECT pg_advisory_unlock(hashtextextended(%s, 0))"
+# How often a turn retries a session lock held by another process
+_ADVISORY_LOCK_POLL_INTERVAL = 0.05
+
+
+class SessionBusyError(Exception):
+    """Another turn for the same session did not finish within the lock timeout."""
+
+    def __init__(self, message="Another message for this session is still being processed. Please try again."):
+        super().__init__(message)
+
+
+class IdempotencyKeyReusedError(Exception):
+    """An Idempotency-Key was sent again with a different message."""
+
+    def __init__(self, message="This Idempotency-Key was already used for a different message."):
+        super().__init__(message)
+
+
+class _SessionLocks:
+    """Per-session locks, created on demand and dropped when nobody holds or waits for them."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def checkout(self, session_id):
+        with self._guard:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [self._factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def checkin(self, session_id):
+        with self._guard:
+            entry = self._locks[session_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+
+class _AdvisoryLocks:
+    """
+    Session-level advisory locks, all held on one autocommit connection per
+    process. Turns in this process are already serialized per session by
+    _SessionLocks, so the shared connection only ever holds distinct keys.
+    No pooled connection or open transaction is kept for the length of a turn.
+    If the connection drops, Postgres releases its locks and the next call reconnects.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._conn = None
+
+    def try_lock(self, session_id):
+        """Take the session's lock if it is free; never waits."""
+        with self._guard:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg.connect(get_database_url(), autocommit=True)
+            try:
+                return self._conn.execute(_TRY_ADVISORY_LOCK_QUERY, (session_id,)).fetchone()[0]
+            except psycopg.OperationalError:
+                self._discard()
+                raise
+
+    def unlock(self, session_id):
+        with self._guard:
+            if self._conn is None or self._conn.closed:
+                # The lock went away with the connection
+                return
+            try:
+                self._conn.execute(_ADVISORY_UNLOCK_QUERY, (session_id,))
+            except psycopg.OperationalError as e:
+                print(f"[SESSION_LOCK] Lost the advisory lock connection: {e}")
+                self._discard()
+
+    def close(self):
+        with self._guard:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+    def reset_after_fork(self):
+        """Forget a connection inherited from the parent process; its locks belong to the parent."""
+        self._guard = threading.Lock()
+        self._conn = None
+
+    def _discard(self):
+        # Called with the guard held
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+_thread_locks = _SessionLocks(threading.Lock)
+# Only used from the event loop of the async app
+_async_locks = _SessionLocks(asyncio.Lock)
+advisory_locks = _AdvisoryLocks()
+
+@contextmanager
+def session_lock(session_id, timeout=SESSION_LOCK_TIMEOUT):
+    """
+    Hold the session's lock for one read-generate-write turn.
+    Raises SessionBusyError if it is not free within `timeout` seconds.
+    """
+    mode = session_lock_mode(SESSION_LOCK)
+    if mode == session_lock_mode.OFF:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    lock = _thread_locks.checkout(session_id)
+    try:
+        if not lock.acquire(timeout=timeout):
+            raise SessionBusyError()
+        try:
+            if mode == session_lock_mode.POSTGRES:
+                while not advisory_locks.try_lock(session_id):
+                    if time.monotonic() >= deadline:
+                        raise SessionBusyError()
+                    time.sleep(_ADVISORY_LOCK_POLL_INTERVAL)
+                try:
+                    yield
+                finally:
+                    advisory_locks.unlock(session_id)
+            else:
+                yield
+        finally:
+            lock.release()
+    finally:
+        _thread_locks.checkin(session_id)
+
+@asynccontextmanager
+async def asession_lock(session_id, timeout=SESSION_LOCK_TIMEOUT):
+    """Async variant of session_lock for the ASGI app."""
+    mode = session_lock_mode(SESSION_LOCK)
+    if mode == session_lock_mode.OFF:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    lock = _async_locks.checkout(session_id)
+    try:
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise SessionBusyError()
+        try:
+            if mode == session_lock_mode.POSTGRES:
+                while not await asyncio.to_thread(advisory_locks.try_lock, session_id):
+                    if time.monotonic() >= deadline:
+                        raise SessionBusyError()
+                    await asyncio.sleep(_ADVISORY_LOCK_POLL_INTERVAL)
+                try:
+                    yield
+                finally:
+                    await asyncio.to_thread(advisory_locks.unlock, session_id)
+            else:
+                yield
+        finally:
+            lock.release()
+    finally:
+        _async_locks.checkin(session_id)
+
+
+def _request_hash(input_text, request_type):
+    return hashlib.sha256(f"{request_type}\n{input_text}".encode()).hexdigest()
+
+class IdempotencyStore:
+    """Replies stored per (session_id, Idempotency-Key) for IDEMPOTENCY_TTL seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    def lookup(self, session_id, key, input_text, request_type):
+        """
+        The reply stored for this key, or None.
+        Raises IdempotencyKeyReusedError if the key was used for another message.
+        """
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT request_hash, response FROM {table}
+                    WHERE session_id = %s AND idempotency_key = %s
+                      AND created_at > NOW() - make_interval(secs => %s)
+                """).format(table=sql.Identifier(idempotency_table_name)),
+                (session_id, key, self.ttl)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        if row[0] != _request_hash(input_text, request_type):
+            raise IdempotencyKeyReusedError()
+        return row[1]
+
+    def save(self, session_id, key, input_text, request_type, response):
+        table = sql.Identifier(idempotency_table_name)
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    INSERT INTO {table} (session_id, idempotency_key, request_hash, response)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (session_id, idempotency_key)
+                    DO UPDATE SET request_hash = EXCLUDED.request_hash, response = EXCLUDED.response,
+                                  created_at = NOW()
+                """).format(table=table),
+                (session_id, key, _request_hash(input_text, request_type), response)
+            )
+            with self._lock:
+                self._stores += 1
+                sweep = self._stores % _IDEMPOTENCY_CLEANUP_EVERY == 0
+            if sweep:
+                cur.execute(
+                    sql.SQL("DELETE FROM {table} WHERE created_at <= NOW() - make_interval(secs => %s)").format(
+                        table=table),
+                    (self.ttl,)
+                )
+
+    async def alookup(self, session_id, key, input_text, request_type):
+        return await asyncio.to_thread(self.lookup, session_id, key, input_text, request_type)
+
+    async def asave(self, session_id, key, input_text, request_type, response):
+        await asyncio.to_thread(self.save, session_id, key, input_text, request_type, response)
+
+
+idempotency_store = IdempotencyStore(ttl=IDEMPOTENCY_TTL)
@@ -52,4 +52,25 @@ def get_info_prompt():
     prompt_parts = get_info_prompt_data()["system"]
     # Join all parts and format with the actual message
     info_prompt = "\n".join(prompt_parts)
-    return info_prompt
\ No newline at end of file
+    return info_prompt
+
+SUMMARY_PROMPT_PATH = Path(__file__).parent / "prompts" / "summary_prompt.json"
+
+@lru_cache()
+def get_summary_prompt_data():
+    with open(SUMMARY_PROMPT_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def get_summary_prompt():
+    prompt_parts = get_summary_prompt_data()["system"]
+    # Join all parts; format with the current summary and the messages to fold in
+    summary_prompt = "\n".join(prompt_parts)
+    return summary_prompt
+
+PROMPT_PATHS = [GENERIC_PROMPT_PATH, SALES_PROMPT_PATH, NAME_PROMPT_PATH, INFO_PROMPT_PATH, SUMMARY_PROMPT_PATH]
+
+def clear_prompt_cache():
+    """Forget the cached prompt files so the next call re-reads them from disk."""
+    for loader in (get_generic_prompt_data, get_sales_prompt_data, get_name_prompt_data,
+                   get_info_prompt_data, get_summary_prompt_data):
+        loader.cache_clear()
@@ -7,7 +7,15 @@ import pytest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Now that the path is set, we can import the app
-from app import app as flask_app
+from app import create_app
+from migrate import run_migrations
+
+flask_app = create_app()
+
+@pytest.fixture(scope="session", autouse=True)
+def database_schema():
+    """Apply the schema once per test run (the app itself never runs DDL)."""
+    run_migrations()
 
 @pytest.fixture
 def app():
@@ -18,3 +26,20 @@ def app():
 def client(app):
     """A test client for the app."""
     return app.test_client()
+
+class _RecordingQueue:
+    """Stands in for the extraction queue and records what was submitted."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, user_input, session_id, request_type):
+        self.submitted.append((user_input, session_id, request_type))
+        return True
+
+@pytest.fixture
+def extraction_submissions(monkeypatch):
+    """Messages chat turns queue for extraction, as (input, session_id, request_type); nothing is processed."""
+    queue = _RecordingQueue()
+    monkeypatch.setattr("llm_api.extraction_queue", queue)
+    return queue.submitted
@@ -0,0 +1,123 @@
+import json
+import uuid
+from http import HTTPStatus
+import pytest
+from starlette.testclient import TestClient
+import db
+from history import get_session_history
+from history_window import get_context_history
+from llm_scheduler import LLMScheduler
+
+@pytest.fixture
+def async_client():
+    """A test client for the ASGI app (async /chat and /chat/stream)."""
+    from asgi import create_asgi_app
+    with TestClient(create_asgi_app(start_workers=False)) as client:
+        yield client
+
+@pytest.fixture
+def async_calls(monkeypatch):
+    """Names of the async pool, history and scheduler entry points called during the test."""
+    calls = set()
+    def spy(owner, name):
+        original = getattr(owner, name)
+        async def wrapper(*args, **kwargs):
+            calls.add(name)
+            return await original(*args, **kwargs)
+        monkeypatch.setattr(owner, name, wrapper)
+    spy(db, "get_async_pool")
+    # Whichever history class the chat chain is configured with
+    history_class = type(get_context_history("spy"))
+    spy(history_class, "aget_messages")
+    spy(history_class, "aadd_messages")
+    spy(LLMScheduler, "aacquire")
+    return calls
+
+class TestAsyncChatAPI:
+    """Test suite for the async chat routes served by asgi.py."""
+
+    def test_async_chat_empty_input(self, async_client):
+        """Test 1: Async chat - Empty input"""
+        response = async_client.post('/chat', json={'input': '', 'session_id': str(uuid.uuid4())})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        data = response.json()
+        assert data["success"] is False
+        assert data["error"] == "Please enter a message before sending."
+
+    def test_async_chat_stream_missing_session_id(self, async_client):
+        """Test 2: Async chat stream - Missing Session ID"""
+        response = async_client.post('/chat/stream', json={'input': 'Hello'})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json()["error"] == "session_id is required"
+
+    def test_async_app_serves_flask_routes(self, async_client):
+        """Test 3: Routes not handled natively fall through to the Flask app"""
+        response = async_client.get('/health')
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()["message"] == "Hello World"
+
+    def test_async_chat_happy_path(self, async_client, async_calls, extraction_submissions):
+        """Test 4: Async chat - The reply comes back through the async pool, history and scheduler"""
+        session_id = str(uuid.uuid4())
+        response = async_client.post('/chat', json={'input': 'Hello', 'session_id': session_id})
+
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert data["success"] is True
+        assert data["response"]
+        messages = get_session_history(session_id).messages
+        assert [(m.type, m.content) for m in messages] == [("human", "Hello"), ("ai", data["response"])]
+        assert async_calls == {"get_async_pool", "aget_messages", "aadd_messages", "aacquire"}
+        assert extraction_submissions == [("Hello", session_id, "generic")]
+
+    def test_async_chat_stream_happy_path(self, async_client, async_calls, extraction_submissions):
+        """Test 5: Async chat stream - Tokens then done are sent and the reply is saved"""
+        session_id = str(uuid.uuid4())
+        response = async_client.post('/chat/stream', json={'input': 'Hello', 'session_id': session_id})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.splitlines() for block in response.text.strip().split("\n\n")]
+        assert events[-1] == ["event: done", 'data: {"success": true}']
+        assert all(event[0] == "event: token" for event in events[:-1])
+        reply = "".join(json.loads(event[1].split(": ", 1)[1])["token"] for event in events[:-1])
+
+        messages = get_session_history(session_id).messages
+        assert [(m.type, m.content) for m in messages] == [("human", "Hello"), ("ai", reply)]
+        assert async_calls == {"get_async_pool", "aget_messages", "aadd_messages", "aacquire"}
+        assert extraction_submissions == [("Hello", session_id, "generic")]
+
+    def test_lifespan_shutdown_matches_shutdown_worker(self, monkeypatch):
+        """Test 6: ASGI shutdown drains extraction jobs and closes both pools, in shutdown_worker's order"""
+        import asgi
+        closed = []
+        def record(name):
+            def closer(*args, **kwargs):
+                closed.append(name)
+            return closer
+        async def aclose():
+            closed.append("llm_registry")
+        async def close_async_pool():
+            closed.append("async_pool")
+        monkeypatch.setattr(asgi.extraction_queue, "shutdown", record("extraction_queue"))
+        monkeypatch.setattr(asgi.history_buffer, "close", record("history_buffer"))
+        monkeypatch.setattr(asgi.lead_feed, "close", record("lead_feed"))
+        monkeypatch.setattr(asgi.advisory_locks, "close", record("advisory_locks"))
+        monkeypatch.setattr(asgi.llm_registry, "aclose", aclose)
+        monkeypatch.setattr(asgi, "close_pool", record("pool"))
+        monkeypatch.setattr(asgi, "close_async_pool", close_async_pool)
+
+        with TestClient(asgi.create_asgi_app(start_workers=False)):
+            pass
+        assert closed == ["extraction_queue", "history_buffer", "lead_feed", "advisory_locks",
+                          "llm_registry", "pool", "async_pool"]
+
+    def test_async_chat_invalid_session_id(self, async_client):
+        """Test 7: Async chat - A malformed session_id is rejected like on /chat/stream"""
+        for route in ('/chat', '/chat/stream'):
+            response = async_client.post(route, json={'input': 'Hello', 'session_id': 'not-a-uuid'})
+            assert response.status_code == HTTPStatus.BAD_REQUEST
+            assert response.json() == {'success': False, 'error': "Invalid session_id format"}
@@ -0,0 +1,60 @@
+import json
+import uuid
+from http import HTTPStatus
+from history import get_session_history
+
+def _sse_events(body):
+    """(event, data) pairs of a Server-Sent Events body."""
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+class TestChatStreamAPI:
+    """Test suite for the streaming chat API (validation happens before the stream starts)."""
+
+    def test_chat_stream_missing_session_id(self, client):
+        """Test 1: Chat stream - Missing Session ID"""
+        response = client.post('/chat/stream', json={'input': 'Hello'})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        data = response.get_json()
+        assert data["success"] is False
+        assert data["error"] == "session_id is required"
+
+    def test_chat_stream_empty_input(self, client):
+        """Test 2: Chat stream - Empty input is rejected with JSON, not a stream"""
+        response = client.post('/chat/stream', json={'input': '   ', 'session_id': str(uuid.uuid4())})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.mimetype == "application/json"
+        data = response.get_json()
+        assert data["error"] == "Please enter a message before sending."
+
+    def test_chat_stream_happy_path(self, client, extraction_submissions):
+        """Test 3: Chat stream - Tokens then done are sent, the reply is saved and extraction is queued"""
+        session_id = str(uuid.uuid4())
+
+        response = client.post('/chat/stream', json={'input': 'Hello', 'session_id': session_id, 'request_type': 'sales'})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.mimetype == "text/event-stream"
+        events = _sse_events(response.data)
+        assert events[-1] == ("done", {"success": True})
+        tokens = [data["token"] for event, data in events[:-1] if event == "token"]
+        assert len(tokens) == len(events) - 1 > 1
+        reply = "".join(tokens)
+
+        messages = get_session_history(session_id).messages
+        assert [(m.type, m.content) for m in messages] == [("human", "Hello"), ("ai", reply)]
+        assert extraction_submissions == [("Hello", session_id, "sales")]
+
+    def test_chat_validates_session_id_like_the_stream(self, client):
+        """Test 4: Chat - /chat rejects a missing or malformed session_id before calling the LLM"""
+        for body, error in (({'input': 'Hello'}, "session_id is required"),
+                            ({'input': 'Hello', 'session_id': 'not-a-uuid'}, "Invalid session_id format")):
+            for route in ('/chat', '/chat/stream'):
+                response = client.post(route, json=body)
+                assert response.status_code == HTTPStatus.BAD_REQUEST, route
+                assert response.get_json() == {'success': False, 'error': error}
@@ -0,0 +1,48 @@
+import pytest
+from langchain_core.messages import AIMessage
+from config import agent_type
+from conversation_processor import conversation_processor
+from conversation_processor.extraction_schema import ExtractionParseError, parse_extraction
+
+class TestExtractionSchema:
+    """Test suite for validating contact-info extraction replies."""
+
+    def test_parses_fenced_reply(self):
+        """Test 1: JSON inside markdown fences is accepted and nulls become empty strings"""
+        reply = '```json\n{"contact_name": "Ana", "email": null, "mobile": "", "country": "Peru"}\n```'
+
+        info = parse_extraction(reply, agent_type.SALES)
+
+        assert info == {"contact_name": "Ana", "email": "", "mobile": "", "country": "Peru"}
+
+    def test_name_alias(self):
+        """Test 2: The name prompt's "name" key is read as contact_name"""
+        info = parse_extraction('{"name_detected": true, "name": "Mike"}', agent_type.GENERIC)
+
+        assert info["name_detected"] is True
+        assert info["contact_name"] == "Mike"
+
+    def test_rejects_invalid_reply(self):
+        """Test 3: Replies without a matching JSON object raise a describable error"""
+        with pytest.raises(ExtractionParseError):
+            parse_extraction("I could not find any contact info.", agent_type.SALES)
+        with pytest.raises(ExtractionParseError):
+            parse_extraction('{"name_detected": "maybe"}', agent_type.GENERIC)
+
+    def test_repairs_invalid_reply(self, monkeypatch):
+        """Test 4: An invalid reply is sent back to the model once and the fixed reply is used"""
+        replies = iter(['{"contact_name": "Ana",', '{"contact_name": "Ana"}'])
+        calls = []
+
+        class FakeLLM:
+            def invoke(self, messages, config=None, **kwargs):
+                calls.append(messages)
+                return AIMessage(content=next(replies))
+
+        monkeypatch.setattr(conversation_processor.llm_registry, "get_extraction_llm", FakeLLM)
+
+        info = conversation_processor._detect_info_with_llm("I'm Ana", agent_type.SALES)
+
+        assert info["contact_name"] == "Ana"
+        assert len(calls) == 2
+        assert "not valid JSON" in calls[1][-1].content
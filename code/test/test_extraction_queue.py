@@ -0,0 +1,117 @@
+import threading
+import time
+import pytest
+from conversation_processor.extraction_queue import ExtractionQueue
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the extraction queue"
+        time.sleep(0.01)
+
+@pytest.fixture
+def make_queue():
+    """Build in-memory queues with a recording handler that waits for `release`; shut down after the test."""
+    queues = []
+    def build(policy, workers=1, max_size=2):
+        release = threading.Event()
+        handled = []
+        def handler(text, session_id, request_type):
+            release.wait(timeout=5)
+            handled.append((text, session_id))
+        queue = ExtractionQueue(handler, workers=workers, max_size=max_size, policy=policy)
+        queue.release, queue.handled = release, handled
+        queues.append(queue)
+        return queue
+    yield build
+    for queue in queues:
+        queue.release.set()
+        queue.shutdown(timeout=5)
+
+def _occupy_worker(queue, session_id="busy"):
+    """Start a job that holds the only worker until queue.release is set."""
+    assert queue.submit("busy", session_id, "sales")
+    _wait_until(lambda: queue.stats()["in_flight"] == 1)
+
+class TestExtractionQueue:
+    """Test suite for the in-memory extraction worker pool."""
+
+    def test_coalesce_merges_waiting_session_messages(self, make_queue):
+        """Test 1: coalesce folds a session's messages into its waiting job and drops new sessions when full"""
+        queue = make_queue("coalesce")
+        _occupy_worker(queue)
+        assert queue.submit("my name is Ana", "a", "sales")
+        assert queue.submit("actually it's Anna", "a", "sales")
+        assert queue.submit("hello", "b", "sales")
+        assert not queue.submit("hi there", "c", "sales")
+
+        queue.release.set()
+        _wait_until(lambda: queue.stats()["succeeded"] == 3)
+        assert queue.handled == [("busy", "busy"), ("my name is Ana\nactually it's Anna", "a"), ("hello", "b")]
+        stats = queue.stats()
+        assert (stats["queued"], stats["coalesced"], stats["dropped"]) == (3, 1, 1)
+
+    def test_drop_newest_rejects_when_full(self, make_queue):
+        """Test 2: drop_newest keeps the waiting jobs and rejects the new one"""
+        queue = make_queue("drop_newest")
+        _occupy_worker(queue)
+        assert queue.submit("first", "a", "sales")
+        assert queue.submit("second", "a", "sales")
+        assert not queue.submit("third", "b", "sales")
+
+        queue.release.set()
+        _wait_until(lambda: queue.stats()["succeeded"] == 3)
+        assert queue.handled == [("busy", "busy"), ("first", "a"), ("second", "a")]
+        assert queue.stats()["dropped"] == 1
+
+    def test_drop_oldest_evicts_when_full(self, make_queue):
+        """Test 3: drop_oldest evicts the oldest waiting job to make room"""
+        queue = make_queue("drop_oldest")
+        _occupy_worker(queue)
+        assert queue.submit("first", "a", "sales")
+        assert queue.submit("second", "b", "sales")
+        assert queue.submit("third", "a", "sales")
+
+        queue.release.set()
+        _wait_until(lambda: queue.stats()["succeeded"] == 3)
+        assert queue.handled == [("busy", "busy"), ("second", "b"), ("third", "a")]
+        assert queue.stats()["dropped"] == 1
+
+    def test_session_jobs_never_overlap(self, make_queue):
+        """Test 4: With several workers, a session's jobs still run one at a time in arrival order"""
+        queue = make_queue("drop_newest", workers=4, max_size=100)
+        running, overlaps = set(), []
+        lock = threading.Lock()
+
+        def handler(text, session_id, request_type):
+            with lock:
+                if session_id in running:
+                    overlaps.append(session_id)
+                running.add(session_id)
+            time.sleep(0.005)
+            with lock:
+                running.discard(session_id)
+                queue.handled.append((text, session_id))
+
+        queue._handler = handler
+        for i in range(10):
+            for session_id in ("a", "b"):
+                assert queue.submit(str(i), session_id, "sales")
+
+        _wait_until(lambda: queue.stats()["succeeded"] == 20)
+        assert overlaps == []
+        for session_id in ("a", "b"):
+            assert [text for text, sid in queue.handled if sid == session_id] == [str(i) for i in range(10)]
+
+    def test_shutdown_drains_queued_jobs(self, make_queue):
+        """Test 5: shutdown() finishes queued and in-flight jobs before stopping"""
+        queue = make_queue("drop_newest", workers=2, max_size=10)
+        queue.release.set()
+        queue._handler = lambda text, session_id, request_type: (time.sleep(0.02), queue.handled.append(text))
+        for i in range(6):
+            assert queue.submit(str(i), f"session-{i}", "sales")
+
+        queue.shutdown(timeout=5)
+        assert sorted(queue.handled) == [str(i) for i in range(6)]
+        assert queue.stats()["depth"] == 0
+        assert queue.stats()["in_flight"] == 0
@@ -1,6 +1,9 @@
 import pytest
 import uuid
 from http import HTTPStatus
+from langchain_core.messages import HumanMessage
+from db import table_name
+from history import PooledChatMessageHistory
 
 class TestHistoryAPI:
     """Test suite for the history API using the Flask test client."""
@@ -47,4 +50,53 @@ class TestHistoryAPI:
         if data.get("history") and len(data["history"]) > 0:
             message = data["history"][0]
             assert "content" in message
-            assert "type" in message
\ No newline at end of file
+            assert "type" in message
+
+    def test_history_pagination(self, client, monkeypatch):
+        """Test 5: History - limit/before/since return pages by message id"""
+        session_id = str(uuid.uuid4())
+        PooledChatMessageHistory(table_name, session_id).add_messages(
+            [HumanMessage(content=f"message {i}") for i in range(5)])
+        ids = [m["id"] for m in client.get('/history', query_string={'session_id': session_id}).get_json()["history"]]
+        assert len(ids) == 5
+
+        def page(**params):
+            response = client.get('/history', query_string={'session_id': session_id, **params})
+            assert response.status_code == HTTPStatus.OK
+            data = response.get_json()
+            return [m["id"] for m in data["history"]], data
+
+        # Once from the cached session, once with the page read straight from the table
+        for cache_enabled in (True, False):
+            monkeypatch.setattr("history.history_cache.enabled", cache_enabled)
+            # Newest page first, then walk backwards with next_before
+            rows, data = page(limit=2)
+            assert rows == ids[3:]
+            assert data["has_more"] is True
+            rows, data = page(limit=2, before=data["next_before"])
+            assert rows == ids[1:3]
+            assert data["has_more"] is True
+            rows, data = page(limit=2, before=data["next_before"])
+            assert rows == ids[:1]
+            assert data["has_more"] is False
+            rows, data = page(before=ids[0])
+            assert rows == []
+
+            # A client that has seen up to ids[2] syncs the rest, then polls with last_id
+            rows, data = page(since=ids[2])
+            assert rows == ids[3:]
+            assert data["last_id"] == ids[-1]
+            rows, data = page(since=data["last_id"])
+            assert rows == []
+            assert data["last_id"] == ids[-1]
+
+    def test_history_invalid_pagination_params(self, client):
+        """Test 6: History - Invalid pagination parameters"""
+        session_id = str(uuid.uuid4())
+        response = client.get('/history', query_string={'session_id': session_id, 'limit': 'abc'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "limit must be a positive integer"
+
+        response = client.get('/history', query_string={'session_id': session_id, 'before': 5, 'since': 2})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "Use only one of before, after or since"
@@ -0,0 +1,75 @@
+import threading
+import uuid
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from history import PooledChatMessageHistory
+from history_buffer import HistoryWriteBuffer
+from db import table_name
+
+def _turn(i):
+    return [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+
+@pytest.fixture
+def patch_buffer(monkeypatch):
+    """Swap in a fresh buffer for the history module; closed after the test."""
+    buffers = []
+    def install(mode, interval=0.05, batch_size=500):
+        buffer = HistoryWriteBuffer(mode, batch_size=batch_size, interval=interval, max_pending=10000)
+        monkeypatch.setattr("history.history_buffer", buffer)
+        buffers.append(buffer)
+        return buffer
+    yield install
+    for buffer in buffers:
+        buffer.close()
+
+class TestHistoryWriteBuffer:
+    """Test suite for group-commit and write-behind chat history writes."""
+
+    def test_group_commit_batches_concurrent_turns(self, patch_buffer):
+        """Test 1: Concurrent turns are committed in fewer inserts, in order per session"""
+        buffer = patch_buffer("group_commit")
+        sessions = [str(uuid.uuid4()) for _ in range(20)]
+        barrier = threading.Barrier(len(sessions))
+
+        def write(session_id):
+            history = PooledChatMessageHistory(table_name, session_id)
+            barrier.wait()
+            for i in range(3):
+                history.add_messages(_turn(i))
+
+        threads = [threading.Thread(target=write, args=(sid,)) for sid in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = buffer.stats()
+        assert stats["rows"] == 20 * 3 * 2
+        assert stats["batches"] < 20 * 3
+        assert stats["pending"] == 0
+        history = PooledChatMessageHistory(table_name, sessions[0])
+        assert [m.content for m in history.messages] == [
+            "question 0", "answer 0", "question 1", "answer 1", "question 2", "answer 2"]
+
+    def test_write_behind_reads_own_writes(self, patch_buffer):
+        """Test 2: A buffered session is flushed before it is read"""
+        buffer = patch_buffer("write_behind", interval=60)
+        history = PooledChatMessageHistory(table_name, str(uuid.uuid4()))
+        history.add_messages(_turn(1))
+        assert buffer.stats()["pending"] == 2
+
+        assert [m.content for m in history.messages] == ["question 1", "answer 1"]
+        assert buffer.stats()["pending"] == 0
+
+    def test_close_flushes_buffered_messages(self, patch_buffer):
+        """Test 3: Messages still buffered at shutdown are written by close()"""
+        buffer = patch_buffer("write_behind", interval=60, batch_size=3)
+        session_id = str(uuid.uuid4())
+        history = PooledChatMessageHistory(table_name, session_id)
+        for i in range(4):
+            history.add_messages(_turn(i))
+        buffer.close()
+
+        assert buffer.stats()["pending"] == 0
+        assert buffer.stats()["batches"] >= 3
+        assert len(PooledChatMessageHistory(table_name, session_id).messages) == 8
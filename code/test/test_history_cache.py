@@ -0,0 +1,129 @@
+import json
+import uuid
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+from psycopg import sql
+from db import get_connection, table_name
+from history import PooledChatMessageHistory
+from history_cache import SessionHistoryCache
+from history_window import WindowedChatMessageHistory
+
+def _load(cache, session_id):
+    with get_connection() as conn, conn.cursor() as cur:
+        return [message.content for _, message in cache.load(cur, session_id)]
+
+def _insert_elsewhere(session_id, content):
+    """Write a message the way another worker process would, bypassing the cache."""
+    with get_connection() as conn:
+        conn.execute(
+            sql.SQL("INSERT INTO {table} (session_id, message) VALUES (%s, %s)").format(
+                table=sql.Identifier(table_name)),
+            (session_id, json.dumps(message_to_dict(HumanMessage(content=content))))
+        )
+
+class _CountingCursor:
+    """Cursor wrapper that counts the rows fetched through it."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.rows_fetched = 0
+
+    def execute(self, *args):
+        return self._cur.execute(*args)
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        self.rows_fetched += row is not None
+        return row
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self.rows_fetched += len(rows)
+        return rows
+
+def _counted_load(cache, session_id, tail=None):
+    """(message contents, rows fetched from Postgres including the version row)."""
+    with get_connection() as conn, conn.cursor() as cur:
+        counting = _CountingCursor(cur)
+        rows = cache.load(counting, session_id, tail=tail)
+    return [message.content for _, message in rows], counting.rows_fetched
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A fresh enabled cache installed in the history module."""
+    cache = SessionHistoryCache(enabled=True, max_bytes=1024 * 1024, ttl=60)
+    monkeypatch.setattr("history.history_cache", cache)
+    monkeypatch.setattr("history_window.history_cache", cache)
+    return cache
+
+class TestSessionHistoryCache:
+    """Test suite for the version-checked session history cache."""
+
+    def test_appended_messages_are_served_from_memory(self, cache):
+        """Test 1: After the first load, this process's writes are appended and reads are hits"""
+        session_id = str(uuid.uuid4())
+        history = PooledChatMessageHistory(table_name, session_id)
+        assert history.messages == []
+        history.add_messages([HumanMessage(content="hi"), AIMessage(content="hello")])
+
+        assert [m.content for m in history.messages] == ["hi", "hello"]
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_writes_from_other_processes_are_picked_up(self, cache):
+        """Test 2: New rows elsewhere are fetched as a delta; deleted rows force a reload"""
+        session_id = str(uuid.uuid4())
+        _insert_elsewhere(session_id, "first")
+        assert _load(cache, session_id) == ["first"]
+
+        _insert_elsewhere(session_id, "second")
+        assert _load(cache, session_id) == ["first", "second"]
+        assert cache.stats()["deltas"] == 1
+
+        with get_connection() as conn:
+            conn.execute(sql.SQL("DELETE FROM {table} WHERE session_id = %s").format(
+                table=sql.Identifier(table_name)), (session_id,))
+        assert _load(cache, session_id) == []
+        assert cache.stats()["misses"] == 2
+
+    def test_byte_cap_and_idle_expiry(self):
+        """Test 3: Least recently used sessions are evicted past max_bytes, idle ones expire"""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        _insert_elsewhere(first, "x" * 300)
+        _insert_elsewhere(second, "y" * 300)
+
+        small = SessionHistoryCache(enabled=True, max_bytes=600, ttl=60)
+        _load(small, first)
+        _load(small, second)
+        assert second in small and first not in small
+        assert small.stats()["evictions"] == 1
+
+        expiring = SessionHistoryCache(enabled=True, max_bytes=1024 * 1024, ttl=0)
+        _load(expiring, first)
+        _load(expiring, first)
+        assert expiring.stats()["misses"] == 2
+
+    def test_window_miss_reads_only_the_tail(self, cache):
+        """Test 4: A long session is read and cached only as far back as the window needs"""
+        session_id = str(uuid.uuid4())
+        PooledChatMessageHistory(table_name, session_id).add_messages(
+            [HumanMessage(content=f"message {i}") for i in range(200)])
+
+        contents, fetched = _counted_load(cache, session_id, tail=20)
+        assert contents == [f"message {i}" for i in range(180, 200)]
+        assert fetched == 1 + 20
+        assert session_id in cache and not cache.is_complete(session_id)
+
+        _insert_elsewhere(session_id, "message 200")
+        contents, fetched = _counted_load(cache, session_id, tail=20)
+        assert contents == [f"message {i}" for i in range(181, 201)]
+        assert fetched == 1 + 1
+        assert cache.stats()["deltas"] == 1
+
+        # A full read is not served from the tail
+        contents, fetched = _counted_load(cache, session_id)
+        assert len(contents) == fetched - 1 == 201
+
+        cache.invalidate(session_id)
+        WindowedChatMessageHistory(table_name, session_id).messages
+        assert session_id in cache and not cache.is_complete(session_id)
@@ -0,0 +1,76 @@
+import uuid
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from db import get_connection, table_name
+from history import PooledChatMessageHistory
+from history_window import WindowedChatMessageHistory, approx_tokens, load_summary, select_window
+from llm_registry import llm_registry
+from conversation_processor.history_summary import update_session_summary
+
+def _rows(*contents):
+    return [(i + 1, HumanMessage(content=content)) for i, content in enumerate(contents)]
+
+class FakeSummaryLLM:
+    """Records the summary prompts it is sent and answers with a fixed summary."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.prompts.append(messages[0].content)
+        return AIMessage(content=self.reply)
+
+class TestHistoryWindow:
+    """Test suite for the token-budgeted history window and its rolling summary."""
+
+    def test_window_keeps_newest_rows_within_budget(self):
+        """Test 1: The newest rows that fit the token budget are kept, in chronological order"""
+        rows = _rows("a" * 40, "b" * 40, "c" * 40, "d" * 40)
+        per_message = approx_tokens(rows[0][1])
+
+        assert select_window(rows, max_messages=10, max_tokens=2 * per_message) == rows[2:]
+        assert select_window(rows, max_messages=3, max_tokens=0) == rows[1:]
+        assert select_window(rows, max_messages=10, max_tokens=1) == rows[3:]
+        assert select_window([], max_messages=10, max_tokens=100) == []
+
+    def test_older_turns_are_folded_into_the_summary(self, monkeypatch):
+        """Test 2: Turns that fall out of the window are summarized and the summary leads the prompt history"""
+        session_id = str(uuid.uuid4())
+        history = PooledChatMessageHistory(table_name, session_id)
+        # ~500 tokens each, so the default 3000-token budget keeps the newest five
+        history.add_messages([
+            (HumanMessage if i % 2 == 0 else AIMessage)(content=f"turn {i} " + "x" * 2000) for i in range(12)])
+        fake = FakeSummaryLLM("Ana asked about pricing.")
+        monkeypatch.setattr(llm_registry, "get_summary_llm", lambda: fake)
+
+        assert update_session_summary(session_id) is True
+        assert "turn 6 " in fake.prompts[0] and "turn 7 " not in fake.prompts[0]
+        with get_connection() as conn, conn.cursor() as cur:
+            summary, summarized_until = load_summary(cur, session_id)
+            cur.execute(f"SELECT id FROM {table_name} WHERE session_id = %s ORDER BY id", (session_id,))
+            ids = [row[0] for row in cur.fetchall()]
+        assert summary == "Ana asked about pricing."
+        assert summarized_until == ids[6]
+
+        messages = WindowedChatMessageHistory(table_name, session_id).messages
+        assert isinstance(messages[0], SystemMessage)
+        assert messages[0].content.endswith("Ana asked about pricing.")
+        assert [m.content.split(" x")[0] for m in messages[1:]] == [f"turn {i}" for i in range(7, 12)]
+
+        # Nothing new has dropped out of the window
+        assert update_session_summary(session_id) is False
+        assert len(fake.prompts) == 1
+
+    def test_unsummarized_turns_stay_in_the_prompt(self, monkeypatch):
+        """Test 3: Turns that left the window but are too few to summarize are still sent to the model"""
+        session_id = str(uuid.uuid4())
+        # Eight ~500-token messages: the window keeps five, three are pending
+        PooledChatMessageHistory(table_name, session_id).add_messages(
+            [(HumanMessage if i % 2 == 0 else AIMessage)(content=f"turn {i} " + "x" * 2000) for i in range(8)])
+        fake = FakeSummaryLLM("unused")
+        monkeypatch.setattr(llm_registry, "get_summary_llm", lambda: fake)
+
+        assert update_session_summary(session_id) is False
+        assert fake.prompts == []
+        messages = WindowedChatMessageHistory(table_name, session_id).messages
+        assert [m.content.split(" x")[0] for m in messages] == [f"turn {i}" for i in range(8)]
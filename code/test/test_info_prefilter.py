@@ -0,0 +1,48 @@
+from config import agent_type
+from conversation_processor.info_prefilter import prefilter_message, prefilter_stats
+
+def _counts_after(message, request_type):
+    """prefilter_message's result and how much each counter moved."""
+    before = prefilter_stats.snapshot()
+    result = prefilter_message(message, request_type)
+    after = prefilter_stats.snapshot()
+    return result, {name: after[name] - before[name] for name in after if after[name] != before[name]}
+
+class TestInfoPrefilter:
+    """Test suite for the regex pre-filter in front of the extraction LLM."""
+
+    def test_bare_contact_details_are_resolved_locally(self):
+        """Test 1: A message with only an email and/or number is saved without the LLM"""
+        result = prefilter_message("my email is ana@example.com", agent_type.SALES)
+        assert result == {"email": "ana@example.com", "mobile": "", "needs_llm": False, "resolved": True}
+
+        result = prefilter_message("sure, +1 415-555-0132 or ana@example.com", agent_type.SALES)
+        assert result == {"email": "ana@example.com", "mobile": "+14155550132", "needs_llm": False, "resolved": True}
+
+    def test_names_go_to_the_llm(self):
+        """Test 2: Name phrases, alone or next to an email, still need the LLM"""
+        for message in ("I'm Ana from Lima and I'd like a chatbot",
+                        "Hello there, my name is Ana and I run a bakery",
+                        "my name is Ana, email ana@example.com"):
+            result = prefilter_message(message, agent_type.SALES)
+            assert result["needs_llm"] is True, message
+            assert result["resolved"] is False, message
+
+        assert prefilter_message("Hi, I'm Ana, how much does it cost?", agent_type.GENERIC)["needs_llm"] is True
+
+    def test_small_talk_skips_the_llm(self):
+        """Test 3: Messages without any personal info are not sent to the LLM"""
+        for request_type in (agent_type.SALES, agent_type.GENERIC):
+            result = prefilter_message("Can you tell me more about your pricing plans?", request_type)
+            assert result == {"email": "", "mobile": "", "needs_llm": False, "resolved": False}
+
+    def test_stats_count_saved_llm_calls(self):
+        """Test 4: prefilter_stats counts hits, misses and the LLM calls each outcome saves"""
+        _, moved = _counts_after("ana@example.com", agent_type.SALES)
+        assert moved == {"hits": 1, "resolved_locally": 1, "llm_skipped": 1}
+
+        _, moved = _counts_after("What services do you offer to small shops?", agent_type.SALES)
+        assert moved == {"misses": 1, "llm_skipped": 1}
+
+        _, moved = _counts_after("my name is Ana and I live in Peru", agent_type.SALES)
+        assert moved == {"hits": 1}
@@ -0,0 +1,87 @@
+import uuid
+import pytest
+from psycopg import OperationalError
+from db import get_connection
+from config import job_table_name
+from conversation_processor.job_queue import PostgresJobQueue
+
+def _clear_jobs():
+    with get_connection() as conn:
+        conn.execute(f"DELETE FROM {job_table_name}")
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    """A submit-and-process queue on an empty job table, recording handled jobs."""
+    _clear_jobs()
+    monkeypatch.setattr("conversation_processor.job_queue._retry_delay", lambda attempts: 0)
+    handled = []
+    queue = PostgresJobQueue(lambda text, session_id, request_type: handled.append((text, session_id)), workers=0)
+    queue.handled = handled
+    yield queue
+    _clear_jobs()
+
+class TestPostgresJobQueue:
+    """Test suite for the durable extraction job queue."""
+
+    def test_session_jobs_run_in_order_and_coalesce(self, job_queue):
+        """Test 1: A session's waiting messages run together, in order, before the next session"""
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        job_queue.submit("my name is Ana", first, "sales")
+        job_queue.submit("hello", second, "sales")
+        job_queue.submit("actually it's Anna", first, "sales")
+
+        assert job_queue.process_next()
+        assert job_queue.process_next()
+        assert not job_queue.process_next()
+        assert job_queue.handled == [("my name is Ana\nactually it's Anna", first), ("hello", second)]
+
+    def test_failed_job_is_retried_then_dead_lettered(self, job_queue, monkeypatch):
+        """Test 2: A failing job is retried and parked as dead after the last attempt"""
+        monkeypatch.setattr("conversation_processor.job_queue.JOB_MAX_ATTEMPTS", 2)
+        calls = []
+
+        def failing(text, session_id, request_type):
+            calls.append(text)
+            raise RuntimeError("provider down")
+
+        job_queue._handler = failing
+        job_queue.submit("hi", str(uuid.uuid4()), "sales")
+
+        assert job_queue.process_next()
+        assert job_queue.process_next()
+        assert not job_queue.process_next()
+        assert len(calls) == 2
+        assert job_queue.stats()["dead_letters"] == 1
+
+    def test_later_message_waits_for_failed_one(self, job_queue, monkeypatch):
+        """Test 3: A newer message never overtakes an earlier one that is waiting to be retried"""
+        monkeypatch.setattr("conversation_processor.job_queue._retry_delay", lambda attempts: 60)
+        session_id = str(uuid.uuid4())
+
+        def fail_once(text, session_id, request_type):
+            job_queue._handler = lambda *args: job_queue.handled.append(args[:2])
+            raise RuntimeError("timeout")
+
+        job_queue._handler = fail_once
+        job_queue.submit("email is a@b.co", session_id, "sales")
+        assert job_queue.process_next()
+        job_queue.submit("sorry, a@b.com", session_id, "sales")
+
+        assert not job_queue.process_next()
+        assert job_queue.handled == []
+
+    def test_database_error_in_extraction_is_retried(self, job_queue, monkeypatch):
+        """Test 4: A failed chat_info write fails the job instead of being reported as done"""
+        from conversation_processor import conversation_processor
+
+        def broken_connection():
+            raise OperationalError("connection lost")
+
+        monkeypatch.setattr(conversation_processor, "get_connection", broken_connection)
+        monkeypatch.setattr(conversation_processor, "_update_history_summary", lambda session_id: None)
+        job_queue._handler = conversation_processor.process_conversation
+        job_queue.submit("hello", str(uuid.uuid4()), "sales")
+
+        assert job_queue.process_next()
+        stats = job_queue.stats()
+        assert (stats["succeeded"], stats["failed"], stats["depth"]) == (0, 1, 1)
@@ -0,0 +1,90 @@
+import json
+import uuid
+from http import HTTPStatus
+import pytest
+from lead_feed import RESET, LeadFeed, LeadFeedFullError, _Subscription, lead_feed
+from leads_update import update_lead
+
+def _wait_for_lead(next_event, session_id, attempts=50):
+    """Update the lead until its change comes through; the listener may still be connecting."""
+    for attempt in range(attempts):
+        update_lead(session_id, "OPEN", f"remark {attempt}")
+        event = next_event()
+        if event is not None and event[0] == "lead" and event[1]["session_id"] == session_id:
+            return event[1]
+    return None
+
+@pytest.fixture
+def feed():
+    feed = LeadFeed("lead_changes", queue_size=100, batch_window=0.01, max_subscribers=2)
+    yield feed
+    feed.close()
+
+class TestLeadFeed:
+    """Test suite for the LISTEN/NOTIFY lead feed."""
+
+    def test_changed_lead_reaches_subscriber(self, feed):
+        """Test 1: A chat_info update is sent to subscribers as the changed row"""
+        session_id = str(uuid.uuid4())
+        subscription = feed.subscribe()
+
+        lead = _wait_for_lead(lambda: subscription.get(timeout=0.2), session_id)
+        assert lead is not None
+        assert lead["status"] == "OPEN"
+        assert lead["remarks"].startswith("remark")
+        assert isinstance(lead["created_at"], str)
+        assert feed.stats()["subscribers"] == 1
+
+    def test_slow_client_gets_reset(self):
+        """Test 2: A client whose queue overflows gets one reset instead of a partial feed"""
+        subscription = _Subscription(size=2)
+        for i in range(3):
+            subscription.offer(("lead", {"id": i}))
+
+        assert subscription.get(timeout=0) == RESET
+        assert subscription.get(timeout=0) is None
+
+    def test_leads_stream_endpoint(self, client, monkeypatch):
+        """Test 3: /leads/stream sends lead events and keep-alive comments"""
+        monkeypatch.setattr("app.LEADS_STREAM_WSGI_ENABLED", True)
+        monkeypatch.setattr("app.LEADS_STREAM_HEARTBEAT", 0.2)
+        session_id = str(uuid.uuid4())
+        response = client.get('/leads/stream', buffered=False)
+        assert response.mimetype == "text/event-stream"
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b": connected")
+
+        def next_event():
+            chunk = next(chunks).decode()
+            if not chunk.startswith("event: lead"):
+                return None
+            return "lead", json.loads(chunk.split("data: ", 1)[1])
+
+        try:
+            assert _wait_for_lead(next_event, session_id) is not None
+        finally:
+            response.close()
+            lead_feed.close()
+        assert lead_feed.stats()["subscribers"] == 0
+
+    def test_stream_limits(self, client, feed, monkeypatch):
+        """Test 4: Threaded workers refuse the feed by default, clients are capped and streams end"""
+        response = client.get('/leads/stream')
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.get_json()["success"] is False
+
+        feed.subscribe()
+        feed.subscribe()
+        with pytest.raises(LeadFeedFullError):
+            feed.subscribe()
+
+        monkeypatch.setattr("app.LEADS_STREAM_WSGI_ENABLED", True)
+        monkeypatch.setattr("app.LEADS_STREAM_MAX_LIFETIME", 0.3)
+        monkeypatch.setattr("app.LEADS_STREAM_HEARTBEAT", 0.1)
+        response = client.get('/leads/stream')
+        try:
+            assert response.status_code == HTTPStatus.OK
+            assert response.data.startswith(b": connected")
+        finally:
+            response.close()
+            lead_feed.close()
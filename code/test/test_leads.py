@@ -0,0 +1,169 @@
+import uuid
+from datetime import datetime, timezone
+from http import HTTPStatus
+from db import get_connection
+from config import lead_stats_table_name
+from migrate import ensure_lead_stats_table_exists
+
+class TestLeadsAPI:
+    """Test suite for the leads API using the Flask test client."""
+
+    def test_leads_page_structure(self, client):
+        """Test 1: Leads - a page carries the leads plus paging fields"""
+        response = client.get('/leads', query_string={'limit': 5})
+
+        assert response.status_code == HTTPStatus.OK
+        data = response.get_json()
+        assert len(data["leads"]) <= 5
+        assert "has_more" in data
+        assert "next_cursor" in data
+        assert isinstance(data["total_estimate"], int)
+
+    def test_leads_next_page_follows_cursor(self, client):
+        """Test 2: Leads - the next page starts after the previous one"""
+        first = client.get('/leads', query_string={'limit': 1}).get_json()
+        if not first["has_more"]:
+            return
+        second = client.get('/leads', query_string={'limit': 1, 'cursor': first["next_cursor"]}).get_json()
+        assert second["leads"][0]["id"] != first["leads"][0]["id"]
+
+    def test_leads_invalid_filters(self, client):
+        """Test 3: Leads - invalid status, limit and cursor are rejected"""
+        response = client.get('/leads', query_string={'status': 'WON'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "Status not allowed"
+
+        response = client.get('/leads', query_string={'limit': 0})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+        response = client.get('/leads', query_string={'cursor': 'not-a-cursor'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "Invalid cursor"
+
+    def test_leads_export_csv(self, client):
+        """Test 4: Leads export - CSV download starts with the header row"""
+        response = client.get('/leads/export', query_string={'format': 'csv', 'status': 'OPEN'})
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.mimetype == "text/csv"
+        assert response.get_data(as_text=True).startswith("id,session_id,name,email")
+
+    def test_leads_export_invalid_format(self, client):
+        """Test 5: Leads export - unknown format is rejected"""
+        response = client.get('/leads/export', query_string={'format': 'xlsx'})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "format must be csv or ndjson"
+
+    def test_bulk_update_applies_all_items(self, client):
+        """Test 6: Bulk update - creates and updates leads in one request, later items win"""
+        existing, new = str(uuid.uuid4()), str(uuid.uuid4())
+        client.patch('/chat-info', json={"session_id": existing, "status": "OPEN", "remarks": "first call"})
+
+        response = client.patch('/chat-info/bulk', json={"updates": [
+            {"session_id": existing, "status": "CLOSED"},
+            {"session_id": new, "status": "QUALIFYING", "remarks": "demo booked"},
+            {"session_id": new, "remarks": "demo moved"},
+        ]})
+
+        assert response.status_code == HTTPStatus.OK
+        data = response.get_json()
+        assert data["success"] is True
+        assert [r["result"] for r in data["results"]] == ["updated", "created", "created"]
+        with get_connection() as conn:
+            rows = dict((row[0], row[1:]) for row in conn.execute(
+                "SELECT session_id, status, remarks FROM chat_info WHERE session_id = ANY(%s)", ([existing, new],)))
+        assert rows[existing] == ("CLOSED", "first call")
+        assert rows[new] == ("QUALIFYING", "demo moved")
+
+    def test_bulk_update_reports_invalid_items(self, client):
+        """Test 7: Bulk update - invalid items are reported by index, the rest are applied"""
+        session_id = str(uuid.uuid4())
+        response = client.patch('/chat-info/bulk', json={"updates": [
+            {"session_id": session_id, "status": "CLOSED"},
+            {"session_id": session_id, "status": "WON"},
+            {"status": "OPEN"},
+        ]})
+
+        assert response.status_code == HTTPStatus.MULTI_STATUS
+        data = response.get_json()
+        assert (data["updated"], data["failed"]) == (1, 2)
+        assert [r["success"] for r in data["results"]] == [True, False, False]
+        assert data["results"][1]["error"] == "Status not allowed"
+
+    def test_bulk_update_invalid_body(self, client):
+        """Test 8: Bulk update - a missing or empty updates list is rejected"""
+        for body in ({}, {"updates": []}, {"updates": "CLOSED"}):
+            response = client.patch('/chat-info/bulk', json=body)
+            assert response.status_code == HTTPStatus.BAD_REQUEST
+            assert response.get_json()["error"] == "updates must be a non-empty list"
+
+    def test_lead_stats_follow_writes(self, client):
+        """Test 9: Lead stats - new leads and status changes show up in today's counts"""
+        def today(**params):
+            return client.get('/leads/stats', query_string={'created_from': datetime.now(timezone.utc).date().isoformat(), **params}).get_json()
+
+        before = today(request_type='sales')["totals"]
+        session_id = str(uuid.uuid4())
+        with get_connection() as conn:
+            conn.execute("INSERT INTO chat_info (session_id, request_type, email) VALUES (%s, 'sales', 'a@b.co')",
+                         (session_id,))
+        client.patch('/chat-info/bulk', json={"updates": [{"session_id": session_id, "status": "QUALIFYING"}]})
+
+        after = today(request_type='sales')["totals"]
+        assert after["leads"] == before["leads"] + 1
+        assert after["with_contact"] == before["with_contact"] + 1
+        assert after["by_status"]["QUALIFYING"] == before["by_status"]["QUALIFYING"] + 1
+        assert after["by_status"]["OPEN"] == before["by_status"]["OPEN"]
+
+    def test_lead_stats_buckets_and_groups(self, client):
+        """Test 10: Lead stats - series per bucket and totals per group add up"""
+        response = client.get('/leads/stats', query_string={'bucket': 'month', 'group_by': 'status'})
+
+        assert response.status_code == HTTPStatus.OK
+        data = response.get_json()
+        assert data["bucket"] == "month"
+        assert all(entry["period"].endswith("-01") for entry in data["series"])
+        assert sum(entry["leads"] for entry in data["series"]) == data["totals"]["leads"]
+        assert sum(group["leads"] for group in data["groups"]) == data["totals"]["leads"]
+        assert 0 <= data["totals"]["rates"]["contact"] <= 1
+
+    def test_lead_stats_invalid_params(self, client):
+        """Test 11: Lead stats - unknown bucket and group_by are rejected"""
+        response = client.get('/leads/stats', query_string={'bucket': 'year'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["error"] == "bucket must be day, week or month"
+
+        response = client.get('/leads/stats', query_string={'group_by': 'email'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_lead_stats_migration_reruns_without_locking(self, client):
+        """Test 12: Lead stats - re-running the migration doesn't wait on chat_info writers or recount"""
+        with get_connection() as writer, get_connection() as migrator:
+            writer.execute("INSERT INTO chat_info (session_id, request_type) VALUES (%s, 'sales')",
+                           (str(uuid.uuid4()),))
+            before = migrator.execute(f"SELECT SUM(leads) FROM {lead_stats_table_name}").fetchone()[0]
+            migrator.execute("SET lock_timeout = '1s'")
+            # The writer's open transaction would block LOCK TABLE ... SHARE ROW EXCLUSIVE
+            ensure_lead_stats_table_exists(migrator, lead_stats_table_name)
+            migrator.execute("RESET lock_timeout")
+
+            assert migrator.execute(f"SELECT SUM(leads) FROM {lead_stats_table_name}").fetchone()[0] == before
+
+    def test_bulk_update_remarks_only(self, client):
+        """Test 13: Bulk update - remarks alone keep an existing status and open new leads as OPEN"""
+        existing, new = str(uuid.uuid4()), str(uuid.uuid4())
+        client.patch('/chat-info', json={"session_id": existing, "status": "QUALIFYING"})
+
+        response = client.patch('/chat-info/bulk', json={"updates": [
+            {"session_id": existing, "remarks": "called back"},
+            {"session_id": new, "remarks": "walk-in"},
+        ]})
+
+        assert response.status_code == HTTPStatus.OK
+        assert [r["result"] for r in response.get_json()["results"]] == ["updated", "created"]
+        with get_connection() as conn:
+            rows = dict((row[0], row[1:]) for row in conn.execute(
+                "SELECT session_id, status, remarks FROM chat_info WHERE session_id = ANY(%s)", ([existing, new],)))
+        assert rows[existing] == ("QUALIFYING", "called back")
+        assert rows[new] == ("OPEN", "walk-in")
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+from llm_resilience import ResilientChatModel
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+def flaky(failures, status_code, reply="ok"):
+    """Model that fails `failures` times with `status_code`, then answers."""
+    calls = []
+
+    def call(_):
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ProviderError(status_code)
+        return reply
+    return RunnableLambda(call), calls
+
+class TestResilientChatModel:
+    """Test suite for LLM retries, fallbacks and hedging."""
+
+    def test_retries_server_errors(self, monkeypatch):
+        """Test 1: A transient 5xx is retried on the same model"""
+        monkeypatch.setattr("llm_resilience.retry_delay", lambda retry: 0)
+        model, calls = flaky(2, 503)
+        resilient = ResilientChatModel([("primary", model)], max_retries=2)
+
+        assert resilient.invoke("hi") == "ok"
+        assert len(calls) == 3
+
+    def test_falls_back_to_next_model(self, monkeypatch):
+        """Test 2: A non-retryable error moves straight on to the fallback model"""
+        monkeypatch.setattr("llm_resilience.retry_delay", lambda retry: 0)
+        primary, primary_calls = flaky(10, 400)
+        fallback, _ = flaky(0, 400, reply="from fallback")
+        resilient = ResilientChatModel([("primary", primary), ("fallback", fallback)], max_retries=2)
+
+        assert resilient.invoke("hi") == "from fallback"
+        assert len(primary_calls) == 1
+
+    def test_gives_up_with_last_error(self, monkeypatch):
+        """Test 3: The last error is raised once every attempt has failed"""
+        monkeypatch.setattr("llm_resilience.retry_delay", lambda retry: 0)
+        model, calls = flaky(10, 500)
+        resilient = ResilientChatModel([("primary", model)], max_retries=1)
+
+        with pytest.raises(ProviderError):
+            resilient.invoke("hi")
+        assert len(calls) == 2
+
+    def test_hedged_request_wins(self):
+        """Test 4: A slow first request is overtaken by the hedged one"""
+        calls = []
+
+        async def answer(_):
+            calls.append(1)
+            await asyncio.sleep(1.0 if len(calls) == 1 else 0.01)
+            return f"attempt {len(calls)}"
+
+        resilient = ResilientChatModel([("primary", RunnableLambda(answer))], hedge_after=0.05)
+        started = time.monotonic()
+        assert asyncio.run(resilient.ainvoke("hi")) == "attempt 2"
+        assert time.monotonic() - started < 0.5
@@ -0,0 +1,81 @@
+import threading
+import time
+import pytest
+from llm_scheduler import BACKGROUND, INTERACTIVE, LLMBusyError, LLMScheduler, check_admission
+
+class TestLLMScheduler:
+    """Test suite for LLM admission control."""
+
+    def test_rejects_when_rate_limit_exhausted(self):
+        """Test 1: A call that cannot get a request token in time is rejected"""
+        scheduler = LLMScheduler(rpm=1, tpm=0, max_concurrency=4, max_waiting=4)
+        with scheduler.slot(INTERACTIVE, 10, timeout=0.1):
+            pass
+
+        with pytest.raises(LLMBusyError):
+            scheduler.acquire(INTERACTIVE, 10, timeout=0.1)
+        assert scheduler.stats()["rejected"] == 1
+        assert not scheduler.would_admit(INTERACTIVE, timeout=1)
+
+    def test_interactive_goes_before_background(self):
+        """Test 2: A waiting chat turn is admitted before waiting background work"""
+        scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1, max_waiting=4)
+        scheduler.acquire(INTERACTIVE, 10, timeout=1)
+        order = []
+
+        def run(priority):
+            with scheduler.slot(priority, 10, timeout=5):
+                order.append(priority)
+
+        background = threading.Thread(target=run, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=run, args=(INTERACTIVE,))
+        interactive.start()
+        time.sleep(0.05)
+        scheduler.release(10)
+        background.join()
+        interactive.join()
+
+        assert order == [INTERACTIVE, BACKGROUND]
+
+    def test_full_queue_rejects_immediately(self):
+        """Test 3: Calls beyond the waiting cap are turned away without waiting"""
+        scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1, max_waiting=0)
+        scheduler.acquire(INTERACTIVE, 10, timeout=1)
+
+        started = time.monotonic()
+        with pytest.raises(LLMBusyError):
+            scheduler.acquire(BACKGROUND, 10, timeout=5)
+        assert time.monotonic() - started < 1
+
+    def test_check_admission_counts_rejection(self, monkeypatch):
+        """Test 4: A request turned away up front raises LLMBusyError and is counted as rejected"""
+        scheduler = LLMScheduler(rpm=1, tpm=0, max_concurrency=4, max_waiting=4)
+        monkeypatch.setattr("llm_scheduler.llm_scheduler", scheduler)
+        check_admission()
+        with scheduler.slot(INTERACTIVE, 10, timeout=0.1):
+            pass
+
+        with pytest.raises(LLMBusyError):
+            check_admission()
+        assert scheduler.stats()["rejected"] == 1
+
+    def test_rate_limit_pause_is_capped_for_chat(self):
+        """Test 5: After a 429, chat turns wait at most interactive_max_pause while background work waits it out"""
+        scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=4, max_waiting=4, interactive_max_pause=0.1)
+        scheduler.backoff(30)
+
+        assert scheduler.would_admit(INTERACTIVE, timeout=0.5)
+        assert not scheduler.would_admit(BACKGROUND, timeout=5)
+        scheduler.acquire(INTERACTIVE, 10, timeout=0.5)
+        with pytest.raises(LLMBusyError):
+            scheduler.acquire(BACKGROUND, 10, timeout=0.1)
+
+    def test_full_queue_still_admits_calls_that_go_straight_through(self):
+        """Test 6: would_admit only turns a call away for a full queue when it would have to wait"""
+        scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1, max_waiting=0)
+        assert scheduler.would_admit(INTERACTIVE, timeout=1)
+
+        scheduler.acquire(INTERACTIVE, 10, timeout=1)
+        assert not scheduler.would_admit(INTERACTIVE, timeout=1)
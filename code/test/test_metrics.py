@@ -0,0 +1,22 @@
+from http import HTTPStatus
+
+class TestMetricsAPI:
+    """Test suite for the Prometheus /metrics endpoint."""
+
+    def test_metrics_format(self, client):
+        """Test 1: Metrics are served in Prometheus text format"""
+        response = client.get('/metrics')
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.mimetype == "text/plain"
+        body = response.get_data(as_text=True)
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert "# TYPE chat_stage_duration_seconds histogram" in body
+
+    def test_metrics_count_requests(self, client):
+        """Test 2: Finished requests are counted per route and status"""
+        client.get('/health')
+        response = client.get('/metrics')
+
+        body = response.get_data(as_text=True)
+        assert 'http_requests_total{route="/health",method="GET",status="200"}' in body
@@ -0,0 +1,75 @@
+import threading
+import uuid
+from http import HTTPStatus
+import psycopg
+import pytest
+from config import get_database_url
+from db import get_pool
+from session_guard import (
+    IdempotencyKeyReusedError, SessionBusyError, idempotency_store, session_lock,
+)
+
+class TestSessionGuard:
+    """Test suite for per-session serialization and idempotency keys."""
+
+    def test_same_session_waits_for_running_turn(self):
+        """Test 1: A second turn for a busy session times out with SessionBusyError"""
+        session_id = str(uuid.uuid4())
+        holding, release = threading.Event(), threading.Event()
+
+        def hold():
+            with session_lock(session_id):
+                holding.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        holding.wait(5)
+        try:
+            with pytest.raises(SessionBusyError):
+                with session_lock(session_id, timeout=0.1):
+                    pass
+            # Other sessions are not affected
+            with session_lock(str(uuid.uuid4()), timeout=0.1):
+                pass
+        finally:
+            release.set()
+            thread.join()
+
+    def test_advisory_lock_across_processes(self, monkeypatch):
+        """Test 2: In postgres mode the turn and other workers exclude each other, and no pooled connection is held"""
+        monkeypatch.setattr("session_guard.SESSION_LOCK", "postgres")
+        session_id = str(uuid.uuid4())
+        lock_query = "SELECT pg_try_advisory_lock(hashtextextended(%s, 0))"
+        with psycopg.connect(get_database_url(), autocommit=True) as other_worker:
+            other_worker.execute("SELECT pg_advisory_lock(hashtextextended(%s, 0))", (session_id,))
+            with pytest.raises(SessionBusyError):
+                with session_lock(session_id, timeout=0.2):
+                    pass
+            other_worker.execute("SELECT pg_advisory_unlock(hashtextextended(%s, 0))", (session_id,))
+
+            pool_stats = get_pool().get_stats()
+            with session_lock(session_id, timeout=0.2):
+                assert other_worker.execute(lock_query, (session_id,)).fetchone()[0] is False
+                assert get_pool().get_stats()["pool_available"] == pool_stats["pool_available"]
+            # Released when the turn ends
+            assert other_worker.execute(lock_query, (session_id,)).fetchone()[0] is True
+
+    def test_idempotency_store_replays_reply(self):
+        """Test 3: A stored reply is returned for the same key and message only"""
+        session_id, key = str(uuid.uuid4()), str(uuid.uuid4())
+        assert idempotency_store.lookup(session_id, key, "Hello", "sales") is None
+
+        idempotency_store.save(session_id, key, "Hello", "sales", "Hi there!")
+
+        assert idempotency_store.lookup(session_id, key, "Hello", "sales") == "Hi there!"
+        with pytest.raises(IdempotencyKeyReusedError):
+            idempotency_store.lookup(session_id, key, "Something else", "sales")
+
+    def test_chat_rejects_invalid_idempotency_key(self, client):
+        """Test 4: Chat - an over-long Idempotency-Key is rejected before any LLM call"""
+        response = client.post('/chat', json={'input': 'Hello', 'session_id': str(uuid.uuid4())},
+                               headers={'Idempotency-Key': 'k' * 300})
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.get_json()["success"] is False
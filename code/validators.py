@@ -1,5 +1,6 @@
 from http import HTTPStatus
-from config import max_input_length, agent_type , status_type
+from datetime import datetime
+from config import max_input_length, agent_type , status_type, export_format, history_page_max_limit, leads_page_default_limit, leads_page_max_limit, idempotency_key_max_length, leads_bulk_max_items, lead_stats_bucket
 import uuid
 
 def validate_input(input, request_type):
@@ -41,6 +42,25 @@ def validate_session_id(session_id):
         print(f"[Error] {e}")
         return {"is_valid":False, "message":"Internal Server Error", "status":HTTPStatus.INTERNAL_SERVER_ERROR}
     
+def validate_chat_request(data):
+    """
+    Validate a /chat or /chat/stream body: session_id first, then input and request_type.
+    On success the message is the normalized request_type.
+    """
+    session_result = validate_session_id(data.get('session_id'))
+    if not session_result["is_valid"]:
+        return session_result
+    result = validate_input(data.get('input', ''), data.get('request_type'))
+    return dict(result, status=HTTPStatus.OK if result["is_valid"] else HTTPStatus.BAD_REQUEST)
+
+def validate_idempotency_key(key):
+    """Optional Idempotency-Key: a non-empty string of limited length."""
+    if key is None:
+        return {"is_valid":True, "message":None, "status":HTTPStatus.OK}
+    if not isinstance(key, str) or not key.strip() or len(key) > idempotency_key_max_length:
+        return {"is_valid":False, "message":f"Idempotency-Key must be 1-{idempotency_key_max_length} characters", "status":HTTPStatus.BAD_REQUEST}
+    return {"is_valid":True, "message":key.strip(), "status":HTTPStatus.OK}
+
 def validate_update_data(update_data, session_id, status):
     """Validate status and remarks """
     try:
@@ -52,4 +72,134 @@ def validate_update_data(update_data, session_id, status):
 
     except Exception as e:
         print(f"[Error] {e}")
-        return {"is_valid":False, "message":"Internal Server Error", "status":HTTPStatus.INTERNAL_SERVER_ERROR}
\ No newline at end of file
+        return {"is_valid":False, "message":"Internal Server Error", "status":HTTPStatus.INTERNAL_SERVER_ERROR}
+
+def validate_bulk_update(data):
+    """
+    Validate a /chat-info/bulk body ({"updates": [...]}) item by item, using the
+    validate_update_data rules. Returns the valid (index, item) pairs and an error per invalid index.
+    """
+    updates = data.get("updates") if isinstance(data, dict) else None
+    if not isinstance(updates, list) or not updates:
+        return {"is_valid":False, "message":"updates must be a non-empty list", "status":HTTPStatus.BAD_REQUEST}
+    if len(updates) > leads_bulk_max_items:
+        return {"is_valid":False, "message":f"updates cannot contain more than {leads_bulk_max_items} items", "status":HTTPStatus.BAD_REQUEST}
+
+    valid, errors = [], {}
+    for index, item in enumerate(updates):
+        if not isinstance(item, dict):
+            errors[index] = "Each update must be an object"
+            continue
+        result = validate_update_data(item, item.get("session_id"), item.get("status"))
+        if not result["is_valid"]:
+            errors[index] = result["message"]
+        elif not isinstance(item["session_id"], str) or not isinstance(item.get("remarks", ""), (str, type(None))):
+            errors[index] = "session_id and remarks must be strings"
+        else:
+            valid.append((index, item))
+    return {"is_valid":True, "message":{"updates":valid, "errors":errors}, "status":HTTPStatus.OK}
+
+def _parse_positive_int(value):
+    """Parse a query-string value as a positive int, or return None."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+def validate_history_params(args):
+    """Validate /history pagination params (limit, before, after, since) and return them as ints."""
+    params = {}
+    for name in ("limit", "before", "after", "since"):
+        value = args.get(name)
+        if value is None:
+            params[name] = None
+            continue
+        number = _parse_positive_int(value)
+        if number is None:
+            return {"is_valid":False, "message":f"{name} must be a positive integer", "status":HTTPStatus.BAD_REQUEST}
+        params[name] = number
+
+    if sum(params[name] is not None for name in ("before", "after", "since")) > 1:
+        return {"is_valid":False, "message":"Use only one of before, after or since", "status":HTTPStatus.BAD_REQUEST}
+    if params["limit"] is not None and params["limit"] > history_page_max_limit:
+        return {"is_valid":False, "message":f"limit cannot exceed {history_page_max_limit}", "status":HTTPStatus.BAD_REQUEST}
+    return {"is_valid":True, "message":params, "status":HTTPStatus.OK}
+
+def _parse_datetime(value):
+    """Parse an ISO 8601 date or datetime, or return None."""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def validate_leads_query(args):
+    """Validate /leads paging params and filters; returns them normalized."""
+    params = {"limit": leads_page_default_limit, "cursor": args.get("cursor") or None, "filters": {}}
+    filters = params["filters"]
+
+    if args.get("limit") is not None:
+        limit = _parse_positive_int(args.get("limit"))
+        if limit is None or limit > leads_page_max_limit:
+            return {"is_valid":False, "message":f"limit must be between 1 and {leads_page_max_limit}", "status":HTTPStatus.BAD_REQUEST}
+        params["limit"] = limit
+
+    status = args.get("status")
+    if status:
+        status = status.strip().upper()
+        if status not in [s.value for s in status_type]:
+            return {"is_valid":False, "message":"Status not allowed", "status":HTTPStatus.BAD_REQUEST}
+        filters["status"] = status
+
+    request_type = args.get("request_type")
+    if request_type:
+        try:
+            filters["request_type"] = agent_type(request_type.strip().lower()).value
+        except ValueError:
+            return {"is_valid":False, "message":"request_type not allowed", "status":HTTPStatus.BAD_REQUEST}
+
+    if args.get("country"):
+        filters["country"] = args.get("country").strip()
+
+    for name in ("created_from", "created_to"):
+        if args.get(name):
+            value = _parse_datetime(args.get(name))
+            if value is None:
+                return {"is_valid":False, "message":f"{name} must be an ISO 8601 date", "status":HTTPStatus.BAD_REQUEST}
+            filters[name] = value
+
+    has_contact = args.get("has_contact")
+    if has_contact is not None:
+        if has_contact.lower() not in ("true", "false"):
+            return {"is_valid":False, "message":"has_contact must be true or false", "status":HTTPStatus.BAD_REQUEST}
+        filters["has_contact"] = has_contact.lower() == "true"
+
+    return {"is_valid":True, "message":params, "status":HTTPStatus.OK}
+
+# Dimensions /leads/stats can break its totals down by
+STATS_GROUP_BY = ("status", "request_type", "country")
+
+def validate_stats_query(args):
+    """Validate /leads/stats: the /leads filters plus bucket (day, week, month) and group_by."""
+    result = validate_leads_query(args)
+    if not result["is_valid"]:
+        return result
+    try:
+        bucket = lead_stats_bucket((args.get("bucket") or lead_stats_bucket.DAY.value).strip().lower()).value
+    except ValueError:
+        return {"is_valid":False, "message":"bucket must be day, week or month", "status":HTTPStatus.BAD_REQUEST}
+    group_by = (args.get("group_by") or "").strip().lower() or None
+    if group_by is not None and group_by not in STATS_GROUP_BY:
+        return {"is_valid":False, "message":f"group_by must be one of {', '.join(STATS_GROUP_BY)}", "status":HTTPStatus.BAD_REQUEST}
+    return {"is_valid":True, "message":{"filters":result["message"]["filters"], "bucket":bucket, "group_by":group_by}, "status":HTTPStatus.OK}
+
+def validate_export_query(args):
+    """Validate /leads/export: the /leads filters plus the file format (csv or ndjson)."""
+    result = validate_leads_query(args)
+    if not result["is_valid"]:
+        return result
+    try:
+        file_format = export_format((args.get("format") or export_format.CSV.value).strip().lower()).value
+    except ValueError:
+        return {"is_valid":False, "message":"format must be csv or ndjson", "status":HTTPStatus.BAD_REQUEST}
+    return {"is_valid":True, "message":{"filters": result["message"]["filters"], "format": file_format}, "status":HTTPStatus.OK}
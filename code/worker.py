@@ -0,0 +1,36 @@
+# Standalone extraction worker for EXTRACTION_BACKEND=postgres:
+#   python worker.py --workers 4
+# Run as many processes, on as many hosts, as needed; they share the job table.
+import argparse
+import signal
+import threading
+from config import EXTRACTION_WORKERS, get_db_name
+from conversation_processor.conversation_processor import process_conversation
+from conversation_processor.job_queue import PostgresJobQueue
+from db import close_pool
+from llm_registry import llm_registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process queued contact-info extraction jobs.")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS, help="job threads in this process")
+    args = parser.parse_args(argv)
+
+    get_db_name()
+    llm_registry.warm_up()
+    queue = PostgresJobQueue(process_conversation, workers=args.workers)
+
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    queue.start()
+    stopped.wait()
+    print("[JOBS] Stopping, waiting for running jobs...")
+    queue.shutdown()
+    llm_registry.close()
+    close_pool()
+
+
+if __name__ == "__main__":
+    main()
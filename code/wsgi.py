@@ -0,0 +1,6 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# The app is preloaded once in the master; gunicorn.conf.py re-creates the
+# per-process state (DB pool, LLM clients, extraction workers) after each fork.
+from app import create_app
+
+app = create_app(start_workers=False)
@@ -21,11 +21,48 @@ pip install -r requirements.txt
 echo "Generating .env file using Python script..."
 python3 get_env.py
 
+echo "Applying database migrations..."
+python3 migrate.py
+
 echo "Restarting service..."
-pkill -f flask || true
+pkill -f "flask run" || true  # older deploys used the development server
 cd /home/vivek/Ai-agent-boilerplate/ai-agent-boilerplate/code
-export FLASK_APP=app.py
-nohup flask run --host=0.0.0.0 --port=5000 > flask.log 2>&1 &
+PIDFILE=gunicorn.pid
+# Only trust a pidfile PID that is a live gunicorn process: after a reboot the
+# file can be stale and its PID reused by something else
+is_gunicorn() {
+  [ -n "$1" ] && kill -0 "$1" 2>/dev/null && ps -o args= -p "$1" | grep -q gunicorn
+}
+OLD_PID=$(cat "$PIDFILE" 2>/dev/null || true)
+if is_gunicorn "$OLD_PID"; then
+  # Graceful restart: USR2 starts a new master on the new code, then the
+  # old master stops taking connections and finishes in-flight requests
+  kill -USR2 "$OLD_PID"
+  NEW_PID=""
+  for i in $(seq 1 30); do
+    PID=$(cat "$PIDFILE" 2>/dev/null || true)
+    if [ "$PID" != "$OLD_PID" ] && is_gunicorn "$PID"; then
+      NEW_PID=$PID
+      break
+    fi
+    sleep 1
+  done
+  # A new master that fails to boot its workers exits shortly after writing the pidfile
+  sleep 2
+  if [ -z "$NEW_PID" ] || ! is_gunicorn "$NEW_PID"; then
+    echo "New gunicorn master did not start; old master $OLD_PID is still serving (see gunicorn.log)" >&2
+    exit 1
+  fi
+  kill -TERM "$OLD_PID"
+else
+  rm -f "$PIDFILE"
+  nohup gunicorn -c gunicorn.conf.py wsgi:app > gunicorn.log 2>&1 &
+fi
 
+# Durable extraction queue: restart the job worker (it finishes running jobs on TERM)
+pkill -TERM -f "python3 worker.py" || true
+if grep -q "^EXTRACTION_BACKEND=postgres" .env; then
+  nohup python3 worker.py > worker.log 2>&1 &
+fi
 
 echo "✅ Deployment complete!"